@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+import numpy as np
+
+from server.training_type import TrainingType
+from .simulated_clients import SimulatedClients
+
+MODELS = {'mnist': TrainingType.MNIST, 'chest': TrainingType.CHEST_X_RAY_PNEUMONIA}
+# Every simulated client shares host and port, so the per-host limit of the dispatcher must be disabled
+SERVER_CONFIG = {'DISPATCHER_CONNECTIONS_LIMIT': 0, 'DISPATCHER_CONNECTIONS_LIMIT_PER_HOST': 0, 'CHECKPOINT_PATH': None,
+                 'EVALUATION_PATH': None}
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+
+# Runs the central node in a subprocess (flask run), so its peak RSS can be measured on its own
+class SubprocessServer:
+    def __init__(self, port):
+        self.port = port
+        self.url = 'http://127.0.0.1:{}'.format(port)
+        self.process = None
+
+    def start(self):
+        environment = dict(os.environ, FLASK_APP='server:create_app({})'.format(SERVER_CONFIG))
+        self.process = subprocess.Popen([sys.executable, '-m', 'flask', 'run', '--port', str(self.port)],
+                                        cwd=REPOSITORY_PATH, env=environment,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    # Peak resident set size in MB, read from /proc (Linux only)
+    def get_peak_rss(self):
+        try:
+            with open('/proc/{}/status'.format(self.process.pid)) as status_file:
+                for line in status_file:
+                    if line.startswith('VmHWM:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+# Runs the central node in this process with the werkzeug server. Its peak RSS includes the simulated clients
+class InProcessServer:
+    def __init__(self, port):
+        self.port = port
+        self.url = 'http://127.0.0.1:{}'.format(port)
+        self.http_server = None
+
+    def start(self):
+        from werkzeug.serving import make_server
+        from server import create_app
+        self.http_server = make_server('127.0.0.1', self.port, create_app(SERVER_CONFIG), threaded=True)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+
+    def get_peak_rss(self):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def stop(self):
+        self.http_server.shutdown()
+
+
+def get_free_port():
+    with socket.socket() as free_socket:
+        free_socket.bind(('127.0.0.1', 0))
+        return free_socket.getsockname()[1]
+
+
+async def wait_for_server(session, server_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(server_url + '/') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError('Central node not ready at ' + server_url)
+
+
+async def run_benchmark(server, clients_count, training_type, rounds, binary, train_time, round_timeout):
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        await wait_for_server(session, server.url)
+        simulated_clients = SimulatedClients(server.url, clients_count, port=get_free_port(), binary=binary, train_time=train_time)
+        await simulated_clients.start()
+        try:
+            await simulated_clients.register()
+            round_latencies = []
+            errors = 0
+            start = time.perf_counter()
+            for round in range(1, rounds + 1):
+                simulated_round = simulated_clients.start_round(round)
+                round_start = time.perf_counter()
+                async with session.post(server.url + '/training', json={'training_type': training_type}) as response:
+                    await response.read()
+                await asyncio.wait_for(simulated_round.done.wait(), round_timeout)
+                round_latencies.append(time.perf_counter() - round_start)
+                errors += simulated_round.errors
+            total_time = time.perf_counter() - start
+            await simulated_clients.unregister()
+        finally:
+            await simulated_clients.stop()
+
+    return {
+        'clients': clients_count,
+        'rounds': rounds,
+        'rounds_per_second': rounds / total_time,
+        'p50_latency': float(np.percentile(round_latencies, 50)),
+        'p99_latency': float(np.percentile(round_latencies, 99)),
+        'peak_rss': server.get_peak_rss(),
+        'bytes_down': simulated_clients.bytes_received,
+        'bytes_up': simulated_clients.bytes_sent,
+        'upload_errors': errors
+    }
+
+
+def print_results(results):
+    print('{:>8} {:>7} {:>10} {:>10} {:>10} {:>12} {:>14} {:>14} {:>7}'.format(
+        'clients', 'rounds', 'rounds/s', 'p50 (s)', 'p99 (s)', 'peak RSS MB', 'bytes down', 'bytes up', 'errors'))
+    for result in results:
+        peak_rss = '{:.1f}'.format(result['peak_rss']) if result['peak_rss'] is not None else '-'
+        print('{:>8} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>12} {:>14} {:>14} {:>7}'.format(
+            result['clients'], result['rounds'], result['rounds_per_second'], result['p50_latency'], result['p99_latency'],
+            peak_rss, result['bytes_down'], result['bytes_up'], result['upload_errors']))
+    sys.stdout.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of the central node with N simulated clients')
+    parser.add_argument('--clients', type=int, nargs='+', default=[10, 100, 1000], help='Number of simulated clients of every run')
+    parser.add_argument('--model', choices=sorted(MODELS), default='mnist', help='Shapes of the model params exchanged')
+    parser.add_argument('--rounds', type=int, default=10, help='Training rounds of every run')
+    parser.add_argument('--json', action='store_true', help='Use the JSON wire format instead of binary tensors')
+    parser.add_argument('--train-time', type=float, default=0., help='Seconds every simulated client waits before uploading')
+    parser.add_argument('--round-timeout', type=float, default=600., help='Seconds to wait for all the uploads of a round')
+    parser.add_argument('--in-process', action='store_true', help='Run the central node in this process instead of a subprocess')
+    arguments = parser.parse_args()
+
+    results = []
+    for clients_count in arguments.clients:
+        port = get_free_port()
+        server = InProcessServer(port) if arguments.in_process else SubprocessServer(port)
+        server.start()
+        try:
+            print('Running', arguments.rounds, 'rounds with', clients_count, 'simulated clients...')
+            sys.stdout.flush()
+            results.append(asyncio.run(run_benchmark(server, clients_count, MODELS[arguments.model], arguments.rounds,
+                                                     not arguments.json, arguments.train_time, arguments.round_timeout)))
+        finally:
+            server.stop()
+    print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import aiohttp
+import numpy as np
+from aiohttp import web
+
+from server.tensor_codec import BINARY_CONTENT_TYPE, decode, encode, to_json_params
+from server.training_type import TrainingType
+
+# Shapes of the Keras weights of the CHEST X-RAY CNN, used when the central node has no model params yet
+CHEST_X_RAY_SHAPES = [(3, 3, 3, 32), (32,), (3, 3, 32, 64), (64,), (56 * 56 * 64, 2), (2,)]
+
+
+class SimulatedRound:
+    def __init__(self, round, expected_uploads):
+        self.round = round
+        self.expected_uploads = expected_uploads
+        self.uploads = 0
+        self.errors = 0
+        self.done = asyncio.Event()
+
+    def add_upload(self, succeeded):
+        self.uploads += 1
+        if not succeeded:
+            self.errors += 1
+        if self.uploads >= self.expected_uploads:
+            self.done.set()
+
+
+# Lightweight clients that speak the real protocol of the client nodes (/client, /training and /model_params),
+# without training anything: they send back the model params they received, or synthetic ones.
+# All of them are served by a single aiohttp app, every client has its own path prefix
+class SimulatedClients:
+    def __init__(self, server_url, clients_count, host='127.0.0.1', port=6000, binary=True, train_time=0., upload_concurrency=100):
+        self.server_url = server_url
+        self.clients_count = clients_count
+        self.host = host
+        self.port = port
+        self.binary = binary
+        self.train_time = train_time
+        self.upload_concurrency = upload_concurrency
+        self.session = None
+        self.runner = None
+        self.current_round = None
+        self.upload_tasks = set()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.chest_x_ray_params = None
+
+    def get_client_url(self, client_index):
+        return 'http://{}:{}/clients/{}'.format(self.host, self.port, client_index)
+
+    async def start(self):
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_post('/clients/{client_index}/training', self.__training)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.upload_concurrency))
+
+    async def stop(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def register(self):
+        await asyncio.gather(*[self.__request_client(aiohttp.hdrs.METH_POST, client_index)
+                               for client_index in range(self.clients_count)])
+
+    async def unregister(self):
+        await asyncio.gather(*[self.__request_client(aiohttp.hdrs.METH_DELETE, client_index)
+                               for client_index in range(self.clients_count)])
+
+    def start_round(self, round):
+        self.current_round = SimulatedRound(round, self.clients_count)
+        return self.current_round
+
+    async def __request_client(self, method, client_index):
+        data = {'client_url': self.get_client_url(client_index)}
+        if self.binary:
+            data['accept'] = BINARY_CONTENT_TYPE
+        async with self.session.request(method, self.server_url + '/client', data=data) as response:
+            if response.status not in (200, 201):
+                raise RuntimeError('Cannot register simulated client ' + data['client_url'] + ', status ' + str(response.status))
+
+    async def __training(self, request):
+        body = await request.read()
+        self.bytes_received += len(body)
+        if request.content_type == BINARY_CONTENT_TYPE:
+            request_data = decode(bytearray(body))
+        else:
+            request_data = json.loads(body)
+        client_url = self.get_client_url(request.match_info['client_index'])
+        upload_task = asyncio.ensure_future(self.__upload(client_url, request_data))
+        self.upload_tasks.add(upload_task)
+        upload_task.add_done_callback(self.upload_tasks.discard)
+        return web.json_response({'status': 'QUEUED'}, status=202)
+
+    async def __upload(self, client_url, request_data):
+        if self.train_time > 0:
+            await asyncio.sleep(self.train_time)
+        training_type = request_data['training_type']
+        upload_body = {'client_url': client_url, 'training_type': training_type, 'round': request_data['round']}
+        if training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
+            upload_body['weights'] = self.__get_chest_x_ray_params(request_data)
+        else:
+            upload_body['weights'] = np.asarray(request_data['weights'], dtype=np.float32)
+            upload_body['bias'] = np.asarray(request_data['bias'], dtype=np.float32)
+
+        if self.binary:
+            data = encode(upload_body)
+            headers = {'Content-Type': BINARY_CONTENT_TYPE}
+        else:
+            data = json.dumps(to_json_params(upload_body)).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+        self.bytes_sent += len(data)
+        succeeded = False
+        try:
+            async with self.session.put(self.server_url + '/model_params', data=data, headers=headers) as response:
+                await response.read()
+                succeeded = response.status == 200
+        except aiohttp.ClientError as e:
+            print('Upload from', client_url, 'failed:', repr(e))
+        if self.current_round is not None and self.current_round.round == request_data['round']:
+            self.current_round.add_upload(succeeded)
+
+    def __get_chest_x_ray_params(self, request_data):
+        if 'weights' in request_data:
+            return [np.asarray(weights, dtype=np.float32) for weights in request_data['weights']]
+        if self.chest_x_ray_params is None:
+            self.chest_x_ray_params = [np.random.randn(*shape).astype(np.float32) * 0.01 for shape in CHEST_X_RAY_SHAPES]
+        return self.chest_x_ray_params
@@ -1,13 +1,21 @@
 import os
 import signal
+import threading
 
 from flask import Flask, request, Response, jsonify
 from os import environ
 
 from .client import Client
+from .compression_config import CompressionConfig
+from .config import TRAINING_WORKERS, TRAINING_QUEUE_SIZE, TRAINING_PROCESS_POOL, TRAINING_PRELOAD
 from .federated_learning_config import FederatedLearningConfig
-from .utils import request_params_to_model_params, model_params_to_request_params
-from .training_type import TrainingType
+from .metrics import metrics
+from .model_trainers import preload_model_trainers
+from .tensor_codec import BINARY_CONTENT_TYPE, decode, read_into_buffer
+from .utils import request_params_to_model_params
+from .training_job import TrainingJob
+from .training_job_queue import TrainingJobQueue
+from .training_process_pool import TrainingProcessPool
 
 CLIENT_URL = environ.get('CLIENT_URL')
 if CLIENT_URL is None:
@@ -16,7 +24,21 @@ if CLIENT_URL is None:
     os.kill(os.getpid(), signal.SIGINT)
 
 app = Flask(__name__)
-client = Client(CLIENT_URL)
+training_process_pool = None
+if TRAINING_PROCESS_POOL:
+    training_process_pool = TrainingProcessPool(TRAINING_WORKERS, TRAINING_PRELOAD)
+elif len(TRAINING_PRELOAD) > 0:
+    # The trainers are loaded in the background, the client starts answering requests right away
+    threading.Thread(target=preload_model_trainers, args=(TRAINING_PRELOAD,), name='trainers-preload', daemon=True).start()
+client = Client(CLIENT_URL, training_process_pool)
+training_job_queue = TrainingJobQueue(TRAINING_WORKERS, TRAINING_QUEUE_SIZE)
+
+
+# Request bodies can be JSON or binary tensors, depending on the content type sent by the caller
+def get_request_data():
+    if request.mimetype == BINARY_CONTENT_TYPE:
+        return decode(read_into_buffer(request.stream, request.content_length))
+    return request.json
 
 
 @app.route('/')
@@ -26,28 +48,96 @@ def index():
 
 @app.route('/training', methods=['POST'])
 def training():
-    training_type = request.json['training_type']
+    request_data = get_request_data()
+    training_type = request_data['training_type']
     print('Request POST /training for training type:', training_type)
-    federated_learning_config = FederatedLearningConfig(request.json['learning_rate'],
-                                                        request.json['epochs'],
-                                                        request.json['batch_size'])
-    model_params = request_params_to_model_params(training_type, request.json)
-    client_id = request.json['client_id']
-    round = request.json['round']
-    round_size = request.json['round_size']
-    clients = request.json.get('clients', None)
-    client.do_training(training_type, model_params, federated_learning_config, client_id, round, round_size, clients)
-    return Response(status=200)
+    federated_learning_config = FederatedLearningConfig(request_data['learning_rate'],
+                                                        request_data['epochs'],
+                                                        request_data['batch_size'],
+                                                        request_data.get('proximal_mu', 0.))
+    # The model params are inline, or downloaded by the training job from the descriptor of the model blob
+    model_descriptor = request_data.get('model')
+    model_params = None
+    if model_descriptor is None:
+        model_params = request_params_to_model_params(training_type, request_data)
+    client_id = request_data['client_id']
+    round = request_data['round']
+    # Position of the client among the participants of the round, sent with the size of the round
+    client_rank = request_data.get('client_rank', None)
+    round_size = request_data.get('round_size', None)
+    clients = request_data.get('clients', None)
+    upload_compression_config = None
+    if 'upload_compression' in request_data:
+        upload_compression_config = CompressionConfig.from_dict(request_data['upload_compression'])
+    # Model params are sent back to the central node with the same wire format it used
+    binary_wire_format = request.mimetype == BINARY_CONTENT_TYPE
+
+    # Training runs in the background, the central node gets an answer right away
+    # If the job fails it's reported to the central node, so the round doesn't wait for this client
+    def run(training_job):
+        try:
+            round_model_params = model_params
+            if model_descriptor is not None:
+                round_model_params = request_params_to_model_params(training_type, client.downloader.download(model_descriptor))
+            client.do_training(training_type, round_model_params, federated_learning_config, client_id, round, client_rank,
+                               round_size, clients, binary_wire_format, training_job, upload_compression_config)
+        except Exception:
+            client.report_training_error(training_type, round)
+            raise
+
+    training_job = TrainingJob(training_type, federated_learning_config.epochs, run)
+    if not training_job_queue.submit(training_job):
+        print('Training queue is full, rejecting training request')
+        return Response(status=503)
+    print('Training job', training_job.job_id, 'queued')
+    response = jsonify(training_job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = '/training/' + training_job.job_id
+    return response
+
+
+@app.route('/training/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    training_job = training_job_queue.get(job_id)
+    if training_job is None:
+        return 'Training job not found', 404
+    return jsonify(training_job.to_dict())
+
+
+# If-None-Match has a list of ETags separated by commas, every one is compared exactly with the ETag of the model
+# params, weak ETags included (weak comparison)
+def matches_etag(if_none_match, etag):
+    for request_etag in if_none_match.split(','):
+        request_etag = request_etag.strip()
+        if request_etag.startswith('W/'):
+            request_etag = request_etag[2:]
+        if request_etag == '*' or request_etag == etag:
+            return True
+    return False
 
 
 @app.route('/model_params', methods=['GET'])
 def get_model_params():
-    model_params = model_params_to_request_params(TrainingType.GOSSIP_MNIST, client.model_params)
-    response = jsonify({'model_params': model_params})
-    response.status_code = 200
+    # Peers only download the model params if they changed since the last time, and weight them
+    # by the number of samples they were trained with
+    model_snapshot = client.model_snapshot
+    if matches_etag(request.headers.get('If-None-Match', ''), model_snapshot.etag):
+        response = Response(status=304)
+    elif BINARY_CONTENT_TYPE in request.headers.get('Accept', ''):
+        response = Response(model_snapshot.binary_model_params, status=200, mimetype=BINARY_CONTENT_TYPE)
+    else:
+        response = jsonify({'model_params': model_snapshot.get_json_model_params(), 'samples': model_snapshot.samples_count})
+        response.status_code = 200
+    response.headers['ETag'] = model_snapshot.etag
     return response
 
 
+@app.route('/metrics')
+def get_metrics():
+    metrics.set('training_jobs_queued', training_job_queue.qsize(), description='Training jobs waiting in the queue')
+    return Response(metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(404)
 def page_not_found(error):
     return 'This page does not exist', 404
@@ -0,0 +1,81 @@
+import glob
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+from tensorflow.keras.preprocessing.image import load_img
+
+from .config import GLOBAL_TMP_PATH, GLOBAL_DATASETS
+
+CLASSES = ['PNEUMONIA', 'NORMAL']
+# Split name used by the trainer and folder of the split in the global dataset
+SPLITS = {'train': 'train', 'valid': 'test'}
+IMAGE_SIZE = (224, 224)
+IMAGES_FILE = 'images.npy'
+INDEX_FILE = 'index.json'
+
+_dataset_cache = None
+_dataset_cache_lock = threading.Lock()
+
+
+# Process-wide cache of the Chest X-Ray dataset. Every image is decoded and resized once into a single
+# uint8 array of shape (N, 224, 224, 3) stored as a .npy file, which is memory-mapped on later runs.
+# The index keeps, for every split and class, the range of rows of its images sorted by file name
+class ChestXRayDatasetCache:
+    def __init__(self, dataset_path, cache_path):
+        self.cache_path = cache_path
+        if not os.path.isfile(os.path.join(cache_path, IMAGES_FILE)) or not os.path.isfile(os.path.join(cache_path, INDEX_FILE)):
+            self.__build(dataset_path)
+        self.images = np.load(os.path.join(cache_path, IMAGES_FILE), mmap_mode='r')
+        with open(os.path.join(cache_path, INDEX_FILE)) as index_file:
+            self.index = json.load(index_file)
+        print('CHEST X-RAY IMAGES cache loaded from', self.cache_path, 'with', len(self.images), 'images')
+        sys.stdout.flush()
+
+    def size(self, split, a_class):
+        start, end = self.index[split + '/' + a_class]
+        return end - start
+
+    # Returns a copy of the images at the given positions of a split and class
+    def get_images(self, split, a_class, indices):
+        start, end = self.index[split + '/' + a_class]
+        rows = np.asarray(indices, dtype=np.int64) + start
+        return np.take(self.images, rows, axis=0)
+
+    def __build(self, dataset_path):
+        print('Building CHEST X-RAY IMAGES cache at', self.cache_path, ', this is done only once...')
+        sys.stdout.flush()
+        os.makedirs(self.cache_path, exist_ok=True)
+        index = {}
+        image_paths = []
+        for split, split_folder in SPLITS.items():
+            for a_class in CLASSES:
+                class_paths = sorted(glob.glob(os.path.join(dataset_path, split_folder, a_class, '*')))
+                index[split + '/' + a_class] = [len(image_paths), len(image_paths) + len(class_paths)]
+                image_paths.extend(class_paths)
+
+        # Written to temporary files first, so other processes never see a half written cache
+        temp_images_file = os.path.join(self.cache_path, IMAGES_FILE + '.tmp')
+        images = np.lib.format.open_memmap(temp_images_file, mode='w+', dtype=np.uint8,
+                                           shape=(len(image_paths), IMAGE_SIZE[0], IMAGE_SIZE[1], 3))
+        for i, image_path in enumerate(image_paths):
+            images[i] = np.asarray(load_img(image_path, target_size=IMAGE_SIZE), dtype=np.uint8)
+        images.flush()
+        del images
+        os.replace(temp_images_file, os.path.join(self.cache_path, IMAGES_FILE))
+        temp_index_file = os.path.join(self.cache_path, INDEX_FILE + '.tmp')
+        with open(temp_index_file, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(temp_index_file, os.path.join(self.cache_path, INDEX_FILE))
+
+
+def get_chest_x_ray_dataset_cache():
+    global _dataset_cache
+    with _dataset_cache_lock:
+        if _dataset_cache is None:
+            current_directory = os.path.dirname(os.path.realpath(__file__))
+            cache_path = current_directory + GLOBAL_TMP_PATH + '/chest_xray_cache'
+            _dataset_cache = ChestXRayDatasetCache(GLOBAL_DATASETS + '/chest_xray', cache_path)
+        return _dataset_cache
@@ -1,15 +1,26 @@
-import glob
-import os
 import random
-import shutil
-import tempfile
+import threading
+import time
 
-from .config import GLOBAL_TMP_PATH, GLOBAL_DATASETS
+import numpy as np
+import tensorflow as tf
 from tensorflow import keras
+from tensorflow.keras.callbacks import LambdaCallback
 from tensorflow.keras.layers import Dense, Flatten, Conv2D, MaxPool2D
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.optimizers import Adam
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+from .chest_x_ray_dataset_cache import CLASSES, get_chest_x_ray_dataset_cache
+from .metrics import metrics
+
+# Images of every class sampled for training and validation on every round
+TRAIN_SAMPLES_SIZE = 100
+VALID_SAMPLES_SIZE = 50
+
+# The model is built and compiled only once per process, every round just sets its weights
+_model = None
+_initial_weights = None
+_model_lock = threading.Lock()
 
 
 class ChestXRayModelTrainer:
@@ -17,90 +28,111 @@ class ChestXRayModelTrainer:
         print('Initializing ChestXRayModelTrainer...')
         self.client_config = client_config
         self.model_params = model_params
-        self.temp_folder = None
-        current_directory = os.path.dirname(os.path.realpath(__file__))
-        self.chest_x_ray_temp_folder = current_directory + GLOBAL_TMP_PATH + '/chest_xray/'
+        # Number of training samples, reported to the central node to weight the model params
+        self.samples_count = None
+        # Called after every epoch with the epoch number and its accuracy, used to report training progress
+        self.epoch_callback = None
 
     def train_model(self):
-        model = Sequential([
-            Conv2D(filters=32, kernel_size=(3, 3), activation='relu', padding='same', input_shape=(224, 224, 3)),
-            MaxPool2D(pool_size=(2, 2), strides=2),
-            Conv2D(filters=64, kernel_size=(3, 3), activation='relu', padding='same'),
-            MaxPool2D(pool_size=(2, 2), strides=2),
-            Flatten(),
-            Dense(units=2, activation='softmax')
-        ])
-        model.summary()
-
-        model.compile(optimizer=Adam(learning_rate=self.client_config.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'])
-        if self.model_params is not None:
-            print('Using model weights from central node')
-            model.set_weights(self.model_params)
-        else:
-            print('Using default model weights')
-
-        self.__create_temp_dataset_folder()
-        train_batches, valid_batches = self.__load_datasets()
-
-        model.fit(x=train_batches,
-                  steps_per_epoch=10,
-                  epochs=self.client_config.epochs,
-                  validation_data=valid_batches,
-                  validation_steps=5,
-                  verbose=2)
-
-        self.__clean_temp_dataset_folder()
-        return model.get_weights()
+        with _model_lock:
+            model = self.__get_model()
+            if self.model_params is not None:
+                print('Using model weights from central node')
+                model.set_weights(self.model_params)
+            else:
+                print('Using default model weights')
+                model.set_weights(_initial_weights)
+            self.__reset_optimizer(model)
+
+            with metrics.time('dataset_load_seconds', description='Time to load the training and validation datasets',
+                              model='CHEST_X_RAY'):
+                train_batches, valid_batches = self.__load_datasets()
+
+            # Keras validates at the end of every epoch, so the epoch time includes training and validation
+            epoch_start_times = {}
+            callbacks = [LambdaCallback(
+                on_epoch_begin=lambda epoch, logs: epoch_start_times.update({epoch: time.perf_counter()}),
+                on_epoch_end=lambda epoch, logs: metrics.observe('train_epoch_seconds', time.perf_counter() - epoch_start_times[epoch],
+                                                                 description='Time to train an epoch', model='CHEST_X_RAY'))]
+            if self.epoch_callback is not None:
+                callbacks.append(LambdaCallback(on_epoch_end=lambda epoch, logs: self.epoch_callback(epoch + 1, logs.get('val_accuracy'))))
+            if self.client_config.proximal_mu > 0:
+                callbacks.append(self.__get_proximal_callback(model))
+
+            model.fit(x=train_batches,
+                      steps_per_epoch=10,
+                      epochs=self.client_config.epochs,
+                      validation_data=valid_batches,
+                      validation_steps=5,
+                      callbacks=callbacks,
+                      verbose=2)
+
+            return model.get_weights()
+
+    # FedProx: after every batch the weights take a gradient step of the proximal term mu / 2 * ||w - w_round||^2,
+    # so the compiled model and its loss don't change
+    def __get_proximal_callback(self, model):
+        global_variables = [tf.constant(variable) for variable in model.trainable_variables]
+        proximal_rate = self.client_config.learning_rate * self.client_config.proximal_mu
+
+        def proximal_step(batch, logs):
+            for variable, global_variable in zip(model.trainable_variables, global_variables):
+                variable.assign_sub(proximal_rate * (variable - global_variable))
+
+        return LambdaCallback(on_train_batch_end=proximal_step)
+
+    def __get_model(self):
+        global _model, _initial_weights
+        if _model is None:
+            _model = Sequential([
+                Conv2D(filters=32, kernel_size=(3, 3), activation='relu', padding='same', input_shape=(224, 224, 3)),
+                MaxPool2D(pool_size=(2, 2), strides=2),
+                Conv2D(filters=64, kernel_size=(3, 3), activation='relu', padding='same'),
+                MaxPool2D(pool_size=(2, 2), strides=2),
+                Flatten(),
+                Dense(units=2, activation='softmax')
+            ])
+            _model.summary()
+            _model.compile(optimizer=Adam(learning_rate=self.client_config.learning_rate), loss='categorical_crossentropy', metrics=['accuracy'])
+            _initial_weights = _model.get_weights()
+        return _model
+
+    # Every round starts with a fresh optimizer state and the learning rate requested by the central node,
+    # as it did when the model was compiled on every round
+    def __reset_optimizer(self, model):
+        optimizer_variables = model.optimizer.variables
+        if callable(optimizer_variables):
+            optimizer_variables = optimizer_variables()
+        for optimizer_variable in optimizer_variables:
+            optimizer_variable.assign(tf.zeros_like(optimizer_variable))
+        model.optimizer.learning_rate.assign(self.client_config.learning_rate)
 
     def __load_datasets(self):
         print('Loading CHEST X-RAY IMAGES dataset...')
-        global_dataset_train_path = GLOBAL_DATASETS + '/chest_xray/train'
-        global_dataset_valid_path = GLOBAL_DATASETS + '/chest_xray/test'
-
-        training_dataset_train_path = self.temp_folder.name + "/train"
-        training_dataset_valid_path = self.temp_folder.name + "/val"
-
-        os.makedirs(training_dataset_train_path + '/NORMAL')
-        os.makedirs(training_dataset_train_path + '/PNEUMONIA')
-        os.makedirs(training_dataset_valid_path + '/NORMAL')
-        os.makedirs(training_dataset_valid_path + '/PNEUMONIA')
-
-        self.__build_training_dataset(global_dataset_train_path, training_dataset_train_path, ['NORMAL', 'PNEUMONIA'], 100)
-        self.__build_training_dataset(global_dataset_valid_path, training_dataset_valid_path, ['NORMAL', 'PNEUMONIA'], 50)
-
-        image_data_generator = ImageDataGenerator(preprocessing_function=keras.applications.vgg16.preprocess_input)
-
-        train_batches = image_data_generator.flow_from_directory(
-            directory=training_dataset_train_path, target_size=(224, 224), classes=['PNEUMONIA', 'NORMAL'],
-            batch_size=self.client_config.batch_size)
-
-        valid_batches = image_data_generator.flow_from_directory(
-            directory=training_dataset_valid_path, target_size=(224, 224), classes=['PNEUMONIA', 'NORMAL'],
-            batch_size=self.client_config.batch_size)
-
+        dataset_cache = get_chest_x_ray_dataset_cache()
+        train_batches = self.__build_dataset(dataset_cache, 'train', TRAIN_SAMPLES_SIZE)
+        valid_batches = self.__build_dataset(dataset_cache, 'valid', VALID_SAMPLES_SIZE)
+        self.samples_count = TRAIN_SAMPLES_SIZE * len(CLASSES)
         return train_batches, valid_batches
 
-    def __create_temp_dataset_folder(self):
-        if os.path.isdir(self.chest_x_ray_temp_folder) is False:
-            print('Temporary dataset folder', self.chest_x_ray_temp_folder, 'doesn\'t exist, creating it')
-            os.mkdir(self.chest_x_ray_temp_folder)
-
-        self.temp_folder = tempfile.TemporaryDirectory(dir=self.chest_x_ray_temp_folder)
-        print('Temporary folder for training:', self.temp_folder.name)
-
-    def __clean_temp_dataset_folder(self):
-        print('Deleting content of temporary folder', self.temp_folder.name)
-        self.temp_folder.cleanup()
-        if os.path.isdir(self.chest_x_ray_temp_folder):
-            path, dirs, files = next(os.walk(self.chest_x_ray_temp_folder))
-            if len(dirs) == 0:
-                print('Deleting temporary dataset folder', self.chest_x_ray_temp_folder)
-                os.rmdir(self.chest_x_ray_temp_folder)
-
-    def __build_training_dataset(self, global_dataset_path, training_dataset_path, classes, samples_size, pattern='*'):
-        for a_class in classes:
-            for random_file in random.sample(glob.glob(global_dataset_path + '/' + a_class + '/' + pattern), samples_size):
-                shutil.copy(random_file, training_dataset_path + '/' + a_class)
-
+    # Samples random images of every class from the cache, and feeds them through a prefetched tf.data pipeline
+    def __build_dataset(self, dataset_cache, split, samples_size):
+        images = []
+        labels = []
+        for class_index, a_class in enumerate(CLASSES):
+            indices = sorted(random.sample(range(dataset_cache.size(split, a_class)), samples_size))
+            images.append(dataset_cache.get_images(split, a_class, indices))
+            labels.append(np.full(samples_size, class_index))
+        images = np.concatenate(images)
+        labels = keras.utils.to_categorical(np.concatenate(labels), len(CLASSES))
+
+        dataset = tf.data.Dataset.from_tensor_slices((images, labels))
+        return dataset.shuffle(len(images)) \
+            .map(self.__preprocess, num_parallel_calls=tf.data.AUTOTUNE) \
+            .batch(self.client_config.batch_size) \
+            .repeat() \
+            .prefetch(tf.data.AUTOTUNE)
+
+    def __preprocess(self, image, label):
+        return keras.applications.vgg16.preprocess_input(tf.cast(image, tf.float32)), label
 
-chestXRayModelTrainer = ChestXRayModelTrainer(None, None)
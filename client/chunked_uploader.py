@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import sys
+import time
+
+import requests
+
+from requests.exceptions import RequestException
+
+from .metrics import metrics
+
+
+# Sends model params to the central node in chunks. The upload is addressed by the SHA-256 of the payload, so if
+# a request fails the upload is resumed from the offset the central node already has, instead of sending
+# everything again, and an upload that was already applied is never applied twice
+class ChunkedUploader:
+    def __init__(self, server_url, chunk_size=4 * 1024 * 1024, retries=5, retry_backoff=1., timeout=60):
+        self.server_url = server_url
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    # Returns the HTTP status of the update of the model params, or None if the central node couldn't be reached.
+    # The central node limits the size of the upload by the model of the training type
+    def upload(self, client_url, training_type, payload, content_type):
+        upload_id = hashlib.sha256(payload).hexdigest()
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                print('Resuming upload', upload_id, ', attempt', attempt)
+            try:
+                status = self.__upload(client_url, training_type, upload_id, payload, content_type)
+                if status is not None:
+                    return status
+            except RequestException as e:
+                print('Error uploading model params:', repr(e))
+            sys.stdout.flush()
+        return None
+
+    # Returns None if the upload has to be resumed
+    def __upload(self, client_url, training_type, upload_id, payload, content_type):
+        response = self.session.post(self.server_url + '/model_params/uploads',
+                                     json={'client_url': client_url, 'training_type': training_type, 'upload_id': upload_id,
+                                           'size': len(payload), 'content_type': content_type},
+                                     timeout=self.timeout)
+        if response.status_code != 200:
+            return None if response.status_code >= 500 else response.status_code
+        upload = response.json()
+        if upload['status'] is not None:
+            return upload['status']
+        offset = upload['offset']
+        if offset > 0:
+            print('The central node already has', offset, 'bytes of', len(payload))
+
+        view = memoryview(payload)
+        while True:
+            end = min(offset + self.chunk_size, len(payload))
+            chunk = bytes(view[offset:end])
+            response = self.session.put(self.server_url + '/model_params/uploads/' + upload_id, data=chunk,
+                                        headers={'Content-Type': 'application/octet-stream',
+                                                 'Content-Range': 'bytes {}-{}/{}'.format(offset, end - 1, len(payload)),
+                                                 'Digest': 'sha-256=' + base64.b64encode(hashlib.sha256(chunk).digest()).decode()},
+                                        timeout=self.timeout)
+            metrics.increment('upload_chunks_total', description='Chunks of model params sent to the central node')
+            if response.status_code == 202:
+                offset = response.json()['offset']
+            elif response.status_code == 404 or response.status_code == 409 or response.status_code >= 500:
+                return None
+            else:
+                return response.status_code
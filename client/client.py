@@ -1,79 +1,126 @@
+import json
 import sys
+import threading
+import time
 import requests
-import torch
+
+import numpy as np
 
 from os import environ
 
-from requests.exceptions import Timeout
+from requests.exceptions import RequestException, Timeout
 
-from .deterministic_mnist_model_trainer import DeterministicMnistModelTrainer
-from .utils import model_params_to_request_params
-from .mnist_model_trainer import MnistModelTrainer
-from .chest_x_ray_model_trainer import ChestXRayModelTrainer
-from .gossip_mnist_model_trainer import GossipMnistModelTrainer
+from .chunked_uploader import ChunkedUploader
+from .model_downloader import ModelDownloader
+from .model_params_compression import compress, get_compressed_nbytes, get_uncompressed_nbytes
+from .metrics import metrics
+from .tensor_codec import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE, encode, to_json_params
+from .utils import model_params_to_arrays, request_params_to_array_list
+from .model_snapshot import ModelSnapshot
+from .model_specs import get_model_spec
+from .model_trainers import get_model_trainer_class, train_model
 from .client_status import ClientStatus
-from .config import DEFAULT_SERVER_URL
+from .config import DEFAULT_SERVER_URL, HEARTBEAT_INTERVAL, MODEL_CACHE_SIZE, DOWNLOAD_RETRIES, DOWNLOAD_TIMEOUT, \
+    UPLOAD_CHUNK_SIZE, UPLOAD_RETRIES, UPLOAD_RETRY_BACKOFF, UPLOAD_TIMEOUT
 from .training_type import TrainingType
 
 
 class Client:
-    def __init__(self, client_url):
+    def __init__(self, client_url, training_process_pool=None):
         self.client_url = client_url
+        # Trainings run in the worker processes of the pool if there's one, otherwise in the thread of the training job
+        self.training_process_pool = training_process_pool
         self.status = ClientStatus.IDLE
+        self.status_lock = threading.Lock()
         self.training_type = None
         self.model_params = self.__get_initial_params()
+        # Snapshot of the model params stored on the client served to the gossip peers, versioned by round
+        self.model_snapshot = ModelSnapshot(self.model_params, 1, 0)
+        # Error feedback of the compression of model params, per training type
+        self.compression_residuals = {}
         self.SERVER_URL = environ.get('SERVER_URL')
         if self.SERVER_URL is None:
             print('Warning: SERVER_URL environment variable is not defined, using DEFAULT_SERVER_URL:', DEFAULT_SERVER_URL)
             self.SERVER_URL = DEFAULT_SERVER_URL
         else:
             print('Central node URL:', self.SERVER_URL)
+        self.downloader = ModelDownloader(self.SERVER_URL, MODEL_CACHE_SIZE, DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT)
+        self.uploader = ChunkedUploader(self.SERVER_URL, UPLOAD_CHUNK_SIZE, UPLOAD_RETRIES, UPLOAD_RETRY_BACKOFF, UPLOAD_TIMEOUT)
 
         if self.client_url is None:
             print('Error: client_url is missing, cannot create a client')
             return
         self.register()
+        self.heartbeat_thread = threading.Thread(target=self.__send_heartbeats, name='heartbeats', daemon=True)
+        self.heartbeat_thread.start()
 
+    # Model params stored on the client for gossip training
     def __get_initial_params(self):
-        weights = torch.randn((28 * 28, 1), dtype=torch.float, requires_grad=True)
-        bias = torch.randn(1, dtype=torch.float, requires_grad=True)
-        return weights, bias
+        return get_model_spec(TrainingType.GOSSIP_MNIST).init_params()
 
-    def do_training(self, training_type, model_params, federated_learning_config, client_id, round, round_size, clients):
-        if self.can_do_training():
+    def do_training(self, training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size,
+                    clients, binary_wire_format=False, training_job=None, upload_compression_config=None):
+        # Several training jobs can run at the same time, only one of them gets to train.
+        # The rest fail, so their job is marked as failed and the central node is told not to wait for them
+        with self.status_lock:
+            if not self.can_do_training():
+                raise RuntimeError('Training requested but client status is ' + self.status)
+            # Fails before changing the status of the client if the training type is not supported
+            get_model_trainer_class(training_type)
+            self.status = ClientStatus.TRAINING
+        try:
             self.training_type = training_type
-
-            if self.training_type == TrainingType.MNIST:
-                client_model_trainer = MnistModelTrainer(model_params, federated_learning_config)
-            elif self.training_type == TrainingType.DETERMINISTIC_MNIST:
-                client_model_trainer = DeterministicMnistModelTrainer(model_params, federated_learning_config, client_id, round, round_size)
-            elif self.training_type == TrainingType.GOSSIP_MNIST:
+            if self.training_type == TrainingType.GOSSIP_MNIST:
                 # Using model params stored on the client
-                client_model_trainer = GossipMnistModelTrainer(self.model_params, federated_learning_config, client_id, round, round_size, clients)
-            elif self.training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
-                client_model_trainer = ChestXRayModelTrainer(model_params, federated_learning_config)
-            else:
-                raise ValueError('Unsupported training type', training_type)
+                model_params = self.model_params
+            epoch_callback = training_job.update_progress if training_job is not None else None
+
+            # The trainers update the model params in place, so the base for the delta is copied before training
+            base_arrays = None
+            if upload_compression_config is not None and upload_compression_config.delta and model_params is not None:
+                base_arrays = [np.array(array, dtype=np.float32)
+                               for array in request_params_to_array_list(training_type, model_params_to_arrays(training_type, model_params))]
 
-            self.status = ClientStatus.TRAINING
             print('Training started...')
-            try:
-                model_params_updated = client_model_trainer.train_model()
-
-                if self.training_type == TrainingType.GOSSIP_MNIST:
-                    self.model_params = model_params_updated
-                    self.finish_round()
-                else:
-                    model_params_updated = model_params_to_request_params(training_type, model_params_updated)
-                    self.update_model_params_on_server(model_params_updated)
-            except Exception as e:
-                raise e
-            finally:
-                self.status = ClientStatus.IDLE
-                print('Training finished...')
-        else:
-            print('Training requested but client status is', self.status)
-        sys.stdout.flush()
+            if self.training_process_pool is not None:
+                model_params_updated, samples_count = self.training_process_pool.train_model(
+                    training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size, clients,
+                    epoch_callback)
+            else:
+                model_params_updated, samples_count = train_model(training_type, model_params, federated_learning_config,
+                                                                  client_id, round, client_rank, round_size, clients,
+                                                                  epoch_callback)
+
+            if self.training_type == TrainingType.GOSSIP_MNIST:
+                self.model_params = model_params_updated
+                self.model_snapshot = ModelSnapshot(self.model_params, samples_count, round)
+                self.finish_round()
+            else:
+                with metrics.time('serialization_seconds', description='Time to serialize the model params sent to the central node',
+                                  stage='prepare'):
+                    model_params_updated = model_params_to_arrays(training_type, model_params_updated)
+                    if upload_compression_config is not None and upload_compression_config.is_enabled():
+                        model_params_updated = self.__compress_model_params(training_type, model_params_updated, base_arrays,
+                                                                            upload_compression_config)
+                    if not binary_wire_format:
+                        model_params_updated = to_json_params(model_params_updated)
+                self.update_model_params_on_server(model_params_updated, round, binary_wire_format, samples_count)
+        finally:
+            self.status = ClientStatus.IDLE
+            print('Training finished...')
+            sys.stdout.flush()
+
+    def __compress_model_params(self, training_type, request_params, base_arrays, compression_config):
+        arrays = request_params_to_array_list(training_type, request_params)
+        residuals = self.compression_residuals.get(training_type)
+        if residuals is None or [residual.shape for residual in residuals] != [np.shape(array) for array in arrays]:
+            residuals = [np.zeros(np.shape(array), dtype=np.float32) for array in arrays]
+        compressed_params, self.compression_residuals[training_type] = compress(arrays, compression_config, base_arrays, residuals)
+        uncompressed_nbytes = get_uncompressed_nbytes(compressed_params)
+        compressed_nbytes = get_compressed_nbytes(compressed_params)
+        print('Model params compressed from', uncompressed_nbytes, 'to', compressed_nbytes, 'bytes, saved',
+              uncompressed_nbytes - compressed_nbytes, 'bytes')
+        return compressed_params
 
     def finish_round(self):
         request_url = self.SERVER_URL + '/finish_round'
@@ -87,18 +134,44 @@ class Client:
             print('Finish round request sent for client', self.client_url)
         sys.stdout.flush()
 
-    def update_model_params_on_server(self, model_params):
-        request_url = self.SERVER_URL + '/model_params'
+    # Tells the central node that the training of a round failed, so the round doesn't wait for the model params
+    def report_training_error(self, training_type, round):
+        request_url = self.SERVER_URL + '/client/training_error'
+        request_body = {'client_url': self.client_url, 'training_type': training_type, 'round': round}
+        try:
+            response = requests.post(request_url, json=request_body, timeout=UPLOAD_TIMEOUT)
+            if response.status_code != 200:
+                print('Error reporting the training error of round', round, '. Error:', response.reason)
+        except RequestException as e:
+            print('Error reporting the training error of round', round, ':', repr(e))
+        sys.stdout.flush()
+
+    def update_model_params_on_server(self, model_params, round, binary_wire_format=False, samples_count=None):
         request_body = model_params
         request_body['client_url'] = self.client_url
         request_body['training_type'] = self.training_type
+        # The central node uses the round to detect model params that arrive after their round was closed
+        request_body['round'] = round
+        # The central node weights the model params of every client by its number of training samples
+        if samples_count is not None:
+            request_body['samples'] = samples_count
         print('Sending calculated model weights to central node')
-        response = requests.put(request_url, json=request_body)
-        print('Response received from updating central model params:', response)
-        if response.status_code != 200:
-            print('Error updating central model params. Error:', response.reason)
-        else:
-            print('Model params updated on central successfully')
+        with metrics.time('serialization_seconds', stage='encode'):
+            if binary_wire_format:
+                request_data = encode(request_body)
+                content_type = BINARY_CONTENT_TYPE
+            else:
+                request_data = json.dumps(request_body).encode('utf-8')
+                content_type = JSON_CONTENT_TYPE
+        metrics.increment('upload_bytes_total', len(request_data), description='Bytes of model params sent to the central node')
+        with metrics.time('upload_seconds', description='Time to send the model params to the central node'):
+            status = self.uploader.upload(self.client_url, self.training_type, request_data, content_type)
+        print('Response received from updating central model params:', status)
+        sys.stdout.flush()
+        # The training job fails, so the central node is told not to wait for the model params of this client
+        if status != 200:
+            raise RuntimeError('Error updating central model params. Status: ' + str(status))
+        print('Model params updated on central successfully')
         sys.stdout.flush()
 
     def can_do_training(self):
@@ -109,7 +182,9 @@ class Client:
         request_url = self.SERVER_URL + '/client'
         try:
             print('Doing request', request_url)
-            response = requests.post(request_url, data={'client_url': self.client_url}, timeout=5)
+            # The central node sends the descriptor of the model in the training requests, and the client downloads it
+            response = requests.post(request_url, data={'client_url': self.client_url, 'accept': BINARY_CONTENT_TYPE,
+                                                        'download_models': 'true'}, timeout=5)
             print('Response received from registration:', response)
             if response.status_code != 201:
                 print('Cannot register client in the system at', request_url, 'error:', response.reason)
@@ -118,3 +193,16 @@ class Client:
         except Timeout:
             print('Cannot register client in the central node, the central node is not responding')
         sys.stdout.flush()
+
+    # The central node evicts the clients that stop sending heartbeats, and answers 404 to the ones it doesn't know
+    def __send_heartbeats(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                response = requests.post(self.SERVER_URL + '/client/heartbeat', data={'client_url': self.client_url}, timeout=5)
+                if response.status_code == 404:
+                    print('Client is not registered in the central node anymore')
+                    self.register()
+            except RequestException as e:
+                print('Cannot send heartbeat to the central node:', repr(e))
+                sys.stdout.flush()
@@ -2,3 +2,22 @@
 DEFAULT_SERVER_URL = 'http://127.0.0.1:5000'
 GLOBAL_TMP_PATH = '/tmp'
 GLOBAL_DATASETS = '../datasets'
+TRAINING_WORKERS = 1
+TRAINING_QUEUE_SIZE = 4
+MNIST_FUSED_EPOCHS = False
+GOSSIP_FAN_OUT = 4
+GOSSIP_TOPOLOGY = 'k-regular'
+TRAINING_PROCESS_POOL = False
+TRAINING_PRELOAD = []
+PARTITION_STRATEGY = 'sequential'
+PARTITION_SHARD_SIZE = 25
+PARTITION_ALPHA = 0.5
+PARTITION_SEED = 0
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+UPLOAD_RETRIES = 5
+UPLOAD_RETRY_BACKOFF = 1.
+UPLOAD_TIMEOUT = 60
+HEARTBEAT_INTERVAL = 10
+MODEL_CACHE_SIZE = 2
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
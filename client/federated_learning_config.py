@@ -1,11 +1,14 @@
 class FederatedLearningConfig:
-    def __init__(self, learning_rate=1, epochs=10, batch_size=5):
+    def __init__(self, learning_rate=1, epochs=10, batch_size=5, proximal_mu=0.):
         self.learning_rate = learning_rate
         self.epochs = epochs
         self.batch_size = batch_size
+        # Weight of the proximal term of FedProx, it keeps the local model close to the model of the round
+        self.proximal_mu = proximal_mu
 
     def __str__(self):
-        return "Federated Learning config:\n--Learning Rate: {}\n--Epochs: {}\n--Batch size: {}\n".format(
+        return "Federated Learning config:\n--Learning Rate: {}\n--Epochs: {}\n--Batch size: {}\n--Proximal mu: {}\n".format(
             self.learning_rate,
             self.epochs,
-            self.batch_size)
+            self.batch_size,
+            self.proximal_mu)
@@ -0,0 +1,131 @@
+import asyncio
+import atexit
+import random
+import sys
+import threading
+
+import aiohttp
+
+from .config import GOSSIP_FAN_OUT, GOSSIP_TOPOLOGY
+from .tensor_codec import BINARY_CONTENT_TYPE, decode
+from .training_type import TrainingType
+from .utils import request_params_to_model_params
+
+TOPOLOGIES = ['random', 'ring', 'k-regular']
+
+_gossip_engine = None
+_gossip_engine_lock = threading.Lock()
+
+
+# Pulls the model params of the gossip peers of a client. Peers are selected with a topology of degree fan_out,
+# so the gossip traffic of every client doesn't grow with the size of the network. The requests are sent from
+# a long-lived event loop with a pooled session, and they are conditional: the last snapshot received from
+# every peer is kept with its ETag, and the peer answers 304 Not Modified if it hasn't changed since
+class GossipEngine:
+    def __init__(self, fan_out=4, topology='k-regular'):
+        if topology not in TOPOLOGIES:
+            raise ValueError('Unsupported gossip topology', topology)
+        self.fan_out = fan_out
+        self.topology = topology
+        # ETag, model params and training samples of the last snapshot received from every peer
+        self.peer_snapshots = {}
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.__run_loop, name='gossip-engine', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # Every client builds the same graph from the list of clients and the round, so the selection is symmetric:
+    # ring links every client to its closest clients by id, k-regular does the same over a permutation of
+    # the clients that changes every round, and random picks fan_out peers independently on every client
+    def select_peers(self, client_id, round, clients):
+        peers = sorted(clients, key=lambda peer: peer['client_id'])
+        peers_without_self = [peer for peer in peers if peer['client_id'] != client_id]
+        if len(peers_without_self) <= self.fan_out:
+            return peers_without_self
+        positions = [position for position, peer in enumerate(peers) if peer['client_id'] == client_id]
+        if self.topology == 'random' or len(positions) == 0:
+            return random.sample(peers_without_self, self.fan_out)
+        if self.topology == 'k-regular':
+            random.Random(round).shuffle(peers)
+            positions = [position for position, peer in enumerate(peers) if peer['client_id'] == client_id]
+
+        position = positions[0]
+        distances = []
+        for distance in range(1, self.fan_out // 2 + 1):
+            distances.extend([distance, -distance])
+        # The opposite client is only a symmetric link with an even number of clients. With an odd number of clients
+        # no graph gives every client an odd number of peers, so they get one peer less than an odd fan_out
+        if self.fan_out % 2 == 1 and len(peers) % 2 == 0:
+            distances.append(len(peers) // 2)
+        selected_peers = {}
+        for distance in distances:
+            peer = peers[(position + distance) % len(peers)]
+            selected_peers[peer['client_id']] = peer
+        return list(selected_peers.values())
+
+    # Returns the model params and the training samples of the peers that answered
+    def pull(self, peers):
+        peer_model_params = asyncio.run_coroutine_threadsafe(self.__pull(peers), self.loop).result()
+        sys.stdout.flush()
+        return [model_params for model_params in peer_model_params if model_params is not None]
+
+    async def __pull(self, peers):
+        return await asyncio.gather(*[self.__pull_peer(peer) for peer in peers])
+
+    async def __pull_peer(self, peer):
+        peer_url = peer['client_url']
+        headers = {'Accept': BINARY_CONTENT_TYPE}
+        peer_snapshot = self.peer_snapshots.get(peer_url)
+        if peer_snapshot is not None:
+            headers['If-None-Match'] = peer_snapshot[0]
+        try:
+            async with self.__get_session().get(peer_url + '/model_params', headers=headers) as response:
+                if response.status == 304 and peer_snapshot is not None:
+                    print('Model params of', peer_url, 'not modified, using cached snapshot')
+                    return peer_snapshot[1], peer_snapshot[2]
+                if response.status != 200:
+                    print('Error requesting model params to peer', peer_url)
+                    return None
+                if response.content_type == BINARY_CONTENT_TYPE:
+                    request_data = decode(bytearray(await response.read()))
+                    samples_count = request_data.get('samples', 1)
+                else:
+                    data = await response.json()
+                    request_data = data['model_params']
+                    samples_count = data.get('samples', 1)
+                print('Model params received from', peer_url)
+                model_params = request_params_to_model_params(TrainingType.GOSSIP_MNIST, request_data)
+                etag = response.headers.get('ETag')
+                if etag is not None:
+                    self.peer_snapshots[peer_url] = etag, model_params, samples_count
+                return model_params, samples_count
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print('Error connecting to peer', peer_url, ':', repr(e))
+            return None
+
+    def __get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        return self.session
+
+    async def __close_session(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def close(self):
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(self.__close_session(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def get_gossip_engine():
+    global _gossip_engine
+    with _gossip_engine_lock:
+        if _gossip_engine is None:
+            _gossip_engine = GossipEngine(GOSSIP_FAN_OUT, GOSSIP_TOPOLOGY)
+        return _gossip_engine
@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+SPLITS = ['train', 'valid']
+DIGITS = ['3', '7']
+CACHE_FOLDER = 'cache'
+IMAGES_FILE = 'images.npy'
+INDEX_FILE = 'index.json'
+
+_dataset_cache = None
+_dataset_cache_lock = threading.Lock()
+
+
+# Process-wide cache of MNIST_SAMPLE. All the images are decoded once into a single contiguous uint8 array
+# stored as a .npy file, which is memory-mapped on later runs. The index keeps, for every split and digit,
+# the range of rows of its images sorted by file name
+class MnistDatasetCache:
+    def __init__(self, path):
+        self.cache_path = path / CACHE_FOLDER
+        if not (self.cache_path / IMAGES_FILE).exists() or not (self.cache_path / INDEX_FILE).exists():
+            self.__build(path)
+        self.images = np.load(str(self.cache_path / IMAGES_FILE), mmap_mode='r')
+        with open(str(self.cache_path / INDEX_FILE)) as index_file:
+            self.index = json.load(index_file)
+        print('MNIST_SAMPLE cache loaded from', self.cache_path, 'with', len(self.images), 'images')
+        sys.stdout.flush()
+
+    def size(self, split, digit):
+        start, end = self.index[split + '/' + digit]
+        return end - start
+
+    # Returns the images at the given positions of a split and digit, as a float tensor with values in [0, 1]
+    def get_tensors(self, split, digit, indices):
+        start, end = self.index[split + '/' + digit]
+        rows = np.asarray(indices, dtype=np.int64) + start
+        return torch.from_numpy(np.take(self.images, rows, axis=0)).float() / 255
+
+    def __build(self, path):
+        print('Building MNIST_SAMPLE cache at', self.cache_path)
+        os.makedirs(str(self.cache_path), exist_ok=True)
+        index = {}
+        image_paths = []
+        for split in SPLITS:
+            for digit in DIGITS:
+                digit_paths = (path / split / digit).ls().sorted()
+                index[split + '/' + digit] = [len(image_paths), len(image_paths) + len(digit_paths)]
+                image_paths.extend(digit_paths)
+
+        images = np.empty((len(image_paths), 28, 28), dtype=np.uint8)
+        for i, image_path in enumerate(image_paths):
+            images[i] = np.asarray(Image.open(image_path))
+
+        # Written to temporary files first, so other processes never see a half written cache
+        temp_images_file = str(self.cache_path / (IMAGES_FILE + '.tmp'))
+        with open(temp_images_file, 'wb') as images_file:
+            np.save(images_file, images)
+        os.replace(temp_images_file, str(self.cache_path / IMAGES_FILE))
+        temp_index_file = str(self.cache_path / (INDEX_FILE + '.tmp'))
+        with open(temp_index_file, 'w') as index_file:
+            json.dump(index, index_file)
+        os.replace(temp_index_file, str(self.cache_path / INDEX_FILE))
+
+
+def get_mnist_dataset_cache():
+    global _dataset_cache
+    with _dataset_cache_lock:
+        if _dataset_cache is None:
+            # fastai is only needed to download the dataset, and it's slow to import
+            from fastai.data.external import untar_data, URLs
+            _dataset_cache = MnistDatasetCache(untar_data(URLs.MNIST_SAMPLE))
+        return _dataset_cache
@@ -1,5 +1,11 @@
-from fastai.vision.all import *
+import random
+import sys
 
+import torch
+
+from .config import MNIST_FUSED_EPOCHS
+from .metrics import metrics
+from .mnist_dataset_cache import get_mnist_dataset_cache
 from .training_utils import mnist_loss, linear_model
 
 
@@ -7,32 +13,82 @@ class MnistModelTrainer:
     def __init__(self, model_params, client_config):
         print('Initializing MnistModelTrainer...')
         self.ACCURACY_THRESHOLD = 0.5
-        self.training_dataloader = None
-        self.validation_dataloader = None
+        self.train_images = None
+        self.train_labels = None
+        self.valid_images = None
+        self.valid_labels = None
         self.client_config = client_config
         self.model_params = model_params
+        # Number of training samples, reported to the central node to weight the model params
+        self.samples_count = None
+        # Model params of the round, used by the proximal term of FedProx
+        self.global_model_params = None
+        # Called after every epoch with the epoch number and its accuracy, used to report training progress
+        self.epoch_callback = None
 
     def train_model(self):
-        training_dataset, validation_dataset = self.__load_datasets()
-        self.training_dataloader = DataLoader(training_dataset, batch_size=self.client_config.batch_size)
-        self.validation_dataloader = DataLoader(validation_dataset, batch_size=self.client_config.batch_size)
-        for epoch in range(self.client_config.epochs):
-            self.__train_epoch()
-            print('Accuracy of model trained at epoch', epoch + 1, ':', self.__validate_epoch(), end='\n', flush=True)
+        with metrics.time('dataset_load_seconds', description='Time to load the training and validation datasets', model='MNIST'):
+            self.train_images, self.train_labels, self.valid_images, self.valid_labels = self.__load_datasets()
+        self.samples_count = len(self.train_images)
+        if self.client_config.proximal_mu > 0:
+            self.global_model_params = [model_param.detach().clone() for model_param in self.model_params]
+        if MNIST_FUSED_EPOCHS:
+            with metrics.time('train_fused_epochs_seconds', description='Time to run all the fused training epochs', model='MNIST'):
+                self.__train_fused_epochs()
+            self.__report_accuracy(self.client_config.epochs)
+        else:
+            for epoch in range(self.client_config.epochs):
+                with metrics.time('train_epoch_seconds', description='Time to train an epoch', model='MNIST'):
+                    self.__train_epoch()
+                self.__report_accuracy(epoch + 1)
         return self.model_params
 
+    # Runs all the epochs in a single loop without autograd. The gradients of mnist_loss for the linear model
+    # are computed in closed form, and the model is validated only once at the end
+    def __train_fused_epochs(self):
+        weights, bias = self.model_params
+        batch_size = self.client_config.batch_size
+        learning_rate = self.client_config.learning_rate
+        loss_signs = torch.where(self.train_labels == 1, -1., 1.)
+        with torch.no_grad():
+            for epoch in range(self.client_config.epochs):
+                for start in range(0, len(self.train_images), batch_size):
+                    images = self.train_images[start:start + batch_size]
+                    predictions = linear_model(images, weights, bias).sigmoid()
+                    loss_gradients = loss_signs[start:start + batch_size] * predictions * (1 - predictions) / len(images)
+                    self.__add_proximal_step(learning_rate)
+                    weights.sub_(images.t() @ loss_gradients, alpha=learning_rate)
+                    bias.sub_(loss_gradients.sum(0), alpha=learning_rate)
+
+    # Gradient step of the proximal term of FedProx, mu / 2 * ||w - w_round||^2, computed in place
+    def __add_proximal_step(self, learning_rate):
+        if self.global_model_params is None:
+            return
+        for model_param, global_model_param in zip(self.model_params, self.global_model_params):
+            model_param.sub_(model_param - global_model_param, alpha=learning_rate * self.client_config.proximal_mu)
+
+    def __report_accuracy(self, epoch):
+        with metrics.time('validate_epoch_seconds', description='Time to validate an epoch', model='MNIST'):
+            accuracy = self.__validate_epoch()
+        print('Accuracy of model trained at epoch', epoch, ':', accuracy, end='\n', flush=True)
+        if self.epoch_callback is not None:
+            self.epoch_callback(epoch, accuracy)
+
+    # Batches are slices of the stacked training tensors, so there is no collation of individual samples
     def __train_epoch(self):
-        for train_data, train_labels in self.training_dataloader:
-            self.__calculate_gradients(train_data, train_labels)
-            for model_param in self.model_params:
-                model_param.data -= model_param.grad * self.client_config.learning_rate
-                model_param.grad.zero_()
+        batch_size = self.client_config.batch_size
+        for start in range(0, len(self.train_images), batch_size):
+            self.__calculate_gradients(self.train_images[start:start + batch_size], self.train_labels[start:start + batch_size])
+            with torch.no_grad():
+                self.__add_proximal_step(self.client_config.learning_rate)
+                for model_param in self.model_params:
+                    model_param.sub_(model_param.grad, alpha=self.client_config.learning_rate)
+                    model_param.grad.zero_()
 
     def __validate_epoch(self):
-        accuracies = [self.__accuracy(linear_model(train_data, weights=self.model_params[0], bias=self.model_params[1]), train_labels) for
-                      train_data, train_labels in
-                      self.validation_dataloader]
-        return round(torch.stack(accuracies).mean().item(), 4)
+        with torch.no_grad():
+            predictions = linear_model(self.valid_images, weights=self.model_params[0], bias=self.model_params[1])
+            return round(self.__accuracy(predictions, self.valid_labels).item(), 4)
 
     def __calculate_gradients(self, train_data, train_labels):
         predictions = linear_model(train_data, self.model_params[0], self.model_params[1])
@@ -44,43 +100,34 @@ class MnistModelTrainer:
         corrections = (predictions > self.ACCURACY_THRESHOLD) == train_labels
         return corrections.float().mean()
 
-    def __get_tensors(self, path, digit):
-        digits = random.sample((path / 'train' / digit).ls().sorted(), int(random.uniform(20, 30)))
-        digit_tensors = [tensor(Image.open(image_path)) for image_path in digits]
+    # Returns the training and validation images of a digit, as float tensors with values in [0, 1]
+    def _get_tensors(self, dataset_cache, digit):
+        train_indices = random.sample(range(dataset_cache.size('train', digit)), int(random.uniform(20, 30)))
+        digit_tensors = dataset_cache.get_tensors('train', digit, train_indices)
 
-        valid_digit_paths = random.sample((path / 'valid' / digit).ls(), int(random.uniform(10, 20)))
-        valid_digit_tensors = torch.stack(
-            [tensor(Image.open(valid_digit_path)) for valid_digit_path in valid_digit_paths])
-        valid_digit_tensors = valid_digit_tensors.float() / 255
+        valid_indices = random.sample(range(dataset_cache.size('valid', digit)), int(random.uniform(10, 20)))
+        valid_digit_tensors = dataset_cache.get_tensors('valid', digit, valid_indices)
 
-        return digit_tensors, digits, valid_digit_tensors
+        return digit_tensors, valid_digit_tensors
 
     def __load_datasets(self):
         print('Loading dataset MNIST_SAMPLE...')
-        path = untar_data(URLs.MNIST_SAMPLE)
-        print('Content of MNIST_SAMPLE:', path.ls())
-        print("Content of 'train' directory of MNIST_SAMPLE", (path / 'train').ls())
-
-        three_tensors, threes, valid_three_tensors = self.__get_tensors(path, '3')
-        seven_tensors, sevens, valid_seven_tensors = self.__get_tensors(path, '7')
+        dataset_cache = get_mnist_dataset_cache()
 
-        print("There are', len(three_tensors), 'images of number 3 and', len(seven_tensors), 'of number 7\n")
+        stacked_threes, valid_three_tensors = self._get_tensors(dataset_cache, '3')
+        stacked_sevens, valid_seven_tensors = self._get_tensors(dataset_cache, '7')
 
-        stacked_threes = torch.stack(three_tensors).float() / 255
-        stacked_sevens = torch.stack(seven_tensors).float() / 255
+        print('There are', len(stacked_threes), 'images of number 3 and', len(stacked_sevens), 'of number 7')
 
         print('Shape of tensors of valid set of 3 images:', valid_three_tensors.shape, 'Shape of tensors of valid set of 7 images:',
               valid_seven_tensors.shape)
 
         train_images = torch.cat([stacked_threes, stacked_sevens]).view(-1, 28 * 28)
-        train_labels = tensor([1] * len(threes) + [0] * len(sevens)).unsqueeze(1)
-        training_dataset = list(zip(train_images, train_labels))
+        train_labels = torch.tensor([1] * len(stacked_threes) + [0] * len(stacked_sevens)).unsqueeze(1)
         print('Training images shape:', train_images.shape, ', training labels shape:', train_labels.shape)
 
         valid_images = torch.cat([valid_three_tensors, valid_seven_tensors]).view(-1, 28 * 28)
-        valid_labels = tensor([1] * len(valid_three_tensors) + [0] * len(valid_seven_tensors)).unsqueeze(1)
-        validation_dataset = list(zip(valid_images, valid_labels))
+        valid_labels = torch.tensor([1] * len(valid_three_tensors) + [0] * len(valid_seven_tensors)).unsqueeze(1)
         print('Dataset ready to be used')
         sys.stdout.flush()
-        return training_dataset, validation_dataset
-
+        return train_images, train_labels, valid_images, valid_labels
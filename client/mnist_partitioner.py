@@ -0,0 +1,70 @@
+import sys
+import threading
+
+import numpy as np
+
+from .config import PARTITION_STRATEGY, PARTITION_SHARD_SIZE, PARTITION_ALPHA, PARTITION_SEED
+from .mnist_dataset_cache import SPLITS, DIGITS
+
+STRATEGIES = ['sequential', 'iid', 'dirichlet']
+
+_partitioner = None
+_partitioner_lock = threading.Lock()
+
+
+# Splits the MNIST_SAMPLE cache in shards, computed once per process. Every split and digit has its rows
+# in shard order and the offsets where every shard starts, so the rows of a shard are a slice of the index.
+# The partition only depends on the sizes of the cache and on the seed, so all the clients compute the same
+# shards and every (client, round) gets its own shard until they run out:
+# - sequential: every shard gets the next images of every digit, sorted by file name
+# - iid: same as sequential over a random permutation of the images of every digit
+# - dirichlet: the images of every digit are spread over the shards with proportions drawn from Dir(alpha),
+#   the lower alpha the more skewed the labels of every shard. Validation images follow the same proportions
+class MnistPartitioner:
+    def __init__(self, dataset_cache, strategy='sequential', shard_size=25, alpha=0.5, seed=0):
+        if strategy not in STRATEGIES:
+            raise ValueError('Unsupported partition strategy', strategy)
+        self.strategy = strategy
+        self.shards_count = max(1, min(dataset_cache.size('train', digit) for digit in DIGITS) // shard_size)
+        random_generator = np.random.default_rng(seed)
+        self.rows = {}
+        self.offsets = {}
+        for digit in DIGITS:
+            proportions = None
+            if strategy == 'dirichlet':
+                proportions = random_generator.dirichlet(np.full(self.shards_count, alpha))
+            for split in SPLITS:
+                rows = np.arange(dataset_cache.size(split, digit))
+                if strategy != 'sequential':
+                    rows = random_generator.permutation(rows)
+                self.rows[split + '/' + digit] = rows
+                self.offsets[split + '/' + digit] = self.__get_offsets(len(rows), proportions)
+        print('MNIST_SAMPLE partitioned in', self.shards_count, 'shards with strategy', strategy)
+        sys.stdout.flush()
+
+    def __get_offsets(self, size, proportions):
+        if proportions is None:
+            return np.linspace(0, size, self.shards_count + 1).astype(np.int64)
+        offsets = np.zeros(self.shards_count + 1, dtype=np.int64)
+        offsets[1:] = np.round(np.cumsum(proportions) * size).astype(np.int64)
+        offsets[-1] = size
+        return offsets
+
+    # The central node ranks the participants of every round from 0 to round_size - 1, client ids can have gaps
+    # once clients are unregistered. Every round uses the next round_size shards
+    def get_shard(self, client_rank, round, round_size):
+        return ((round - 1) * round_size + client_rank) % self.shards_count
+
+    # Positions of the images of a digit in a shard, as expected by MnistDatasetCache.get_tensors
+    def get_indices(self, split, digit, shard):
+        offsets = self.offsets[split + '/' + digit]
+        return self.rows[split + '/' + digit][offsets[shard]:offsets[shard + 1]]
+
+
+def get_mnist_partitioner(dataset_cache):
+    global _partitioner
+    with _partitioner_lock:
+        if _partitioner is None:
+            _partitioner = MnistPartitioner(dataset_cache, PARTITION_STRATEGY, PARTITION_SHARD_SIZE, PARTITION_ALPHA,
+                                            PARTITION_SEED)
+        return _partitioner
@@ -0,0 +1,86 @@
+import hashlib
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+
+import requests
+
+from requests.exceptions import RequestException
+
+from .metrics import metrics
+from .tensor_codec import decode
+
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+# Downloads the model blobs of the training requests from the central node. Blobs are addressed by their SHA-256,
+# so the ones already downloaded are reused without asking the central node, and interrupted downloads are resumed
+# with Range requests from the last byte received
+class ModelDownloader:
+    def __init__(self, server_url, cache_size=2, retries=5, retry_backoff=1., timeout=60):
+        self.server_url = server_url
+        self.cache_size = cache_size
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.blobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+
+    # Returns the request params of the model blob of a descriptor. They are decoded from a copy of the blob,
+    # so the trainers can update them in place without changing the cached blob
+    def download(self, model_descriptor):
+        model_hash = model_descriptor['hash']
+        with self.lock:
+            blob = self.blobs.get(model_hash)
+            if blob is not None:
+                self.blobs.move_to_end(model_hash)
+        if blob is not None:
+            print('Model', model_hash, 'found in the local cache')
+        else:
+            with metrics.time('model_download_seconds', description='Time to download the model params from the central node'):
+                blob = self.__download(model_hash, model_descriptor['size'])
+            with self.lock:
+                self.blobs[model_hash] = blob
+                while len(self.blobs) > self.cache_size:
+                    self.blobs.popitem(last=False)
+        return decode(bytearray(blob))
+
+    def __download(self, model_hash, size):
+        print('Downloading model', model_hash, 'of', size, 'bytes')
+        buffer = bytearray(size)
+        bytes_received = 0
+        for attempt in range(self.retries + 1):
+            if bytes_received == size:
+                break
+            if attempt > 0:
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                print('Resuming download of model', model_hash, 'from byte', bytes_received)
+            headers = {}
+            if bytes_received > 0:
+                headers['Range'] = 'bytes={}-'.format(bytes_received)
+            try:
+                with self.session.get(self.server_url + '/models/' + model_hash, headers=headers, stream=True,
+                                      timeout=self.timeout) as response:
+                    if response.status_code == 404:
+                        raise ValueError('Model not found in the central node', model_hash)
+                    if response.status_code == 200:
+                        bytes_received = 0
+                    elif response.status_code != 206:
+                        print('Error downloading model', model_hash, ', status:', response.status_code)
+                        continue
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        if bytes_received + len(chunk) > size:
+                            raise ValueError('Model bigger than expected', model_hash)
+                        buffer[bytes_received:bytes_received + len(chunk)] = chunk
+                        bytes_received += len(chunk)
+                        metrics.increment('download_bytes_total', len(chunk),
+                                          description='Bytes of model params received from the central node')
+            except RequestException as e:
+                print('Error downloading model', model_hash, ':', repr(e))
+            sys.stdout.flush()
+        if bytes_received != size or hashlib.sha256(buffer).hexdigest() != model_hash:
+            raise ValueError('Model cannot be downloaded', model_hash)
+        return buffer
@@ -0,0 +1,32 @@
+import uuid
+
+import numpy as np
+
+from .tensor_codec import encode, to_json_params
+from .training_type import TrainingType
+from .utils import model_params_to_arrays
+
+# Changes every time the client starts, so the versions of a previous run are never taken as current
+_boot_id = uuid.uuid4().hex[:8]
+
+
+# Immutable copy of the model params of the client served to its gossip peers. It's serialized once when
+# the model params change, and identified by its version, used as ETag so peers only download new versions
+class ModelSnapshot:
+    def __init__(self, model_params, samples_count, version):
+        self.version = version
+        self.etag = '"{}-{}"'.format(_boot_id, version)
+        self.samples_count = samples_count
+        # The arrays are copied, the model params of the client are trained in place on the next round
+        model_params = {key: np.array(array) for key, array in model_params_to_arrays(TrainingType.GOSSIP_MNIST, model_params).items()}
+        model_params['samples'] = samples_count
+        model_params['version'] = version
+        self.binary_model_params = encode(model_params)
+        self.json_model_params = None
+        self.arrays = model_params
+
+    # The JSON version is only built if a peer asks for it
+    def get_json_model_params(self):
+        if self.json_model_params is None:
+            self.json_model_params = to_json_params(self.arrays)
+        return self.json_model_params
@@ -0,0 +1,69 @@
+import numpy as np
+import torch
+
+
+# Declares the params of a model: their shapes, the keys of the request params they are sent in, and the framework
+# of its trainers, PyTorch trainers get the params as tensors and Keras trainers as numpy arrays.
+# Params initialized by the client are laid out one after another in a single flat float32 buffer.
+# Params that share a key are sent as a list under that key, in the order of the model params
+class ModelSpec:
+    def __init__(self, name, param_shapes, param_keys, framework, random_init=False):
+        if len(param_shapes) != len(param_keys):
+            raise ValueError('Every param of model needs a key', name)
+        self.name = name
+        self.param_shapes = [tuple(shape) for shape in param_shapes]
+        self.param_keys = list(param_keys)
+        self.framework = framework
+        # Models without a random init are initialized by their trainers, e.g. Keras models
+        self.random_init = random_init
+        # Offset of every param in the flat buffer, and size of the buffer
+        self.param_offsets = []
+        self.size = 0
+        for shape in self.param_shapes:
+            self.param_offsets.append(self.size)
+            self.size += int(np.prod(shape, dtype=np.int64))
+
+    # Views of the params in a flat buffer, they share its memory
+    def get_views(self, buffer):
+        return [buffer[offset:offset + int(np.prod(shape, dtype=np.int64))].reshape(shape)
+                for offset, shape in zip(self.param_offsets, self.param_shapes)]
+
+    def init_params(self):
+        if not self.random_init:
+            return None
+        return self.to_model_params(self.get_views(np.random.randn(self.size).astype(np.float32)))
+
+    # Model params of the trainers from the arrays of the request params. Float32 numpy arrays are wrapped
+    # without copying, so they must come from a writable buffer because the PyTorch trainers update them in place
+    def to_model_params(self, arrays):
+        arrays = [np.asarray(array, dtype=np.float32) for array in arrays]
+        if len(arrays) != len(self.param_shapes):
+            raise ValueError('Unexpected number of params for model', self.name, len(arrays))
+        for array, shape in zip(arrays, self.param_shapes):
+            if array.shape != shape:
+                raise ValueError('Unexpected shape of a param of model', self.name, array.shape)
+        if self.framework == 'torch':
+            return tuple(torch.from_numpy(array).requires_grad_() for array in arrays)
+        return arrays
+
+    def has_request_params(self, request_params):
+        return all(key in request_params for key in self.param_keys)
+
+    def to_request_params(self, arrays):
+        request_params = {}
+        for key, array in zip(self.param_keys, arrays):
+            if self.param_keys.count(key) > 1:
+                request_params.setdefault(key, []).append(array)
+            else:
+                request_params[key] = array
+        return request_params
+
+    # Returns the arrays of the request params as a flat list, in the order of the model params
+    def to_arrays(self, request_params):
+        arrays = []
+        for key in dict.fromkeys(self.param_keys):
+            if self.param_keys.count(key) > 1:
+                arrays.extend(request_params[key])
+            else:
+                arrays.append(request_params[key])
+        return arrays
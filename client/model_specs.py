@@ -0,0 +1,24 @@
+from .model_spec import ModelSpec
+from .training_type import TrainingType
+
+# Linear model trained with PyTorch: 28x28 pixels to the probability of a 3
+MNIST_SPEC = ModelSpec('mnist', [(28 * 28, 1), (1,)], ['weights', 'bias'], 'torch', random_init=True)
+# Keras model (Conv2D 32, MaxPool, Conv2D 64, MaxPool, Flatten, Dense 2) for 224x224 RGB images,
+# kernels and biases of every layer are sent as a list of weights
+CHEST_X_RAY_SPEC = ModelSpec('chest_x_ray', [(3, 3, 3, 32), (32,), (3, 3, 32, 64), (64,), (56 * 56 * 64, 2), (2,)],
+                             ['weights'] * 6, 'keras')
+
+# Model trained by every training type, MNIST training types share the same model
+MODEL_SPECS = {
+    TrainingType.MNIST: MNIST_SPEC,
+    TrainingType.DETERMINISTIC_MNIST: MNIST_SPEC,
+    TrainingType.ASYNC_MNIST: MNIST_SPEC,
+    TrainingType.GOSSIP_MNIST: MNIST_SPEC,
+    TrainingType.CHEST_X_RAY_PNEUMONIA: CHEST_X_RAY_SPEC,
+}
+
+
+def get_model_spec(training_type):
+    if training_type not in MODEL_SPECS:
+        raise ValueError('Unsupported training type', training_type)
+    return MODEL_SPECS[training_type]
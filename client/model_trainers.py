@@ -0,0 +1,58 @@
+import importlib
+
+from .training_type import TrainingType
+
+# Module and class of the trainer of every training type. Trainers are imported the first time they are used,
+# so a client doesn't load TensorFlow unless it trains the Chest X-Ray model
+MODEL_TRAINERS = {
+    TrainingType.MNIST: ('.mnist_model_trainer', 'MnistModelTrainer'),
+    TrainingType.ASYNC_MNIST: ('.mnist_model_trainer', 'MnistModelTrainer'),
+    TrainingType.DETERMINISTIC_MNIST: ('.deterministic_mnist_model_trainer', 'DeterministicMnistModelTrainer'),
+    TrainingType.GOSSIP_MNIST: ('.gossip_mnist_model_trainer', 'GossipMnistModelTrainer'),
+    TrainingType.CHEST_X_RAY_PNEUMONIA: ('.chest_x_ray_model_trainer', 'ChestXRayModelTrainer'),
+}
+
+
+def get_model_trainer_class(training_type):
+    if training_type not in MODEL_TRAINERS:
+        raise ValueError('Unsupported training type', training_type)
+    module_name, class_name = MODEL_TRAINERS[training_type]
+    return getattr(importlib.import_module(module_name, __package__), class_name)
+
+
+def create_model_trainer(training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size,
+                         clients):
+    model_trainer_class = get_model_trainer_class(training_type)
+    if training_type == TrainingType.DETERMINISTIC_MNIST:
+        return model_trainer_class(model_params, federated_learning_config, client_id, round, client_rank, round_size)
+    elif training_type == TrainingType.GOSSIP_MNIST:
+        return model_trainer_class(model_params, federated_learning_config, client_id, round, client_rank, round_size,
+                                   clients)
+    return model_trainer_class(model_params, federated_learning_config)
+
+
+# Trains a model and returns the model params updated and the number of training samples.
+# It's also the entry point of the training processes, so it only takes picklable arguments
+def train_model(training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size, clients,
+                epoch_callback=None):
+    model_trainer = create_model_trainer(training_type, model_params, federated_learning_config, client_id, round, client_rank,
+                                         round_size, clients)
+    model_trainer.epoch_callback = epoch_callback
+    model_params_updated = model_trainer.train_model()
+    return model_params_updated, model_trainer.samples_count
+
+
+# Imports the trainers of the training types and loads their datasets, so the first training doesn't wait for them
+def preload_model_trainers(training_types):
+    for training_type in training_types:
+        get_model_trainer_class(training_type)
+        if training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
+            from .chest_x_ray_dataset_cache import get_chest_x_ray_dataset_cache
+            get_chest_x_ray_dataset_cache()
+        else:
+            from .mnist_dataset_cache import get_mnist_dataset_cache
+            dataset_cache = get_mnist_dataset_cache()
+            if training_type == TrainingType.DETERMINISTIC_MNIST or training_type == TrainingType.GOSSIP_MNIST:
+                from .mnist_partitioner import get_mnist_partitioner
+                get_mnist_partitioner(dataset_cache)
+        print('Trainer of', training_type, 'preloaded')
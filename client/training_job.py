@@ -0,0 +1,45 @@
+import time
+import uuid
+
+from .training_job_status import TrainingJobStatus
+
+
+class TrainingJob:
+    def __init__(self, training_type, epochs, run):
+        self.job_id = uuid.uuid4().hex
+        self.training_type = training_type
+        self.status = TrainingJobStatus.QUEUED
+        self.epochs = epochs
+        self.current_epoch = 0
+        self.accuracy = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.run = run
+
+    def update_progress(self, epoch, accuracy=None):
+        self.current_epoch = epoch
+        self.accuracy = accuracy
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'training_type': self.training_type,
+            'status': self.status,
+            'epochs': self.epochs,
+            'current_epoch': self.current_epoch,
+            'accuracy': self.accuracy,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+    def __str__(self):
+        return "Training job:\n--Job id: {}\n--Training type: {}\n--Status: {}\n--Epoch: {}/{}\n".format(
+            self.job_id,
+            self.training_type,
+            self.status,
+            self.current_epoch,
+            self.epochs)
@@ -0,0 +1,59 @@
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from .training_job_status import TrainingJobStatus
+
+
+# Runs training jobs on a pool of background worker threads, so training requests can be answered right away.
+# The queue is bounded: when it's full new jobs are rejected instead of piling up
+class TrainingJobQueue:
+    def __init__(self, workers=1, max_size=4, history_size=100):
+        self.jobs_queue = queue.Queue(maxsize=max_size)
+        self.jobs = OrderedDict()
+        self.history_size = history_size
+        self.lock = threading.Lock()
+        self.workers = [threading.Thread(target=self.__work, name='training-worker-' + str(i), daemon=True)
+                        for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    # Returns False if the queue is full and the job cannot be accepted
+    def submit(self, training_job):
+        try:
+            self.jobs_queue.put_nowait(training_job)
+        except queue.Full:
+            return False
+        with self.lock:
+            self.jobs[training_job.job_id] = training_job
+            # Only the last jobs are kept for status requests
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+        return True
+
+    # Jobs waiting for a worker
+    def qsize(self):
+        return self.jobs_queue.qsize()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def __work(self):
+        while True:
+            training_job = self.jobs_queue.get()
+            training_job.status = TrainingJobStatus.RUNNING
+            training_job.started_at = time.time()
+            try:
+                training_job.run(training_job)
+                training_job.status = TrainingJobStatus.FINISHED
+            except Exception as e:
+                print('Training job', training_job.job_id, 'failed:', repr(e))
+                training_job.error = repr(e)
+                training_job.status = TrainingJobStatus.FAILED
+            finally:
+                training_job.finished_at = time.time()
+                self.jobs_queue.task_done()
+                sys.stdout.flush()
@@ -0,0 +1,5 @@
+class TrainingJobStatus:
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    FINISHED = 'FINISHED'
+    FAILED = 'FAILED'
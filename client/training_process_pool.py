@@ -0,0 +1,66 @@
+import multiprocessing
+import sys
+import threading
+import uuid
+
+from concurrent.futures import ProcessPoolExecutor
+
+from .model_trainers import preload_model_trainers, train_model
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue, preload_training_types):
+    global _progress_queue
+    _progress_queue = progress_queue
+    preload_model_trainers(preload_training_types)
+    sys.stdout.flush()
+
+
+def _train_model(job_id, training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size,
+                 clients):
+    def epoch_callback(epoch, accuracy=None):
+        _progress_queue.put((job_id, epoch, accuracy))
+
+    return train_model(training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size,
+                       clients, epoch_callback)
+
+
+# Runs the training outside the Flask process, in warm worker processes that keep the trainers, their frameworks
+# and the datasets loaded between jobs. Workers are started with spawn, TensorFlow and torch don't support fork
+# after they have been initialized. The progress of every epoch is sent back through a queue
+class TrainingProcessPool:
+    def __init__(self, workers=1, preload_training_types=None):
+        context = multiprocessing.get_context('spawn')
+        self.manager = context.Manager()
+        self.progress_queue = self.manager.Queue()
+        self.epoch_callbacks = {}
+        self.lock = threading.Lock()
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                            initargs=(self.progress_queue, preload_training_types or []))
+        # Workers are started right away, so they are warm when the first training is requested
+        for _ in range(workers):
+            self.executor.submit(sys.stdout.flush)
+        self.progress_thread = threading.Thread(target=self.__report_progress, name='training-progress', daemon=True)
+        self.progress_thread.start()
+
+    # Same as model_trainers.train_model, running in a worker process
+    def train_model(self, training_type, model_params, federated_learning_config, client_id, round, client_rank, round_size,
+                    clients, epoch_callback=None):
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.epoch_callbacks[job_id] = epoch_callback
+        try:
+            return self.executor.submit(_train_model, job_id, training_type, model_params, federated_learning_config,
+                                        client_id, round, client_rank, round_size, clients).result()
+        finally:
+            with self.lock:
+                self.epoch_callbacks.pop(job_id)
+
+    def __report_progress(self):
+        while True:
+            job_id, epoch, accuracy = self.progress_queue.get()
+            with self.lock:
+                epoch_callback = self.epoch_callbacks.get(job_id)
+            if epoch_callback is not None:
+                epoch_callback(epoch, accuracy)
@@ -3,4 +3,5 @@ class TrainingType:
     CHEST_X_RAY_PNEUMONIA = 'CHEST_X_RAY_PNEUMONIA'
     DETERMINISTIC_MNIST = 'DETERMINISTIC_MNIST'
     GOSSIP_MNIST = 'GOSSIP_MNIST'
+    ASYNC_MNIST = 'ASYNC_MNIST'
 
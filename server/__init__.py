@@ -1,24 +1,144 @@
-import asyncio
 import os
+import time
 
 from flask import (
     Flask, Response, request, render_template, jsonify
 )
 
+from .aggregation_config import AggregationConfig
+from .async_config import AsyncConfig
+from .checkpoint_config import CheckpointConfig
+from .chunked_upload import parse_content_range, parse_digest
+from .chunked_upload_store import ChunkedUploadStore
+from .compression_config import CompressionConfig
+from .dispatcher_config import DispatcherConfig
+from .edge_aggregator import EDGE_PATH, EdgeAggregator
+from .evaluation_config import EvaluationConfig
+from .model_specs import MODEL_SPECS, get_model_spec
+from .registry_config import RegistryConfig
+from .round_config import RoundConfig
 from .server import Server
+from .tensor_codec import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE, decode, read_into_buffer
 from .training_type import TrainingType
+from .upload_config import UploadConfig
 from .utils import request_params_to_model_params
 
 
+# Request bodies can be JSON or binary tensors, depending on the content type sent by the client
+def get_request_data():
+    if request.mimetype == BINARY_CONTENT_TYPE:
+        return decode(read_into_buffer(request.stream, request.content_length))
+    return request.json
+
+
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
-    server = Server()
 
     app.config.from_mapping(
         SECRET_KEY='dev',
-        DATABASE=os.path.join(app.instance_path, 'fl-network.sqlite'),
+        CHECKPOINT_PATH=None,
+        CHECKPOINT_INTERVAL=1,
+        CHECKPOINT_VERSIONS=3,
+        AGGREGATION_STRATEGY='fedavg',
+        AGGREGATION_SERVER_LEARNING_RATE=1.,
+        AGGREGATION_MOMENTUM=0.9,
+        AGGREGATION_BETA_1=0.9,
+        AGGREGATION_BETA_2=0.99,
+        AGGREGATION_TAU=1e-3,
+        AGGREGATION_PROXIMAL_MU=0.,
+        ASYNC_BUFFER_SIZE=3,
+        ASYNC_STALENESS_EXPONENT=0.5,
+        ASYNC_MAX_STALENESS=10,
+        ASYNC_SERVER_LEARNING_RATE=1.,
+        ASYNC_VERSIONS=20,
+        EDGE_URL=None,
+        EDGE_UPSTREAM_URL=None,
+        DISPATCHER_CONNECTIONS_LIMIT=1000,
+        DISPATCHER_CONNECTIONS_LIMIT_PER_HOST=4,
+        DISPATCHER_KEEPALIVE_TIMEOUT=60,
+        DISPATCHER_CONNECT_TIMEOUT=5,
+        DISPATCHER_REQUEST_TIMEOUT=600,
+        DISPATCHER_RETRIES=3,
+        DISPATCHER_RETRY_BACKOFF=0.5,
+        ROUND_PARTICIPATION_FRACTION=1.,
+        ROUND_QUORUM_FRACTION=1.,
+        ROUND_DEADLINE=None,
+        ROUND_LATE_UPDATE_WEIGHT=0.,
+        COMPRESSION_UPLOAD_DELTA=False,
+        COMPRESSION_UPLOAD_TOP_K=None,
+        COMPRESSION_UPLOAD_QUANTIZATION=None,
+        COMPRESSION_DOWNLOAD_QUANTIZATION=None,
+        UPLOAD_EXPIRATION=600,
+        UPLOAD_MAX_SIZE=2 ** 30,
+        UPLOAD_MAX_PER_CLIENT=2,
+        HEARTBEAT_TTL=None,
+        EVALUATION_PATH=None,
+        EVALUATION_MNIST_PATH=None,
+        EVALUATION_CHEST_X_RAY_PATH=None,
+        EVALUATION_BATCH_SIZE=256,
+        EVALUATION_PATIENCE=None,
+        EVALUATION_MIN_DELTA=0.001,
+        EDGE_HEARTBEAT_INTERVAL=10,
     )
+    if test_config is None:
+        # load the instance config, if it exists, when not testing
+        app.config.from_pyfile('config.py', silent=True)
+    else:
+        app.config.from_mapping(test_config)
+
+    dispatcher_config = DispatcherConfig(connections_limit=app.config['DISPATCHER_CONNECTIONS_LIMIT'],
+                                         connections_limit_per_host=app.config['DISPATCHER_CONNECTIONS_LIMIT_PER_HOST'],
+                                         keepalive_timeout=app.config['DISPATCHER_KEEPALIVE_TIMEOUT'],
+                                         connect_timeout=app.config['DISPATCHER_CONNECT_TIMEOUT'],
+                                         request_timeout=app.config['DISPATCHER_REQUEST_TIMEOUT'],
+                                         retries=app.config['DISPATCHER_RETRIES'],
+                                         retry_backoff=app.config['DISPATCHER_RETRY_BACKOFF'])
+    round_config = RoundConfig(participation_fraction=app.config['ROUND_PARTICIPATION_FRACTION'],
+                               quorum_fraction=app.config['ROUND_QUORUM_FRACTION'],
+                               deadline=app.config['ROUND_DEADLINE'],
+                               late_update_weight=app.config['ROUND_LATE_UPDATE_WEIGHT'])
+    upload_compression_config = CompressionConfig(delta=app.config['COMPRESSION_UPLOAD_DELTA'],
+                                                  top_k=app.config['COMPRESSION_UPLOAD_TOP_K'],
+                                                  quantization=app.config['COMPRESSION_UPLOAD_QUANTIZATION'])
+    download_compression_config = CompressionConfig(quantization=app.config['COMPRESSION_DOWNLOAD_QUANTIZATION'])
+    checkpoint_config = CheckpointConfig(path=app.config['CHECKPOINT_PATH'],
+                                         interval=app.config['CHECKPOINT_INTERVAL'],
+                                         versions=app.config['CHECKPOINT_VERSIONS'])
+    # Edge aggregators only average the model params of their clients, the server optimizer of FedAvgM and FedAdam
+    # runs once, in the upstream server
+    aggregation_strategy = app.config['AGGREGATION_STRATEGY'] if app.config['EDGE_UPSTREAM_URL'] is None else 'fedavg'
+    aggregation_config = AggregationConfig(strategy=aggregation_strategy,
+                                           server_learning_rate=app.config['AGGREGATION_SERVER_LEARNING_RATE'],
+                                           momentum=app.config['AGGREGATION_MOMENTUM'],
+                                           beta_1=app.config['AGGREGATION_BETA_1'],
+                                           beta_2=app.config['AGGREGATION_BETA_2'],
+                                           tau=app.config['AGGREGATION_TAU'],
+                                           proximal_mu=app.config['AGGREGATION_PROXIMAL_MU'])
+    async_config = AsyncConfig(buffer_size=app.config['ASYNC_BUFFER_SIZE'],
+                               staleness_exponent=app.config['ASYNC_STALENESS_EXPONENT'],
+                               max_staleness=app.config['ASYNC_MAX_STALENESS'],
+                               server_learning_rate=app.config['ASYNC_SERVER_LEARNING_RATE'],
+                               versions=app.config['ASYNC_VERSIONS'])
+    upload_config = UploadConfig(expiration=app.config['UPLOAD_EXPIRATION'],
+                                 max_size=app.config['UPLOAD_MAX_SIZE'],
+                                 max_per_client=app.config['UPLOAD_MAX_PER_CLIENT'])
+    registry_config = RegistryConfig(heartbeat_ttl=app.config['HEARTBEAT_TTL'])
+    evaluation_config = EvaluationConfig(path=app.config['EVALUATION_PATH'],
+                                         mnist_path=app.config['EVALUATION_MNIST_PATH'],
+                                         chest_x_ray_path=app.config['EVALUATION_CHEST_X_RAY_PATH'],
+                                         batch_size=app.config['EVALUATION_BATCH_SIZE'],
+                                         patience=app.config['EVALUATION_PATIENCE'],
+                                         min_delta=app.config['EVALUATION_MIN_DELTA'])
+    server = Server(dispatcher_config, round_config, upload_compression_config, download_compression_config, checkpoint_config,
+                    aggregation_config, async_config, registry_config, evaluation_config)
+    # The central node runs as an edge aggregator when it has an upstream server
+    edge_aggregator = None
+    if app.config['EDGE_UPSTREAM_URL'] is not None:
+        edge_aggregator = EdgeAggregator(server, app.config['EDGE_URL'], app.config['EDGE_UPSTREAM_URL'],
+                                         app.config['EDGE_HEARTBEAT_INTERVAL'])
+        edge_aggregator.register()
+    uploads = ChunkedUploadStore(upload_config)
     # ensure the instance folder exists
     try:
         os.makedirs(app.instance_path)
@@ -30,19 +150,37 @@ def create_app(test_config=None):
         clients_ready_for_training = server.can_do_training()
         return render_template("index.html",
                                server_status=server.status,
-                               training_clients=server.training_clients,
-                               clients_ready_for_training=clients_ready_for_training)
+                               training_clients=server.get_training_clients(),
+                               clients_ready_for_training=clients_ready_for_training,
+                               rounds_history=reversed(server.get_rounds_history()))
+
+    @app.route('/metrics')
+    def metrics():
+        server.metrics.set('registered_clients', len(server.get_training_clients()), description='Clients registered in the network')
+        server.metrics.set('round', server.round, description='Current training round')
+        return Response(server.metrics.to_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    # Metrics of the last rounds shown in the dashboard, newest first
+    @app.route('/rounds', methods=['GET'])
+    def get_rounds():
+        return jsonify([round_metrics.to_dict() for round_metrics in reversed(server.get_rounds_history())])
 
     @app.route('/training', methods=['POST'])
     def training():
         training_type = request.json['training_type']
-        asyncio.run(server.start_training(training_type))
-        return Response(status=200)
+        if training_type not in MODEL_SPECS:
+            print('Unsupported training type', training_type)
+            return Response(status=400)
+        # The round runs in the dispatcher thread, the request doesn't wait for the clients to accept the training
+        server.dispatcher.submit(server.start_training(training_type))
+        return Response(status=202)
 
     @app.route('/client', methods=['POST'])
     def register_client():
         print('Request POST /client for client_url [', request.form['client_url'], ']')
-        server.register_client(request.form['client_url'])
+        accepts_binary = BINARY_CONTENT_TYPE in request.form.get('accept', '')
+        downloads_models = request.form.get('download_models') == 'true'
+        server.register_client(request.form['client_url'], accepts_binary, downloads_models)
         return Response(status=201)
 
     @app.route('/client', methods=['DELETE'])
@@ -51,18 +189,123 @@ def create_app(test_config=None):
         server.unregister_client(request.form['client_url'])
         return Response(status=200)
 
+    # Clients that don't send heartbeats within the TTL are unregistered, 404 means the client has to register again
+    @app.route('/client/heartbeat', methods=['POST'])
+    def client_heartbeat():
+        if not server.heartbeat(request.form['client_url']):
+            return Response(status=404)
+        return Response(status=200)
+
+    @app.route('/client/training_error', methods=['POST'])
+    def client_training_error():
+        client_url = request.json['client_url']
+        try:
+            training_client = server.get_training_client(client_url)
+        except KeyError:
+            print('Client', client_url, 'is not registered in the system')
+            return Response(status=401)
+        server.report_training_error(request.json['training_type'], training_client, request.json.get('round'))
+        return Response(status=200)
+
     @app.route('/model_params', methods=['PUT'])
     def update_weights():
+        decode_start = time.perf_counter()
+        return update_model_params(get_request_data(), request.content_length or 0, decode_start)
+
+    # Starts an upload of model params in chunks, or returns the offset to resume it from if it already exists.
+    # The status is the one of the update of the model params once the upload is complete.
+    # The training type gives the model params the upload can have, and so its maximum size
+    @app.route('/model_params/uploads', methods=['POST'])
+    def create_model_params_upload():
         client_url = request.json['client_url']
-        training_type = request.json['training_type']
+        try:
+            server.get_training_client(client_url)
+            upload = uploads.create(request.json['upload_id'], request.json['size'],
+                                    request.json.get('content_type', JSON_CONTENT_TYPE), client_url,
+                                    get_model_spec(request.json.get('training_type')))
+        except KeyError:
+            print('Client', client_url, 'is not registered in the system')
+            return Response(status=401)
+        except ValueError as e:
+            print('Upload of model params from client', client_url, 'rejected:', e)
+            return Response(status=400)
+        return jsonify(offset=upload.offset, status=upload.status)
+
+    # Chunks answer 202 with the offset of the next chunk, or 409 with the offset to resume from if the chunk
+    # doesn't start there or it's corrupted. The last chunk answers with the status of the update of the model params
+    @app.route('/model_params/uploads/<upload_id>', methods=['PUT'])
+    def upload_model_params_chunk(upload_id):
+        upload = uploads.get(upload_id)
+        if upload is None:
+            return Response(status=404)
+        try:
+            start, end, size = parse_content_range(request.headers.get('Content-Range'))
+            digest = parse_digest(request.headers.get('Digest'))
+        except ValueError as e:
+            print('Invalid chunk of upload', upload_id, ':', e)
+            return Response(status=400)
+        with upload.lock:
+            if upload.status is not None:
+                return Response(status=upload.status)
+            if start != upload.offset or size != upload.size or end > size or request.content_length != end - start:
+                return jsonify(offset=upload.offset), 409
+            decode_start = time.perf_counter()
+            if not upload.write_chunk(request.stream, start, end, digest):
+                print('Chunk', start, '-', end, 'of upload', upload_id, 'is corrupted')
+                return jsonify(offset=upload.offset), 409
+            if not upload.is_complete():
+                return jsonify(offset=upload.offset), 202
+            if not upload.is_valid():
+                print('Upload', upload_id, "doesn't match its digest")
+                uploads.remove(upload_id)
+                return Response(status=400)
+            try:
+                request_data = upload.get_request_data()
+            except ValueError as e:
+                print('Upload', upload_id, 'cannot be decoded:', e)
+                upload.finish(400)
+                return Response(status=400)
+            response = update_model_params(request_data, upload.size, decode_start)
+            upload.finish(response.status_code)
+            return response
+
+    # Model params are decoded outside the lock of the server, so the uploads of several clients are decoded concurrently
+    def update_model_params(request_data, content_length, decode_start):
+        client_url = request_data['client_url']
+        training_type = request_data['training_type']
         print('Request PUT /model_params for client_url [', client_url, '] and training type:', training_type)
         try:
-            training_client = server.training_clients[request.json['client_url']]
-            server.update_client_model_params(training_type, training_client, request_params_to_model_params(training_type, request.json))
+            training_client = server.get_training_client(client_url)
+            base_model_params = server.get_round_base_params(request_data.get('round'))
+            model_params = request_params_to_model_params(training_type, request_data, base_model_params)
+            # Edge aggregators without updates from their clients report with 0 samples, maybe without model params
+            if model_params is None and request_data.get('samples', 1.) > 0:
+                return Response(status=400)
+            server.record_client_upload(training_client, request_data.get('round'), content_length,
+                                        time.perf_counter() - decode_start)
+            # Model params are weighted by the number of training samples of the client, if it's reported
+            server.update_client_model_params(training_type, training_client, model_params, request_data.get('round'),
+                                              request_data.get('samples', 1.))
             return Response(status=200)
         except KeyError:
             print('Client', client_url, 'is not registered in the system')
             return Response(status=401)
+        except ValueError as e:
+            print('Model params from client', client_url, 'cannot be decoded:', e)
+            return Response(status=400)
+
+    # Model blobs never change, so they can be cached forever by their hash. Downloads can be resumed with Range requests
+    @app.route('/models/<model_hash>', methods=['GET'])
+    def get_model(model_hash):
+        blob = server.model_blobs.get(model_hash)
+        if blob is None:
+            return Response(status=404)
+        response = Response(blob, mimetype=BINARY_CONTENT_TYPE)
+        response.set_etag(model_hash)
+        response.cache_control.public = True
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(blob))
 
     @app.route('/finish_round', methods=['POST'])
     def finish_round():
@@ -70,13 +313,25 @@ def create_app(test_config=None):
         training_type = request.json['training_type']
         print('Request POST /finish_round for client_url [', client_url, '] and training type:', training_type)
         if training_type == TrainingType.GOSSIP_MNIST:
-            training_client = server.training_clients[request.json['client_url']]
+            training_client = server.get_training_client(client_url)
             server.finish_round(training_type, training_client)
             return Response(status=200)
         else:
             return Response(status=400)
 
 
+    @app.route(EDGE_PATH + '/training', methods=['POST'])
+    def edge_training():
+        if edge_aggregator is None:
+            return Response(status=404)
+        try:
+            if not edge_aggregator.start_training(get_request_data()):
+                return Response(status=503)
+        except ValueError as e:
+            print('Training requested by the upstream server cannot be started:', e)
+            return Response(status=400)
+        return Response(status=202)
+
     @app.errorhandler(404)
     def page_not_found(error):
         return 'This page does not exist', 404
@@ -0,0 +1,31 @@
+STRATEGIES = ['fedavg', 'fedavgm', 'fedadam']
+
+
+class AggregationConfig:
+    def __init__(self, strategy='fedavg', server_learning_rate=1., momentum=0.9, beta_1=0.9, beta_2=0.99, tau=1e-3,
+                 proximal_mu=0.):
+        if strategy not in STRATEGIES:
+            raise ValueError('Unsupported aggregation strategy', strategy)
+        self.strategy = strategy
+        # Step size of the server optimizer of FedAvgM and FedAdam, applied to the average update of the clients
+        self.server_learning_rate = server_learning_rate
+        # Server momentum of FedAvgM
+        self.momentum = momentum
+        # Decay rates of the first and second moments of FedAdam
+        self.beta_1 = beta_1
+        self.beta_2 = beta_2
+        # Adaptivity of FedAdam, it keeps the update bounded when the second moment is close to 0
+        self.tau = tau
+        # Weight of the proximal term of FedProx, sent to the clients. 0 trains as FedAvg
+        self.proximal_mu = proximal_mu
+
+    def __str__(self):
+        return "Aggregation config:\n--Strategy: {}\n--Server learning rate: {}\n--Momentum: {}\n--Beta 1: {}\n--Beta 2: {}\n" \
+               "--Tau: {}\n--Proximal mu: {}\n".format(
+                self.strategy,
+                self.server_learning_rate,
+                self.momentum,
+                self.beta_1,
+                self.beta_2,
+                self.tau,
+                self.proximal_mu)
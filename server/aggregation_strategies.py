@@ -0,0 +1,11 @@
+from .fed_adam_strategy import FedAdamStrategy
+from .fed_avg_m_strategy import FedAvgMStrategy
+from .fed_avg_strategy import FedAvgStrategy
+
+
+def create_aggregation_strategy(aggregation_config):
+    if aggregation_config.strategy == 'fedavgm':
+        return FedAvgMStrategy(aggregation_config)
+    elif aggregation_config.strategy == 'fedadam':
+        return FedAdamStrategy(aggregation_config)
+    return FedAvgStrategy()
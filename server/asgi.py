@@ -0,0 +1,10 @@
+from asgiref.wsgi import WsgiToAsgi
+
+from . import create_app
+from .process_lock import acquire_process_lock
+
+# ASGI entry point of the central node, the Flask app runs in the thread pool of the ASGI server:
+#   uvicorn server.asgi:app --workers 1
+# Other workers fail at startup, the state of the central node is kept in the memory of the process
+acquire_process_lock()
+app = WsgiToAsgi(create_app())
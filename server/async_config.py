@@ -0,0 +1,22 @@
+class AsyncConfig:
+    def __init__(self, buffer_size=3, staleness_exponent=0.5, max_staleness=10, server_learning_rate=1., versions=20):
+        # Updates of the clients merged into every new version of the global model
+        self.buffer_size = buffer_size
+        # Updates are weighted by 1 / (1 + staleness) ^ staleness_exponent, staleness being the number of versions
+        # of the global model created since the version the client trained on
+        self.staleness_exponent = staleness_exponent
+        # Updates that are more stale than this are discarded
+        self.max_staleness = max_staleness
+        # Step size applied to the average update of every buffer
+        self.server_learning_rate = server_learning_rate
+        # Versions of the global model created before the asynchronous training stops
+        self.versions = versions
+
+    def __str__(self):
+        return "Async config:\n--Buffer size: {}\n--Staleness exponent: {}\n--Max staleness: {}\n--Server learning rate: {}\n" \
+               "--Versions: {}\n".format(
+                self.buffer_size,
+                self.staleness_exponent,
+                self.max_staleness,
+                self.server_learning_rate,
+                self.versions)
@@ -0,0 +1,17 @@
+class CheckpointConfig:
+    def __init__(self, path=None, interval=1, versions=3):
+        # Folder of the checkpoints, None disables checkpointing
+        self.path = path
+        # The global models are saved every this number of rounds
+        self.interval = interval
+        # Checkpoints of every model that are kept, older ones are deleted
+        self.versions = versions
+
+    def is_enabled(self):
+        return self.path is not None
+
+    def __str__(self):
+        return "Checkpoint config:\n--Path: {}\n--Interval: {}\n--Versions: {}\n".format(
+            self.path,
+            self.interval,
+            self.versions)
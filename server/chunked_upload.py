@@ -0,0 +1,191 @@
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+
+import numpy as np
+
+from .tensor_codec import ALIGNMENT, BINARY_CONTENT_TYPE, decode, read_header, read_into
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)$')
+DIGEST_ALGORITHM = 'sha-256='
+# Bytes allowed for the scalar fields of an upload (client url, round, samples, compression settings...)
+MAX_FIELDS_SIZE = 64 * 1024
+# Every param can be sent with its value and its index (top k sparsification), as float32 and int32 tensors
+MAX_PARAM_SIZE = 8
+# Longest JSON number with its separator and the brackets of nested lists, e.g. '-1.1754943508222875e-38, '
+MAX_JSON_NUMBER_SIZE = 32
+
+
+# Model params sent in chunks. The upload is addressed by the SHA-256 of the whole payload, and every chunk carries
+# the SHA-256 of its own bytes. Chunks are sent in order, and memory is allocated as they arrive. Binary payloads
+# with the params of the model as float32 tensors are decoded while they are received: once the header arrives,
+# the bytes of every tensor are read from the request stream straight into a flat buffer of the model spec, which
+# is aggregated without copying. Other payloads, like compressed params or JSON, are buffered and decoded once
+# they are complete. If a chunk is lost or corrupted the client resumes from the current offset
+class ChunkedUpload:
+    def __init__(self, upload_id, size, content_type, client_url, model_spec):
+        self.upload_id = upload_id
+        self.size = size
+        self.content_type = content_type
+        self.client_url = client_url
+        self.model_spec = model_spec
+        # Bytes received that aren't decoded into the params buffer: the header of a binary payload,
+        # or the whole payload if it's decoded once it's complete
+        self.buffer = bytearray()
+        # Header of a binary payload, read once all of it is received. Then the segments are the (start, end,
+        # bytes of the params buffer) of every tensor of the payload sorted by start, or None if it's buffered
+        self.header = None
+        self.header_read = content_type != BINARY_CONTENT_TYPE
+        self.segments = None
+        self.params_buffer = None
+        # Bytes received, the next chunk must start here
+        self.offset = 0
+        # HTTP status of the update of the model params, once the upload is complete
+        self.status = None
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.payload_hash = hashlib.sha256()
+
+    def is_complete(self):
+        return self.offset == self.size
+
+    # Returns False if the bytes received don't match the digest of the chunk, the offset is kept so it can be sent again
+    def write_chunk(self, stream, start, end, digest):
+        views = self.__get_chunk_views(start, end)
+        chunk_hash = hashlib.sha256()
+        for view in views:
+            read_into(stream, view)
+            chunk_hash.update(view)
+        self.updated_at = time.monotonic()
+        if chunk_hash.digest() != digest:
+            return False
+        for view in views:
+            self.payload_hash.update(view)
+        if self.segments is None:
+            self.buffer += views[0]
+        self.offset = end
+        if not self.header_read:
+            self.__read_header()
+        return True
+
+    def is_valid(self):
+        return self.is_complete() and self.payload_hash.hexdigest() == self.upload_id
+
+    # Fields of the complete payload, the model params of a payload decoded while it was received are views
+    # of the params buffer
+    def get_request_data(self):
+        if self.params_buffer is not None:
+            return dict(self.header['fields'],
+                        **self.model_spec.to_request_params(self.model_spec.get_views(self.params_buffer)))
+        if self.content_type == BINARY_CONTENT_TYPE:
+            return decode(self.buffer)
+        return json.loads(self.buffer)
+
+    # The payload isn't needed anymore once the model params are aggregated, only the status is kept
+    # to answer the client if it sends the upload again
+    def finish(self, status):
+        self.status = status
+        self.buffer = None
+        self.segments = None
+        self.params_buffer = None
+        self.updated_at = time.monotonic()
+
+    # Writable views where the bytes of a chunk are read: a new buffer that is added to the buffered bytes,
+    # or the bytes of the params buffer where its tensors go, and new buffers for the padding between them
+    def __get_chunk_views(self, start, end):
+        if self.segments is None:
+            return [memoryview(bytearray(end - start))]
+        views = []
+        position = start
+        for segment_start, segment_end, param_bytes in self.segments:
+            if segment_end <= position or segment_start >= end:
+                continue
+            if segment_start > position:
+                views.append(memoryview(bytearray(segment_start - position)))
+                position = segment_start
+            view_end = min(end, segment_end)
+            views.append(memoryview(param_bytes[position - segment_start:view_end - segment_start]))
+            position = view_end
+        if position < end:
+            views.append(memoryview(bytearray(end - position)))
+        return views
+
+    # Payloads that can't be decoded while they are received, because of their header or their tensors,
+    # are buffered, so decoding them once they are complete reports the error
+    def __read_header(self):
+        try:
+            header, data_offset = read_header(self.buffer)
+        except ValueError:
+            self.header_read = True
+            return
+        if header is None:
+            self.header_read = data_offset > MAX_FIELDS_SIZE
+            return
+        if len(self.buffer) < data_offset:
+            return
+        self.header_read = True
+        self.header = header
+        if 'compression' in header['fields']:
+            return
+        params_buffer = self.model_spec.create_buffer()
+        self.segments = self.__get_segments(header, data_offset, params_buffer.view(np.uint8))
+        if self.segments is None:
+            return
+        self.params_buffer = params_buffer
+        # Tensor bytes of the chunk that completed the header
+        received = bytes(self.buffer[data_offset:])
+        del self.buffer[data_offset:]
+        position = 0
+        for view in self.__get_chunk_views(data_offset, data_offset + len(received)):
+            view[:] = received[position:position + len(view)]
+            position += len(view)
+
+    # Every param of the model must be a float32 tensor of its shape, and the tensors can't overlap
+    def __get_segments(self, header, data_offset, params_bytes):
+        tensors = {(tensor['key'], tensor['index']): tensor for tensor in header['tensors']}
+        if len(tensors) != len(self.model_spec.param_shapes):
+            return None
+        segments = []
+        for i, (key, shape) in enumerate(zip(self.model_spec.param_keys, self.model_spec.param_shapes)):
+            index = self.model_spec.param_keys[:i].count(key) if self.model_spec.param_keys.count(key) > 1 else None
+            tensor = tensors.get((key, index))
+            if tensor is None or tensor['dtype'] != '<f4' or tuple(tensor['shape']) != shape \
+                    or tensor['nbytes'] != int(np.prod(shape, dtype=np.int64)) * np.dtype(np.float32).itemsize:
+                return None
+            start = data_offset + tensor['offset']
+            param_start = self.model_spec.param_offsets[i] * np.dtype(np.float32).itemsize
+            segments.append((start, start + tensor['nbytes'], params_bytes[param_start:param_start + tensor['nbytes']]))
+        segments.sort(key=lambda segment: segment[0])
+        for (_, previous_end, _), (start, _, _) in zip(segments, segments[1:]):
+            if start < previous_end:
+                return None
+        if segments[-1][1] > self.size:
+            return None
+        return segments
+
+
+# Bound of the size of an upload with the model params of a model spec
+def get_max_upload_size(model_spec, content_type):
+    if content_type == BINARY_CONTENT_TYPE:
+        return model_spec.size * MAX_PARAM_SIZE + 2 * len(model_spec.param_shapes) * ALIGNMENT + MAX_FIELDS_SIZE
+    return model_spec.size * 2 * MAX_JSON_NUMBER_SIZE + MAX_FIELDS_SIZE
+
+
+# Returns the first byte, the byte after the last one and the total size of a Content-Range header
+def parse_content_range(content_range):
+    match = CONTENT_RANGE.match(content_range or '')
+    if match is None:
+        raise ValueError('Invalid Content-Range', content_range)
+    start, last, size = (int(group) for group in match.groups())
+    if last < start:
+        raise ValueError('Invalid Content-Range', content_range)
+    return start, last + 1, size
+
+
+def parse_digest(digest):
+    if digest is None or not digest.startswith(DIGEST_ALGORITHM):
+        raise ValueError('Unsupported Digest', digest)
+    return base64.b64decode(digest[len(DIGEST_ALGORITHM):])
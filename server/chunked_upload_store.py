@@ -0,0 +1,54 @@
+import threading
+import time
+
+from .chunked_upload import ChunkedUpload, get_max_upload_size
+from .tensor_codec import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE
+
+
+# Uploads in chunks that are in progress or complete. Uploads that don't receive chunks for the expiration time
+# of the config are discarded, and complete ones are kept for the same time so the clients that didn't get
+# the response of the last chunk can ask for it again, without aggregating the model params twice
+class ChunkedUploadStore:
+    def __init__(self, upload_config):
+        self.upload_config = upload_config
+        self.uploads = {}
+        self.lock = threading.Lock()
+
+    # Returns the upload with this id, creating it if it doesn't exist
+    def create(self, upload_id, size, content_type, client_url, model_spec):
+        if content_type != BINARY_CONTENT_TYPE and content_type != JSON_CONTENT_TYPE:
+            raise ValueError('Unsupported content type', content_type)
+        if size <= 0 or size > min(self.upload_config.max_size, get_max_upload_size(model_spec, content_type)):
+            raise ValueError('Invalid upload size', size)
+        with self.lock:
+            self.__expire_uploads()
+            upload = self.uploads.get(upload_id)
+            if upload is None or upload.size != size:
+                self.__limit_client_uploads(client_url)
+                upload = ChunkedUpload(upload_id, size, content_type, client_url, model_spec)
+                self.uploads[upload_id] = upload
+            return upload
+
+    def get(self, upload_id):
+        with self.lock:
+            return self.uploads.get(upload_id)
+
+    def remove(self, upload_id):
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+
+    def __expire_uploads(self):
+        expiration_time = time.monotonic() - self.upload_config.expiration
+        for upload_id, upload in list(self.uploads.items()):
+            if upload.updated_at < expiration_time:
+                print('Upload', upload_id, 'expired')
+                del self.uploads[upload_id]
+
+    # A client only resumes its last upload, so its oldest uploads in progress are discarded to make room for a new one
+    def __limit_client_uploads(self, client_url):
+        client_uploads = sorted([upload for upload in self.uploads.values()
+                                 if upload.client_url == client_url and upload.status is None],
+                                key=lambda upload: upload.updated_at)
+        for upload in client_uploads[:max(0, len(client_uploads) - self.upload_config.max_per_client + 1)]:
+            print('Upload', upload.upload_id, 'of client', client_url, 'discarded, the client started a new one')
+            del self.uploads[upload.upload_id]
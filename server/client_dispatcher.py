@@ -0,0 +1,69 @@
+import asyncio
+import atexit
+import threading
+
+import aiohttp
+
+# Responses with these status codes are retried, the request never reached a healthy client
+RETRYABLE_STATUSES = (502, 503, 504)
+
+
+# Owns a long-lived event loop running on a background thread, and a single pooled HTTP session
+# that keeps connections to the clients alive between rounds
+class ClientDispatcher:
+    def __init__(self, config):
+        self.config = config
+        self.session = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.__run_loop, name='client-dispatcher', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    # Runs a coroutine on the dispatcher loop and waits for its result. Safe to call from any thread
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    # Schedules a coroutine on the dispatcher loop without waiting for it
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.config.connections_limit,
+                                             limit_per_host=self.config.connections_limit_per_host,
+                                             keepalive_timeout=self.config.keepalive_timeout)
+            timeout = aiohttp.ClientTimeout(total=self.config.request_timeout,
+                                            sock_connect=self.config.connect_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self.session
+
+    # Only connection failures and gateway errors are retried, since the request was never processed by the client.
+    # The response body is read before returning, so the connection goes back to the pool
+    async def request(self, method, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                async with self.get_session().request(method, url, **kwargs) as response:
+                    await response.read()
+                    if response.status not in RETRYABLE_STATUSES or attempt >= self.config.retries:
+                        return response
+                    print('Request', method, url, 'failed with status', response.status, ', retrying...')
+            except aiohttp.ClientConnectorError as e:
+                if attempt >= self.config.retries:
+                    raise e
+                print('Request', method, url, 'failed with error', e, ', retrying...')
+            await asyncio.sleep(self.config.retry_backoff * 2 ** attempt)
+            attempt += 1
+
+    async def __close_session(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def close(self):
+        if self.loop.is_running():
+            self.run(self.__close_session())
+            self.loop.call_soon_threadsafe(self.loop.stop)
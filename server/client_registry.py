@@ -0,0 +1,119 @@
+import time
+
+from collections import OrderedDict
+
+from .client_training_status import ClientTrainingStatus
+from .training_client import TrainingClient
+
+
+# Registered clients, indexed by status so the state of the network and of the current round is known without
+# scanning the clients. Every change of status goes through set_status, which keeps the clients of every status
+# and the status counters of the participants of the round. Clients are also kept in order of their last heartbeat,
+# so the clients that stopped sending them are found at the front and evicted without scanning the rest.
+# Not thread safe, the server calls it holding its lock
+class ClientRegistry:
+    def __init__(self, heartbeat_ttl=None):
+        # Seconds without heartbeats before a client is evicted, None disables the eviction
+        self.heartbeat_ttl = heartbeat_ttl
+        self.clients = OrderedDict()
+        self.status_clients = {}
+        # Client urls of the participants of the round, in order of selection
+        self.round_participants = {}
+        self.round_status_counts = {}
+        # Ids are never reused, even after a client is unregistered
+        self.next_client_id = 1
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __contains__(self, client_url):
+        return client_url in self.clients
+
+    def get(self, client_url):
+        return self.clients[client_url]
+
+    def values(self):
+        return self.clients.values()
+
+    # Registers a client, or updates it if it's already registered. Returns the client
+    def register(self, client_url, accepts_binary=False, downloads_models=False, client_id=None):
+        training_client = self.clients.get(client_url)
+        if training_client is None:
+            if client_id is None:
+                client_id = self.next_client_id
+            self.next_client_id = max(self.next_client_id, client_id + 1)
+            training_client = TrainingClient(client_url, client_id, accepts_binary, downloads_models)
+            self.clients[client_url] = training_client
+            self.__add_status(training_client)
+        else:
+            training_client.accepts_binary = accepts_binary
+            training_client.downloads_models = downloads_models
+            self.set_status(training_client, ClientTrainingStatus.IDLE)
+        self.heartbeat(client_url)
+        return training_client
+
+    # Returns the client, or None if it wasn't registered
+    def unregister(self, client_url):
+        training_client = self.clients.pop(client_url, None)
+        if training_client is not None:
+            self.__remove_status(training_client)
+            self.round_participants.pop(client_url, None)
+        return training_client
+
+    # Returns False if the client is not registered
+    def heartbeat(self, client_url):
+        training_client = self.clients.get(client_url)
+        if training_client is None:
+            return False
+        training_client.last_heartbeat = time.monotonic()
+        self.clients.move_to_end(client_url)
+        return True
+
+    # Unregisters the clients whose last heartbeat is older than the TTL, and returns them
+    def evict_expired_clients(self):
+        evicted_clients = []
+        if self.heartbeat_ttl is None:
+            return evicted_clients
+        expiration_time = time.monotonic() - self.heartbeat_ttl
+        while len(self.clients) > 0:
+            training_client = next(iter(self.clients.values()))
+            if training_client.last_heartbeat >= expiration_time:
+                break
+            evicted_clients.append(self.unregister(training_client.client_url))
+        return evicted_clients
+
+    def set_status(self, training_client, status):
+        if training_client.status == status:
+            return
+        self.__remove_status(training_client)
+        training_client.status = status
+        self.__add_status(training_client)
+
+    def count(self, status):
+        return len(self.status_clients.get(status, ()))
+
+    # The status counters of the round start with the current status of the participants
+    def start_round(self, participants):
+        self.round_participants = dict.fromkeys(training_client.client_url for training_client in participants)
+        self.round_status_counts = {}
+        for training_client in participants:
+            self.round_status_counts[training_client.status] = self.round_status_counts.get(training_client.status, 0) + 1
+
+    # Participants that have been unregistered during the round are not counted
+    def count_round_participants(self, status=None):
+        if status is None:
+            return len(self.round_participants)
+        return self.round_status_counts.get(status, 0)
+
+    def get_round_participants(self):
+        return [self.clients[client_url] for client_url in self.round_participants]
+
+    def __add_status(self, training_client):
+        self.status_clients.setdefault(training_client.status, set()).add(training_client.client_url)
+        if training_client.client_url in self.round_participants:
+            self.round_status_counts[training_client.status] = self.round_status_counts.get(training_client.status, 0) + 1
+
+    def __remove_status(self, training_client):
+        self.status_clients[training_client.status].discard(training_client.client_url)
+        if training_client.client_url in self.round_participants:
+            self.round_status_counts[training_client.status] -= 1
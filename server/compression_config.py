@@ -0,0 +1,30 @@
+class CompressionConfig:
+    QUANTIZATIONS = [None, 'float16', 'int8']
+
+    def __init__(self, delta=False, top_k=None, quantization=None):
+        if quantization not in CompressionConfig.QUANTIZATIONS:
+            raise ValueError('Unsupported quantization', quantization)
+        # Values left out by top k are fed back into the next deltas, sparsifying whole model params would zero them
+        if top_k is not None and not delta:
+            raise ValueError('Top k compression needs delta compression')
+        # Send the difference against the model params of the round instead of the model params
+        self.delta = delta
+        # Fraction of the values with the largest magnitude that are sent, the rest are sent as zeros
+        self.top_k = top_k
+        self.quantization = quantization
+
+    def is_enabled(self):
+        return self.delta or self.top_k is not None or self.quantization is not None
+
+    def to_dict(self):
+        return {'delta': self.delta, 'top_k': self.top_k, 'quantization': self.quantization}
+
+    @staticmethod
+    def from_dict(compression):
+        return CompressionConfig(compression.get('delta', False), compression.get('top_k'), compression.get('quantization'))
+
+    def __str__(self):
+        return "Compression config:\n--Delta: {}\n--Top k: {}\n--Quantization: {}\n".format(
+            self.delta,
+            self.top_k,
+            self.quantization)
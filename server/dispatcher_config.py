@@ -0,0 +1,21 @@
+class DispatcherConfig:
+    def __init__(self, connections_limit=1000, connections_limit_per_host=4, keepalive_timeout=60,
+                 connect_timeout=5, request_timeout=600, retries=3, retry_backoff=0.5):
+        self.connections_limit = connections_limit
+        self.connections_limit_per_host = connections_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+    def __str__(self):
+        return "Dispatcher config:\n--Connections limit: {}\n--Connections limit per host: {}\n--Keep-alive timeout: {}\n" \
+               "--Connect timeout: {}\n--Request timeout: {}\n--Retries: {}\n--Retry backoff: {}\n".format(
+                self.connections_limit,
+                self.connections_limit_per_host,
+                self.keepalive_timeout,
+                self.connect_timeout,
+                self.request_timeout,
+                self.retries,
+                self.retry_backoff)
@@ -0,0 +1,115 @@
+import asyncio
+import sys
+
+import aiohttp
+
+from .federated_learning_config import FederatedLearningConfig
+from .server_status import ServerStatus
+from .tensor_codec import BINARY_CONTENT_TYPE, encode
+from .training_type import TrainingType
+from .utils import model_params_to_arrays, request_params_to_model_params
+
+# Path of the edge aggregator endpoints, the upstream server sees the edge as a client with this URL
+EDGE_PATH = '/edge'
+
+
+# Runs a central node as an edge aggregator of an upstream server. The edge registers in the upstream server
+# like a client, runs every round requested by the upstream server with its own clients, and sends back
+# a single update with the average of the model params of its clients, weighted by their number of training samples
+class EdgeAggregator:
+    def __init__(self, server, edge_url, upstream_url, heartbeat_interval=10):
+        self.server = server
+        self.client_url = edge_url + EDGE_PATH
+        self.upstream_url = upstream_url
+        self.heartbeat_interval = heartbeat_interval
+        # Training type and round of the upstream server of the round running in the edge
+        self.upstream_round = None
+        self.server.model_params_listener = self.__send_model_params_upstream
+
+    # Registers the edge and keeps sending heartbeats to the upstream server in the dispatcher thread
+    def register(self):
+        self.server.dispatcher.run(self.__register())
+        self.server.dispatcher.submit(self.__send_heartbeats())
+
+    async def __register(self):
+        print('Registering edge aggregator in upstream server:', self.upstream_url)
+        try:
+            response = await self.server.dispatcher.request('POST', self.upstream_url + '/client',
+                                                            data={'client_url': self.client_url, 'accept': BINARY_CONTENT_TYPE})
+            if response.status != 201:
+                print('Cannot register edge aggregator in the upstream server, error:', response.reason)
+            else:
+                print('Edge aggregator registered successfully as', self.client_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print('Cannot register edge aggregator in the upstream server:', repr(e))
+        sys.stdout.flush()
+
+    # The upstream server answers 404 if it evicted the edge, or if it was restarted without its registry
+    async def __send_heartbeats(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                response = await self.server.dispatcher.request('POST', self.upstream_url + '/client/heartbeat',
+                                                                data={'client_url': self.client_url})
+                if response.status == 404:
+                    print('Edge aggregator is not registered in the upstream server anymore')
+                    await self.__register()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print('Cannot send heartbeat to the upstream server:', repr(e))
+
+    # Starts a round with the clients of the edge, using the model params and config sent by the upstream server.
+    # Returns False if the edge is still busy with a previous round
+    def start_training(self, request_data):
+        training_type = request_data['training_type']
+        if training_type == TrainingType.GOSSIP_MNIST or training_type == TrainingType.ASYNC_MNIST:
+            raise ValueError('Training type not supported by edge aggregators', training_type)
+        model_params = request_params_to_model_params(training_type, request_data)
+        with self.server.lock:
+            if self.server.status != ServerStatus.IDLE:
+                print('Training requested by the upstream server but the edge status is', self.server.status)
+                return False
+            if model_params is not None:
+                self.server.set_model_params(training_type, model_params)
+            self.upstream_round = training_type, request_data.get('round')
+            if len(self.server.client_registry) == 0:
+                # Nothing to aggregate, the upstream server doesn't need to wait for the edge
+                print("There aren't any clients registered in the edge aggregator")
+                self.__send_model_params_upstream(training_type, self.server.get_model_params(training_type), 0.)
+                return True
+        federated_learning_config = FederatedLearningConfig(request_data['learning_rate'], request_data['epochs'],
+                                                            request_data['batch_size'], request_data.get('proximal_mu', 0.))
+        print('Round', request_data.get('round'), 'of the upstream server started in the edge aggregator')
+        self.server.dispatcher.submit(self.__start_round(training_type, federated_learning_config))
+        return True
+
+    # If the edge can't start the round (e.g. its model stopped early or all its clients were evicted)
+    # an empty update is sent, so the upstream server doesn't wait for the edge
+    async def __start_round(self, training_type, federated_learning_config):
+        if not await self.server.start_training(training_type, federated_learning_config):
+            with self.server.lock:
+                print('Round of the upstream server could not be started in the edge aggregator')
+                self.__send_model_params_upstream(training_type, self.server.get_model_params(training_type), 0.)
+
+    # Called holding the lock of the server, the upload runs in the dispatcher thread
+    def __send_model_params_upstream(self, training_type, model_params, weight):
+        if self.upstream_round is None or self.upstream_round[0] != training_type:
+            return
+        round = self.upstream_round[1]
+        self.upstream_round = None
+        request_body = model_params_to_arrays(training_type, model_params)
+        request_body['client_url'] = self.client_url
+        request_body['training_type'] = training_type
+        request_body['round'] = round
+        request_body['samples'] = weight
+        self.server.dispatcher.submit(self.__upload(encode(request_body), round, weight))
+
+    async def __upload(self, request_data, round, weight):
+        print('Sending model params of', weight, 'training samples to the upstream server for round', round)
+        try:
+            response = await self.server.dispatcher.request('PUT', self.upstream_url + '/model_params', data=request_data,
+                                                            headers={'Content-Type': BINARY_CONTENT_TYPE})
+            if response.status != 200:
+                print('Error updating upstream model params. Error:', response.reason)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print('Cannot send model params to the upstream server:', repr(e))
+        sys.stdout.flush()
@@ -0,0 +1,27 @@
+class EvaluationConfig:
+    def __init__(self, path=None, mnist_path=None, chest_x_ray_path=None, batch_size=256, patience=None, min_delta=0.001):
+        # Folder of the cached validation sets, None disables the evaluation of the global models
+        self.path = path
+        # Folder of MNIST_SAMPLE, it's downloaded if it's None
+        self.mnist_path = mnist_path
+        # Folder of the Chest X-Ray dataset, the Chest X-Ray model isn't evaluated if it's None
+        self.chest_x_ray_path = chest_x_ray_path
+        # Validation images run through the model at once
+        self.batch_size = batch_size
+        # Training of a model stops after this number of evaluations without improving its best accuracy, None never stops it
+        self.patience = patience
+        # Minimum increase of the accuracy that counts as an improvement
+        self.min_delta = min_delta
+
+    def is_enabled(self):
+        return self.path is not None
+
+    def __str__(self):
+        return "Evaluation config:\n--Path: {}\n--MNIST path: {}\n--Chest X-Ray path: {}\n--Batch size: {}\n--Patience: {}\n" \
+               "--Min delta: {}\n".format(
+                self.path,
+                self.mnist_path,
+                self.chest_x_ray_path,
+                self.batch_size,
+                self.patience,
+                self.min_delta)
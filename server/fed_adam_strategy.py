@@ -0,0 +1,37 @@
+import numpy as np
+
+
+# FedAdam: the difference between the average of the clients and the current model is used as a pseudo-gradient
+# of an Adam optimizer on the server. Everything is computed in place on the flat buffer of the accumulator,
+# which becomes the new model params
+class FedAdamStrategy:
+    def __init__(self, aggregation_config):
+        self.aggregation_config = aggregation_config
+        self.first_moment = None
+        self.second_moment = None
+        # Scratch buffer for the scaled updates, so no temporary arrays of the size of the model are allocated
+        self.scaled_update = None
+
+    def aggregate(self, flat_params, model_params_accumulator):
+        config = self.aggregation_config
+        average_params = model_params_accumulator.average()
+        if self.first_moment is None or self.first_moment.shape != average_params.shape:
+            self.first_moment = np.zeros(average_params.shape, dtype=average_params.dtype)
+            self.second_moment = np.full(average_params.shape, config.tau ** 2, dtype=average_params.dtype)
+            self.scaled_update = np.empty_like(average_params)
+        # The average becomes the update: average - current
+        np.subtract(average_params, flat_params, out=average_params)
+        self.first_moment *= config.beta_1
+        np.multiply(average_params, 1 - config.beta_1, out=self.scaled_update)
+        self.first_moment += self.scaled_update
+        np.square(average_params, out=average_params)
+        self.second_moment *= config.beta_2
+        np.multiply(average_params, 1 - config.beta_2, out=self.scaled_update)
+        self.second_moment += self.scaled_update
+        # New model params: current + server learning rate * first moment / (sqrt(second moment) + tau)
+        np.sqrt(self.second_moment, out=average_params)
+        average_params += config.tau
+        np.divide(self.first_moment, average_params, out=average_params)
+        average_params *= config.server_learning_rate
+        average_params += flat_params
+        return average_params
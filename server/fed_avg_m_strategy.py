@@ -0,0 +1,23 @@
+import numpy as np
+
+
+# FedAvg with server momentum (FedAvgM): the difference between the average of the clients and the current model
+# is used as a pseudo-gradient, accumulated in a momentum buffer. Everything is computed in place on the flat buffer
+# of the accumulator, which becomes the new model params
+class FedAvgMStrategy:
+    def __init__(self, aggregation_config):
+        self.aggregation_config = aggregation_config
+        self.velocity = None
+
+    def aggregate(self, flat_params, model_params_accumulator):
+        average_params = model_params_accumulator.average()
+        if self.velocity is None or self.velocity.shape != average_params.shape:
+            self.velocity = np.zeros(average_params.shape, dtype=average_params.dtype)
+        # The average becomes the update: average - current
+        np.subtract(average_params, flat_params, out=average_params)
+        self.velocity *= self.aggregation_config.momentum
+        self.velocity += average_params
+        # New model params: current + server learning rate * velocity
+        np.multiply(self.velocity, self.aggregation_config.server_learning_rate, out=average_params)
+        average_params += flat_params
+        return average_params
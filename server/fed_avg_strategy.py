@@ -0,0 +1,4 @@
+# Average of the model params of the clients, weighted by their number of training samples
+class FedAvgStrategy:
+    def aggregate(self, flat_params, model_params_accumulator):
+        return model_params_accumulator.average()
@@ -0,0 +1,72 @@
+import threading
+import time
+from contextlib import contextmanager
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+SUMMARY = 'summary'
+
+
+# Minimal in-process metrics registry, exported in the Prometheus text format.
+# Summaries only keep the count and the sum of the observed values
+class Metrics:
+    def __init__(self, prefix='fl_'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.types = {}
+        self.descriptions = {}
+        self.values = {}
+
+    def increment(self, name, value=1, description=None, **labels):
+        with self.lock:
+            key = self.__get_key(COUNTER, name, description, labels)
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, description=None, **labels):
+        with self.lock:
+            key = self.__get_key(GAUGE, name, description, labels)
+            self.values[key] = value
+
+    def observe(self, name, value, description=None, **labels):
+        with self.lock:
+            key = self.__get_key(SUMMARY, name, description, labels)
+            count, total = self.values.get(key, (0, 0.))
+            self.values[key] = (count + 1, total + value)
+
+    # Observes the seconds spent in the block
+    @contextmanager
+    def time(self, name, description=None, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, description, **labels)
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name in sorted(self.types):
+                metric_name = self.prefix + name
+                if self.descriptions.get(name) is not None:
+                    lines.append('# HELP {} {}'.format(metric_name, self.descriptions[name]))
+                lines.append('# TYPE {} {}'.format(metric_name, self.types[name]))
+                for (key_name, labels), value in sorted(self.values.items()):
+                    if key_name != name:
+                        continue
+                    if self.types[name] == SUMMARY:
+                        lines.append('{}_count{} {}'.format(metric_name, self.__format_labels(labels), value[0]))
+                        lines.append('{}_sum{} {}'.format(metric_name, self.__format_labels(labels), value[1]))
+                    else:
+                        lines.append('{}{} {}'.format(metric_name, self.__format_labels(labels), value))
+        return '\n'.join(lines) + '\n'
+
+    def __get_key(self, metric_type, name, description, labels):
+        self.types.setdefault(name, metric_type)
+        if description is not None:
+            self.descriptions.setdefault(name, description)
+        return name, tuple(sorted(labels.items()))
+
+    def __format_labels(self, labels):
+        if len(labels) == 0:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(label, str(value).replace('"', '\\"')) for label, value in labels) + '}'
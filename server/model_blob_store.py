@@ -0,0 +1,32 @@
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from .tensor_codec import encode
+
+
+# Model params sent to the clients, serialized once with the binary codec and addressed by their SHA-256.
+# Blobs are immutable, so the clients can cache them by hash and the same model is never encoded twice.
+# Only the last versions are kept
+class ModelBlobStore:
+    def __init__(self, versions=4):
+        self.versions = versions
+        self.blobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Returns the descriptor of the blob, sent to the clients instead of the model params
+    def put(self, model_request_params):
+        blob = encode(model_request_params)
+        model_hash = hashlib.sha256(blob).hexdigest()
+        with self.lock:
+            self.blobs[model_hash] = blob
+            self.blobs.move_to_end(model_hash)
+            while len(self.blobs) > self.versions:
+                self.blobs.popitem(last=False)
+        print('Model blob', model_hash, 'of', len(blob), 'bytes ready to be downloaded')
+        return {'hash': model_hash, 'size': len(blob)}
+
+    def get(self, model_hash):
+        with self.lock:
+            return self.blobs.get(model_hash)
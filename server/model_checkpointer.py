@@ -0,0 +1,134 @@
+import atexit
+import json
+import os
+import shutil
+import sys
+import threading
+
+import numpy as np
+
+REGISTRY_FILE = 'registry.json'
+MANIFEST_FILE = 'manifest.json'
+ROUND_FOLDER_PREFIX = 'round-'
+TMP_SUFFIX = '.tmp'
+
+
+# Saves the global models and the client registry in a background thread, so the requests never wait for the disk.
+# Every model is saved as a folder per round with one .npy file per array, which is memory-mapped when it's loaded.
+# Saves requested while the writer is busy are coalesced, only the last model params of every model are written
+class ModelCheckpointer:
+    def __init__(self, config):
+        self.config = config
+        self.pending_models = {}
+        self.pending_registry = None
+        self.condition = threading.Condition()
+        self.closed = False
+        os.makedirs(self.config.path, exist_ok=True)
+        self.thread = threading.Thread(target=self.__run, name='model-checkpointer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # The arrays are written as they are when the writer gets to them,
+    # so the model params saved must not be updated in place afterwards
+    def save_model(self, model_name, round, arrays):
+        if round % self.config.interval != 0:
+            return
+        with self.condition:
+            self.pending_models[model_name] = (round, arrays)
+            self.condition.notify()
+
+    def save_registry(self, round, training_clients, next_client_id=None):
+        registry = {
+            'round': round,
+            'next_client_id': next_client_id,
+            'clients': [
+                {'client_url': client.client_url, 'client_id': client.client_id, 'accepts_binary': client.accepts_binary,
+                 'downloads_models': client.downloads_models}
+                for client in training_clients
+            ]
+        }
+        with self.condition:
+            self.pending_registry = registry
+            self.condition.notify()
+
+    # Returns the round and arrays of the last checkpoint of a model, or None if there isn't any
+    def load_model(self, model_name):
+        model_path = os.path.join(self.config.path, model_name)
+        rounds = self.__get_rounds(model_path)
+        if len(rounds) == 0:
+            return None
+        round_path = os.path.join(model_path, ROUND_FOLDER_PREFIX + str(rounds[-1]))
+        with open(os.path.join(round_path, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+        arrays = [np.load(os.path.join(round_path, file_name), mmap_mode='r') for file_name in manifest['files']]
+        print('Checkpoint of', model_name, 'of round', manifest['round'], 'loaded from', round_path)
+        return manifest['round'], arrays
+
+    def load_registry(self):
+        registry_path = os.path.join(self.config.path, REGISTRY_FILE)
+        if not os.path.exists(registry_path):
+            return None
+        with open(registry_path) as registry_file:
+            return json.load(registry_file)
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while len(self.pending_models) == 0 and self.pending_registry is None and not self.closed:
+                    self.condition.wait()
+                if len(self.pending_models) == 0 and self.pending_registry is None:
+                    return
+                pending_models = self.pending_models
+                pending_registry = self.pending_registry
+                self.pending_models = {}
+                self.pending_registry = None
+            try:
+                for model_name, (round, arrays) in pending_models.items():
+                    self.__write_model(model_name, round, arrays)
+                if pending_registry is not None:
+                    self.__write_registry(pending_registry)
+            except OSError as e:
+                print('Error writing checkpoint:', repr(e))
+            sys.stdout.flush()
+
+    # The files are written in a temporary folder which is renamed at the end, so a checkpoint is never half written
+    def __write_model(self, model_name, round, arrays):
+        model_path = os.path.join(self.config.path, model_name)
+        round_path = os.path.join(model_path, ROUND_FOLDER_PREFIX + str(round))
+        tmp_path = round_path + TMP_SUFFIX
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        files = []
+        for i, array in enumerate(arrays):
+            file_name = '{}.npy'.format(i)
+            np.save(os.path.join(tmp_path, file_name), np.asarray(array))
+            files.append(file_name)
+        with open(os.path.join(tmp_path, MANIFEST_FILE), 'w') as manifest_file:
+            json.dump({'round': round, 'files': files}, manifest_file)
+        shutil.rmtree(round_path, ignore_errors=True)
+        os.rename(tmp_path, round_path)
+        for old_round in self.__get_rounds(model_path)[:-self.config.versions]:
+            shutil.rmtree(os.path.join(model_path, ROUND_FOLDER_PREFIX + str(old_round)), ignore_errors=True)
+        print('Checkpoint of', model_name, 'of round', round, 'saved at', round_path)
+
+    def __write_registry(self, registry):
+        registry_path = os.path.join(self.config.path, REGISTRY_FILE)
+        with open(registry_path + TMP_SUFFIX, 'w') as registry_file:
+            json.dump(registry, registry_file)
+        os.replace(registry_path + TMP_SUFFIX, registry_path)
+
+    def __get_rounds(self, model_path):
+        if not os.path.isdir(model_path):
+            return []
+        rounds = []
+        for folder in os.listdir(model_path):
+            if folder.startswith(ROUND_FOLDER_PREFIX) and not folder.endswith(TMP_SUFFIX):
+                rounds.append(int(folder[len(ROUND_FOLDER_PREFIX):]))
+        return sorted(rounds)
+
+    # Writes the pending checkpoints before the process exits
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,95 @@
+import atexit
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from .validation_set import ValidationSet
+
+# Probabilities are clipped so the loss of a wrong prediction made with full confidence is finite
+EPSILON = 1e-7
+
+
+# Evaluates the global models against their validation sets in a background thread, so the rounds never wait for it.
+# Models are given with the reader of their validation set and their predict function, which are run in batches.
+# Evaluations requested while the evaluator is busy are coalesced, only the last version of every model is evaluated.
+# Every result is sent to the listener with the model name, round, accuracy, loss and whether the accuracy plateaued
+class ModelEvaluator:
+    def __init__(self, config, models, results_listener):
+        self.config = config
+        self.models = models
+        self.results_listener = results_listener
+        self.validation_sets = {}
+        # Best accuracy of every model and evaluations since it was reached, for early stopping
+        self.best_accuracies = {}
+        self.evaluations_without_improvement = {}
+        self.pending_models = {}
+        self.condition = threading.Condition()
+        self.closed = False
+        self.thread = threading.Thread(target=self.__run, name='model-evaluator', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # The arrays are read when the evaluator gets to them, so they must not be updated in place afterwards
+    def evaluate(self, model_name, round, arrays):
+        if model_name not in self.models:
+            return
+        with self.condition:
+            self.pending_models[model_name] = round, arrays
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def __run(self):
+        while True:
+            with self.condition:
+                while len(self.pending_models) == 0 and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                pending_models = self.pending_models
+                self.pending_models = {}
+            for model_name, (round, arrays) in pending_models.items():
+                try:
+                    evaluation_start = time.perf_counter()
+                    accuracy, loss = self.__evaluate(model_name, arrays)
+                    print('Model', model_name, 'of round', round, 'evaluated in', time.perf_counter() - evaluation_start,
+                          'seconds, accuracy:', accuracy, ', loss:', loss)
+                    self.results_listener(model_name, round, accuracy, loss, self.__has_plateaued(model_name, accuracy))
+                except (OSError, ValueError, ImportError, RuntimeError) as e:
+                    print('Model', model_name, 'of round', round, 'cannot be evaluated:', repr(e))
+                sys.stdout.flush()
+
+    def __evaluate(self, model_name, arrays):
+        validation_set = self.__get_validation_set(model_name)
+        predict = self.models[model_name][1]
+        arrays = [np.asarray(array, dtype=np.float32) for array in arrays]
+        correct_count = 0
+        loss_sum = 0.
+        for start in range(0, len(validation_set.images), self.config.batch_size):
+            labels = validation_set.labels[start:start + self.config.batch_size]
+            probabilities = predict(arrays, validation_set.images[start:start + self.config.batch_size])
+            correct_count += int((probabilities.argmax(axis=1) == labels).sum())
+            loss_sum += float(-np.log(np.clip(probabilities[np.arange(len(labels)), labels], EPSILON, 1.)).sum())
+        return round(correct_count / len(validation_set.labels), 4), round(loss_sum / len(validation_set.labels), 4)
+
+    def __get_validation_set(self, model_name):
+        if model_name not in self.validation_sets:
+            reader = self.models[model_name][0]
+            self.validation_sets[model_name] = ValidationSet(os.path.join(self.config.path, model_name), reader, self.config)
+        return self.validation_sets[model_name]
+
+    def __has_plateaued(self, model_name, accuracy):
+        if self.config.patience is None:
+            return False
+        if accuracy >= self.best_accuracies.get(model_name, 0.) + self.config.min_delta:
+            self.best_accuracies[model_name] = accuracy
+            self.evaluations_without_improvement[model_name] = 0
+            return False
+        self.evaluations_without_improvement[model_name] = self.evaluations_without_improvement.get(model_name, 0) + 1
+        return self.evaluations_without_improvement[model_name] >= self.config.patience
@@ -0,0 +1,28 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Mean of the ImageNet images in BGR order, subtracted by keras.applications.vgg16.preprocess_input
+VGG16_MEAN_BGR = [103.939, 116.779, 123.68]
+
+
+# Class probabilities of a batch of MNIST images for the linear model, column 1 is the probability of a 3
+def predict_mnist(arrays, images):
+    weights, bias = arrays
+    inputs = np.asarray(images, dtype=np.float32).reshape(len(images), -1) / 255
+    probabilities = 1 / (1 + np.exp(-(inputs @ weights + bias)))
+    return np.concatenate([1 - probabilities, probabilities], axis=1)
+
+
+# Class probabilities of a batch of Chest X-Ray images for the Keras model of the clients
+# (Conv2D 32, MaxPool, Conv2D 64, MaxPool, Flatten, Dense 2 softmax), run with torch from its weights.
+# Keras keeps the images channels last and the kernels as (height, width, in, out)
+def predict_chest_x_ray(arrays, images):
+    kernel_1, bias_1, kernel_2, bias_2, dense_kernel, dense_bias = [torch.from_numpy(np.asarray(array)) for array in arrays]
+    with torch.no_grad():
+        inputs = torch.from_numpy(np.asarray(images, dtype=np.float32)).flip(3) - torch.tensor(VGG16_MEAN_BGR)
+        outputs = inputs.permute(0, 3, 1, 2)
+        outputs = F.max_pool2d(F.relu(F.conv2d(outputs, kernel_1.permute(3, 2, 0, 1), bias_1, padding=1)), 2)
+        outputs = F.max_pool2d(F.relu(F.conv2d(outputs, kernel_2.permute(3, 2, 0, 1), bias_2, padding=1)), 2)
+        outputs = outputs.permute(0, 2, 3, 1).reshape(len(images), -1)
+        return torch.softmax(outputs @ dense_kernel + dense_bias, dim=1).numpy()
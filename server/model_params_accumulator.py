@@ -0,0 +1,35 @@
+import numpy as np
+
+
+# Keeps a running weighted sum of the model params received from the clients, as flat buffers of the whole model,
+# so every upload is folded into the aggregate with one vectorized operation and dropped right away
+class ModelParamsAccumulator:
+    def __init__(self):
+        self.params_sum = None
+        # Weighted params of the last upload, reused so uploads don't allocate a buffer of the size of the model
+        self.weighted_params = None
+        self.total_weight = 0.
+        self.updates_count = 0
+
+    def add(self, flat_params, weight=1.):
+        if self.params_sum is None:
+            self.params_sum = np.zeros(flat_params.shape, dtype=np.float32)
+        elif self.params_sum.shape != flat_params.shape:
+            raise ValueError('Model params of a different model', flat_params.shape)
+        if weight == 1.:
+            np.add(self.params_sum, flat_params, out=self.params_sum)
+        else:
+            if self.weighted_params is None:
+                self.weighted_params = np.empty_like(self.params_sum)
+            np.multiply(flat_params, weight, out=self.weighted_params)
+            np.add(self.params_sum, self.weighted_params, out=self.params_sum)
+        self.total_weight += weight
+        self.updates_count += 1
+
+    def is_empty(self):
+        return self.updates_count == 0
+
+    # The average is computed in place, the accumulator must not be used afterwards
+    def average(self):
+        np.divide(self.params_sum, self.total_weight, out=self.params_sum)
+        return self.params_sum
@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+
+from .compression_config import CompressionConfig
+
+QUANTIZED_DTYPES = {None: np.float32, 'float16': np.float16, 'int8': np.int8}
+INT8_MAX = 127
+
+
+# Compresses a list of arrays into request fields. Each array can be sent as a delta against base_arrays,
+# sparsified to its top k values and quantized. When residuals are given (error feedback) they are added
+# before compressing, and the new residuals (what was lost by the compression) are returned.
+# Sparsification and error feedback only make sense for deltas: without base arrays (e.g. the first round of a model)
+# the arrays are only quantized and the residuals are returned unchanged
+def compress(arrays, compression_config, base_arrays=None, residuals=None):
+    delta = compression_config.delta and base_arrays is not None
+    top_k = compression_config.top_k if delta else None
+    compression = dict(compression_config.to_dict(), delta=delta, top_k=top_k)
+    fields = {'compression': compression, 'shapes': [], 'values': [], 'indices': [], 'scales': []}
+    new_residuals = []
+    if not delta:
+        new_residuals = residuals
+        residuals = None
+    for i, array in enumerate(arrays):
+        array = np.asarray(array, dtype=np.float32)
+        if delta:
+            array = array - base_arrays[i]
+        if residuals is not None:
+            array = array + residuals[i]
+        flat_array = array.reshape(-1)
+
+        if top_k is not None:
+            k = min(flat_array.size, max(1, math.ceil(top_k * flat_array.size)))
+            indices = np.argpartition(np.abs(flat_array), flat_array.size - k)[flat_array.size - k:].astype(np.int32)
+            values = flat_array[indices]
+            fields['indices'].append(indices)
+        else:
+            indices = None
+            values = flat_array
+        quantized_values, scale = _quantize(values, compression_config.quantization)
+        fields['shapes'].append(list(array.shape))
+        fields['values'].append(quantized_values)
+        fields['scales'].append(scale)
+
+        if residuals is not None:
+            decompressed_array = _to_dense(_dequantize(quantized_values, scale), indices, flat_array.size)
+            new_residuals.append((flat_array - decompressed_array).reshape(array.shape))
+    return fields, new_residuals
+
+
+def decompress(fields, base_arrays=None):
+    compression_config = CompressionConfig.from_dict(fields['compression'])
+    quantized_dtype = QUANTIZED_DTYPES[compression_config.quantization]
+    arrays = []
+    for i, shape in enumerate(fields['shapes']):
+        values = _dequantize(np.asarray(fields['values'][i], dtype=quantized_dtype), fields['scales'][i])
+        indices = None
+        if compression_config.top_k is not None:
+            indices = np.asarray(fields['indices'][i], dtype=np.int64)
+        array = _to_dense(values, indices, int(np.prod(shape))).reshape(shape)
+        if compression_config.delta:
+            if base_arrays is None:
+                raise ValueError('Model params were sent as a delta but there are no base model params')
+            array = array + base_arrays[i]
+        arrays.append(array)
+    return arrays
+
+
+def get_compressed_nbytes(fields):
+    return sum(np.asarray(values).nbytes for values in fields['values']) \
+           + sum(np.asarray(indices).nbytes for indices in fields['indices'])
+
+
+def get_uncompressed_nbytes(fields):
+    return sum(int(np.prod(shape)) * np.dtype(np.float32).itemsize for shape in fields['shapes'])
+
+
+def _quantize(values, quantization):
+    if quantization == 'int8':
+        max_value = float(np.abs(values).max()) if values.size > 0 else 0.
+        scale = max_value / INT8_MAX if max_value > 0 else 1.
+        return np.clip(np.rint(values / scale), -INT8_MAX, INT8_MAX).astype(np.int8), scale
+    return values.astype(QUANTIZED_DTYPES[quantization]), 1.
+
+
+def _dequantize(values, scale):
+    return values.astype(np.float32) * np.float32(scale)
+
+
+def _to_dense(values, indices, size):
+    if indices is None:
+        return values
+    dense_values = np.zeros(size, dtype=np.float32)
+    dense_values[indices] = values
+    return dense_values
@@ -0,0 +1,106 @@
+import numpy as np
+
+
+# Declares the params of a model: their shapes, the keys of the request params they are sent in, and the default
+# federated learning config of the model. Params are laid out one after another in a single flat float32 buffer,
+# so the params of a model are allocated and copied as one contiguous array.
+# Params that share a key are sent as a list under that key, in the order of the model params
+class ModelSpec:
+    def __init__(self, name, param_shapes, param_keys, default_config, random_init=False):
+        if len(param_shapes) != len(param_keys):
+            raise ValueError('Every param of model needs a key', name)
+        self.name = name
+        self.param_shapes = [tuple(shape) for shape in param_shapes]
+        self.param_keys = list(param_keys)
+        self.default_config = default_config
+        # Models without a random init are initialized by the clients, e.g. Keras models
+        self.random_init = random_init
+        # Offset of every param in the flat buffer, and size of the buffer
+        self.param_offsets = []
+        self.size = 0
+        for shape in self.param_shapes:
+            self.param_offsets.append(self.size)
+            self.size += int(np.prod(shape, dtype=np.int64))
+
+    def create_buffer(self):
+        return np.zeros(self.size, dtype=np.float32)
+
+    # Views of the params in a flat buffer, they share its memory
+    def get_views(self, buffer):
+        return [buffer[offset:offset + int(np.prod(shape, dtype=np.int64))].reshape(shape)
+                for offset, shape in zip(self.param_offsets, self.param_shapes)]
+
+    # Params as views of a flat buffer, see to_flat_buffer
+    def to_params(self, arrays):
+        return self.get_views(self.to_flat_buffer(arrays))
+
+    # Flat buffer with the arrays of the params. Arrays that are already laid out one after another in the same buffer,
+    # like the views of a flat buffer or the tensors of a binary payload (their sizes are multiples of its alignment),
+    # are used without copying, the rest are copied into a new buffer
+    def to_flat_buffer(self, arrays):
+        arrays = [np.asarray(array, dtype=np.float32) for array in arrays]
+        self.__check_shapes(arrays)
+        buffer = self.__get_flat_view(arrays)
+        if buffer is None:
+            buffer = self.create_buffer()
+            for view, array in zip(self.get_views(buffer), arrays):
+                view[...] = array
+        return buffer
+
+    def init_params(self):
+        if not self.random_init:
+            return None
+        return self.get_views(np.random.randn(self.size).astype(np.float32))
+
+    def has_request_params(self, request_params):
+        return all(key in request_params for key in self.param_keys)
+
+    def to_request_params(self, arrays):
+        request_params = {}
+        for key, array in zip(self.param_keys, arrays):
+            if self.param_keys.count(key) > 1:
+                request_params.setdefault(key, []).append(array)
+            else:
+                request_params[key] = array
+        return request_params
+
+    # Returns the arrays of the request params as a flat list, in the order of the model params
+    def to_arrays(self, request_params):
+        arrays = []
+        for key in dict.fromkeys(self.param_keys):
+            if self.param_keys.count(key) > 1:
+                arrays.extend(request_params[key])
+            else:
+                arrays.append(request_params[key])
+        return arrays
+
+    def __check_shapes(self, arrays):
+        if len(arrays) != len(self.param_shapes):
+            raise ValueError('Unexpected number of params for model', self.name, len(arrays))
+        for array, shape in zip(arrays, self.param_shapes):
+            if array.shape != shape:
+                raise ValueError('Unexpected shape of a param of model', self.name, array.shape)
+
+    def __get_flat_view(self, arrays):
+        address = _get_address(arrays[0])
+        for array in arrays:
+            if not array.flags.c_contiguous or _get_address(array) != address:
+                return None
+            address += array.nbytes
+        # Memory the arrays were created from: a buffer of bytes, or the array that owns their data
+        owner = arrays[0]
+        while isinstance(owner.base, np.ndarray):
+            owner = owner.base
+        memory = owner if owner.base is None else owner.base
+        try:
+            memory_bytes = np.frombuffer(memory, dtype=np.uint8)
+        except (TypeError, ValueError):
+            return None
+        offset = _get_address(arrays[0]) - _get_address(memory_bytes)
+        if offset < 0 or offset + self.size * np.dtype(np.float32).itemsize > memory_bytes.nbytes:
+            return None
+        return np.frombuffer(memory, dtype=np.float32, count=self.size, offset=offset)
+
+
+def _get_address(array):
+    return array.__array_interface__['data'][0]
@@ -0,0 +1,29 @@
+import fcntl
+import os
+
+LOCK_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'server.lock')
+
+# Kept open while the process runs, the lock is released when the process exits
+_lock_file = None
+
+
+# The registered clients, the rounds and the model params are kept in the memory of the process, so the central node
+# must run in a single worker process and scale with threads. Fails at startup if more workers are configured,
+# or if another process of the central node already holds the lock
+def acquire_process_lock():
+    global _lock_file
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    if workers > 1:
+        raise RuntimeError('The central node keeps its state in memory and must run with 1 worker, WEB_CONCURRENCY is '
+                           + str(workers))
+    if _lock_file is not None:
+        return
+    os.makedirs(os.path.dirname(LOCK_PATH), exist_ok=True)
+    lock_file = open(LOCK_PATH, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError('Another process of the central node is already running, it keeps its state in memory and '
+                           'must run with 1 worker. Lock file: ' + LOCK_PATH)
+    _lock_file = lock_file
@@ -0,0 +1,8 @@
+class RegistryConfig:
+    def __init__(self, heartbeat_ttl=None):
+        # Clients that don't send a heartbeat for this number of seconds are unregistered, None keeps them forever
+        self.heartbeat_ttl = heartbeat_ttl
+
+    def __str__(self):
+        return "Registry config:\n--Heartbeat TTL: {}\n".format(
+            self.heartbeat_ttl)
@@ -0,0 +1,18 @@
+class RoundConfig:
+    def __init__(self, participation_fraction=1., quorum_fraction=1., deadline=None, late_update_weight=0.):
+        # Fraction of the registered clients that are requested to train on every round
+        self.participation_fraction = participation_fraction
+        # Fraction of the participants that must report before the central model is updated
+        self.quorum_fraction = quorum_fraction
+        # Seconds to wait for the participants before updating the central model with what was received
+        self.deadline = deadline
+        # Weight of model params received after their round was closed, 0 discards them.
+        # It's applied once per round of staleness
+        self.late_update_weight = late_update_weight
+
+    def __str__(self):
+        return "Round config:\n--Participation fraction: {}\n--Quorum fraction: {}\n--Deadline: {}\n--Late update weight: {}\n".format(
+            self.participation_fraction,
+            self.quorum_fraction,
+            self.deadline,
+            self.late_update_weight)
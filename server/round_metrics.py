@@ -0,0 +1,57 @@
+import time
+
+
+# Timings and sizes of a training round, shown in the dashboard
+class RoundMetrics:
+    def __init__(self, round, training_type, participants_count):
+        self.round = round
+        self.training_type = training_type
+        self.participants_count = participants_count
+        self.started_at = time.time()
+        self.finished_at = None
+        self.fanout_duration = None
+        self.upload_times = {}
+        self.payload_bytes = 0
+        self.decode_duration = 0.
+        self.aggregation_duration = 0.
+        # Evaluation of the global model of the round on the validation set of the central node
+        self.accuracy = None
+        self.loss = None
+
+    def add_upload(self, client_url, payload_bytes, decode_duration):
+        self.upload_times[client_url] = time.time() - self.started_at
+        self.payload_bytes += payload_bytes
+        self.decode_duration += decode_duration
+
+    def get_duration(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def get_mean_upload_time(self):
+        if len(self.upload_times) == 0:
+            return None
+        return sum(self.upload_times.values()) / len(self.upload_times)
+
+    def get_max_upload_time(self):
+        if len(self.upload_times) == 0:
+            return None
+        return max(self.upload_times.values())
+
+    def to_dict(self):
+        return {
+            'round': self.round,
+            'training_type': self.training_type,
+            'participants_count': self.participants_count,
+            'uploads_count': len(self.upload_times),
+            'started_at': self.started_at,
+            'duration': self.get_duration(),
+            'fanout_duration': self.fanout_duration,
+            'mean_upload_time': self.get_mean_upload_time(),
+            'max_upload_time': self.get_max_upload_time(),
+            'payload_bytes': self.payload_bytes,
+            'decode_duration': self.decode_duration,
+            'aggregation_duration': self.aggregation_duration,
+            'accuracy': self.accuracy,
+            'loss': self.loss
+        }
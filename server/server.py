@@ -1,179 +1,636 @@
 import asyncio
+import math
+import random
 import sys
+import threading
+import time
 import aiohttp
-import torch
 
-import numpy as np
+from collections import deque
 
-from .utils import model_params_to_request_params
+from .aggregation_config import AggregationConfig
+from .aggregation_strategies import create_aggregation_strategy
+from .async_config import AsyncConfig
+from .checkpoint_config import CheckpointConfig
+from .client_dispatcher import ClientDispatcher
+from .client_registry import ClientRegistry
+from .compression_config import CompressionConfig
+from .dispatcher_config import DispatcherConfig
+from .evaluation_config import EvaluationConfig
+from .tensor_codec import BINARY_CONTENT_TYPE, encode, to_json_params
+from .model_params_compression import compress, decompress, get_compressed_nbytes, get_uncompressed_nbytes
+from .utils import model_params_to_arrays, request_params_to_array_list
 from .federated_learning_config import FederatedLearningConfig
+from .metrics import Metrics
+from .model_checkpointer import ModelCheckpointer
+from .model_blob_store import ModelBlobStore
+from .model_evaluator import ModelEvaluator
+from .model_inference import predict_chest_x_ray, predict_mnist
+from .model_params_accumulator import ModelParamsAccumulator
+from .model_specs import CHEST_X_RAY_SPEC, MNIST_SPEC, MODEL_SPECS, get_model_name, get_model_spec
+from .registry_config import RegistryConfig
+from .round_config import RoundConfig
+from .round_metrics import RoundMetrics
 from .client_training_status import ClientTrainingStatus
 from .server_status import ServerStatus
-from .training_client import TrainingClient
 from .training_type import TrainingType
+from .validation_set import read_chest_x_ray_validation_set, read_mnist_validation_set
+
+
+ROUNDS_HISTORY_SIZE = 50
+# Model blobs kept for the clients that download them late, e.g. after a retry
+MODEL_BLOB_VERSIONS = 4
 
 
 class Server:
-    def __init__(self):
-        self.mnist_model_params = None
-        self.chest_x_ray_model_params = None
+    def __init__(self, dispatcher_config=None, round_config=None, upload_compression_config=None, download_compression_config=None,
+                 checkpoint_config=None, aggregation_config=None, async_config=None, registry_config=None,
+                 evaluation_config=None):
+        # Params of every model by name, views of a flat buffer laid out by the spec of the model
+        self.model_params = {}
         self.init_params()
-        self.training_clients = {}
+        registry_config = registry_config if registry_config is not None else RegistryConfig()
+        self.client_registry = ClientRegistry(registry_config.heartbeat_ttl)
         self.status = ServerStatus.IDLE
         self.round = 0
+        self.training_type = None
+        self.round_config = round_config if round_config is not None else RoundConfig()
+        self.round_quorum = 0
+        self.round_deadline_expired = False
+        self.upload_compression_config = upload_compression_config if upload_compression_config is not None else CompressionConfig()
+        self.download_compression_config = download_compression_config if download_compression_config is not None else CompressionConfig()
+        # Model params of the last rounds, as seen by the clients, used to decode the deltas they send back
+        self.round_base_params = {}
+        self.model_params_accumulator = ModelParamsAccumulator()
+        # Model params sent to the clients that download them, serialized once per round
+        self.model_blobs = ModelBlobStore(MODEL_BLOB_VERSIONS)
+        self.aggregation_config = aggregation_config if aggregation_config is not None else AggregationConfig()
+        # Strategies keep state between rounds (server momentum), so there's one per model
+        self.aggregation_strategies = {}
+        self.async_config = async_config if async_config is not None else AsyncConfig()
+        # Training request bodies of the last version of the model and versions left, for asynchronous training
+        self.async_request_bodies = None
+        self.async_versions_left = 0
+        self.metrics = Metrics()
+        self.round_metrics = None
+        self.rounds_history = deque(maxlen=ROUNDS_HISTORY_SIZE)
+        # Flask serves requests in several threads, and the dispatcher runs the rounds in its own thread,
+        # so every change of the state of the server is done holding this lock
+        self.lock = threading.RLock()
+        # Called with the training type, the new model params and their weight every time the central model is updated
+        self.model_params_listener = None
+        self.dispatcher = ClientDispatcher(dispatcher_config if dispatcher_config is not None else DispatcherConfig())
+        checkpoint_config = checkpoint_config if checkpoint_config is not None else CheckpointConfig()
+        self.checkpointer = ModelCheckpointer(checkpoint_config) if checkpoint_config.is_enabled() else None
+        if self.checkpointer is not None:
+            self.__restore_checkpoint()
+        # Models whose accuracy stopped improving, they aren't trained anymore
+        self.early_stopped_models = set()
+        evaluation_config = evaluation_config if evaluation_config is not None else EvaluationConfig()
+        self.evaluator = None
+        if evaluation_config.is_enabled():
+            evaluated_models = {MNIST_SPEC.name: (read_mnist_validation_set, predict_mnist)}
+            if evaluation_config.chest_x_ray_path is not None:
+                evaluated_models[CHEST_X_RAY_SPEC.name] = read_chest_x_ray_validation_set, predict_chest_x_ray
+            self.evaluator = ModelEvaluator(evaluation_config, evaluated_models, self.__record_evaluation)
 
+    # Models without a random init get their params from the first round of their clients
     def init_params(self):
-        if self.mnist_model_params is None:
-            weights = torch.randn((28 * 28, 1), dtype=torch.float, requires_grad=True)
-            bias = torch.randn(1, dtype=torch.float, requires_grad=True)
-            self.mnist_model_params = weights, bias
-
-    async def start_training(self, training_type):
-        if self.status != ServerStatus.IDLE:
-            print('Server is not ready for training yet, status:', self.status)
-            for training_client in self.training_clients.values():
-                print(training_client)
-        elif len(self.training_clients) == 0:
-            print("There aren't any clients registered in the system, nothing to do yet")
-        else:
+        for model_spec in set(MODEL_SPECS.values()):
+            if self.model_params.get(model_spec.name) is None:
+                self.model_params[model_spec.name] = model_spec.init_params()
+
+    # Warm start from the last checkpoint: global models, round and registered clients
+    def __restore_checkpoint(self):
+        for model_spec in set(MODEL_SPECS.values()):
+            checkpoint = self.checkpointer.load_model(model_spec.name)
+            if checkpoint is not None:
+                model_round, arrays = checkpoint
+                # Every param is memory-mapped from its own file, so they are copied into a new flat buffer
+                self.model_params[model_spec.name] = model_spec.to_params(arrays)
+                self.round = max(self.round, model_round)
+        registry = self.checkpointer.load_registry()
+        if registry is not None:
+            self.round = max(self.round, registry['round'])
+            for client in registry['clients']:
+                self.client_registry.register(client['client_url'], client['accepts_binary'], client.get('downloads_models', False),
+                                              client['client_id'])
+            self.client_registry.next_client_id = max(self.client_registry.next_client_id, registry.get('next_client_id', 1))
+            print(len(self.client_registry), 'clients restored from the registry checkpoint')
+        print('Central node restored at round', self.round)
+        sys.stdout.flush()
+
+    # Saves and evaluates the new model params of the model of a training type
+    def __handle_model_update(self, training_type):
+        model_params = self.get_model_params(training_type)
+        if self.checkpointer is None and self.evaluator is None:
+            return
+        if self.checkpointer is not None:
+            self.checkpointer.save_model(get_model_name(training_type), self.round, model_params)
+            self.__save_registry_checkpoint()
+        # The central model params are never updated in place, every update creates a new buffer
+        if self.evaluator is not None:
+            self.evaluator.evaluate(get_model_name(training_type), self.round, model_params)
+
+    # Called by the evaluator thread
+    def __record_evaluation(self, model_name, round, accuracy, loss, plateaued):
+        with self.lock:
+            for round_metrics in self.rounds_history:
+                if round_metrics.round == round and get_model_name(round_metrics.training_type) == model_name:
+                    round_metrics.accuracy = accuracy
+                    round_metrics.loss = loss
+            self.metrics.set('model_accuracy', accuracy, description='Accuracy of the global model on the validation set',
+                             model=model_name)
+            self.metrics.set('model_loss', loss, description='Loss of the global model on the validation set', model=model_name)
+            if plateaued and model_name not in self.early_stopped_models:
+                print('Accuracy of model', model_name, 'is not improving anymore, stopping its training')
+                self.early_stopped_models.add(model_name)
+                if self.training_type == TrainingType.ASYNC_MNIST and self.status == ServerStatus.CLIENTS_TRAINING \
+                        and get_model_name(self.training_type) == model_name:
+                    self.__finish_async_training()
+
+    def __save_registry_checkpoint(self):
+        if self.checkpointer is not None:
+            self.checkpointer.save_registry(self.round, self.client_registry.values(), self.client_registry.next_client_id)
+
+    # Returns False if the round couldn't be started
+    async def start_training(self, training_type, federated_learning_config=None):
+        # The state of the round is set up under the lock, the requests to the clients are sent without it
+        round_metrics, training_requests = self.__start_round(training_type, federated_learning_config)
+        if len(training_requests) > 0:
+            print('Requesting training to clients...')
+            fanout_start = time.perf_counter()
+            await asyncio.gather(*[
+                self.do_training_client_request(training_type, training_client, client_request_body)
+                for training_client, client_request_body in training_requests
+            ])
+            fanout_duration = time.perf_counter() - fanout_start
+            with self.lock:
+                round_metrics.fanout_duration = fanout_duration
+            self.metrics.observe('round_fanout_seconds', fanout_duration,
+                                 description='Time to request training to all the participants of a round')
+        sys.stdout.flush()
+        return round_metrics is not None
+
+    # Starts a new round if the server is ready, and returns its metrics and the training requests for its participants
+    def __start_round(self, training_type, federated_learning_config=None):
+        with self.lock:
+            if self.status != ServerStatus.IDLE:
+                print('Server is not ready for training yet, status:', self.status)
+                for training_client in self.client_registry.values():
+                    print(training_client)
+                return None, []
+            # Dead clients are not requested to train
+            self.__evict_expired_clients()
+            if len(self.client_registry) == 0:
+                print("There aren't any clients registered in the system, nothing to do yet")
+                return None, []
+            if training_type != TrainingType.GOSSIP_MNIST and get_model_name(training_type) in self.early_stopped_models:
+                print('Training of model', get_model_name(training_type), 'was stopped early, its accuracy is not improving')
+                return None, []
+
             # Increment training round
             # This is needed for deterministic MNIST training
             self.round += 1
+            # Late model params of previous rounds are kept in the accumulator, unless the model changes.
+            # Asynchronous training accumulates updates instead of model params
+            if training_type != self.training_type or training_type == TrainingType.ASYNC_MNIST:
+                self.model_params_accumulator = ModelParamsAccumulator()
+            self.training_type = training_type
+            participants = self.__select_round_participants()
+            self.client_registry.start_round(participants)
+            self.round_quorum = max(1, math.ceil(self.round_config.quorum_fraction * len(participants)))
+            self.round_deadline_expired = False
+            self.round_metrics = RoundMetrics(self.round, training_type, len(participants))
+            self.rounds_history.append(self.round_metrics)
+            self.metrics.increment('rounds_total', description='Training rounds started', training_type=training_type)
 
-            request_body = {}
-            federated_learning_config = None
-            if (
-                    training_type == TrainingType.MNIST
-                    or training_type == TrainingType.DETERMINISTIC_MNIST
-            ):
-                request_body = model_params_to_request_params(training_type, self.mnist_model_params)
-                federated_learning_config = FederatedLearningConfig(learning_rate=1., epochs=20, batch_size=256)
-            elif training_type == TrainingType.GOSSIP_MNIST:
-                request_body = model_params_to_request_params(training_type, None)
-                federated_learning_config = FederatedLearningConfig(learning_rate=1., epochs=20, batch_size=256)
-            elif training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
-                request_body = model_params_to_request_params(training_type, self.chest_x_ray_model_params)
-                federated_learning_config = FederatedLearningConfig(learning_rate=0.0001, epochs=1, batch_size=2)
-
-            request_body['learning_rate'] = federated_learning_config.learning_rate
-            request_body['epochs'] = federated_learning_config.epochs
-            request_body['batch_size'] = federated_learning_config.batch_size
-            request_body['training_type'] = training_type
-            request_body['round'] = self.round
+            request_bodies = self.__build_training_request_bodies(training_type, federated_learning_config, participants)
+            if training_type == TrainingType.ASYNC_MNIST:
+                # Clients that report get a new training request right away, with the last version of the model
+                self.async_request_bodies = request_bodies
+                self.async_versions_left = self.async_config.versions
 
-            if training_type == TrainingType.GOSSIP_MNIST:
-                # Send all client urls and ids to each client for decentralized learning
-                clients = [
-                    {"client_id": client.client_id, "client_url": client.client_url}
-                    for client in self.training_clients.values()
-                ]
-                request_body['clients'] = clients
-
-            print('There are', len(self.training_clients), 'clients registered')
-            tasks = []
-            for training_client in self.training_clients.values():
-                if training_type == TrainingType.DETERMINISTIC_MNIST or training_type == TrainingType.GOSSIP_MNIST:
-                    request_body['round_size'] = len(self.training_clients.values())
-                tasks.append(
-                    asyncio.ensure_future(self.do_training_client_request(training_type, training_client, request_body))
-                )
-            print('Requesting training to clients...')
+            print('There are', len(self.client_registry), 'clients registered,', len(participants), 'selected for round', self.round,
+                  'with a quorum of', self.round_quorum)
+            training_requests = []
+            client_ranks = _get_client_ranks(participants)
+            for training_client in participants:
+                client_request_body = self.__get_client_request_body(training_type, training_client, request_bodies,
+                                                                     client_ranks)
+                # Participants are marked before any request is sent, a fast client can answer before the rest are requested
+                self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_REQUESTED)
+                training_requests.append((training_client, client_request_body))
             self.status = ServerStatus.CLIENTS_TRAINING
-            await asyncio.gather(*tasks)
-        sys.stdout.flush()
+            if self.round_config.deadline is not None and training_type != TrainingType.ASYNC_MNIST:
+                asyncio.get_running_loop().call_later(self.round_config.deadline, self.__expire_round_deadline,
+                                                      training_type, self.round)
+            return self.round_metrics, training_requests
+
+    # Bodies of the training requests of the current round: with the model params inline, the same as JSON, and with
+    # the descriptor of the model blob instead of the model params. The JSON body is only built if there are clients
+    # that don't accept binary tensors, and the model blob only if there are clients that download it
+    def __build_training_request_bodies(self, training_type, federated_learning_config, participants):
+        request_body = model_params_to_arrays(training_type, self.get_model_params(training_type))
+        # Edge aggregators train with the config sent by their upstream server
+        if federated_learning_config is None:
+            default_config = get_model_spec(training_type).default_config
+            # Gossip clients average their models among themselves, there's no model of the round to stay close to
+            proximal_mu = self.aggregation_config.proximal_mu if training_type != TrainingType.GOSSIP_MNIST else 0.
+            federated_learning_config = FederatedLearningConfig(default_config.learning_rate, default_config.epochs,
+                                                                default_config.batch_size, proximal_mu)
+
+        model_request_params = {}
+        if training_type != TrainingType.GOSSIP_MNIST and len(request_body) > 0:
+            model_request_params = self.__prepare_round_model_params(training_type, request_body)
+        request_body = {}
+        if training_type != TrainingType.GOSSIP_MNIST and self.upload_compression_config.is_enabled():
+            request_body['upload_compression'] = self.upload_compression_config.to_dict()
+
+        request_body['learning_rate'] = federated_learning_config.learning_rate
+        request_body['epochs'] = federated_learning_config.epochs
+        request_body['batch_size'] = federated_learning_config.batch_size
+        if federated_learning_config.proximal_mu > 0:
+            request_body['proximal_mu'] = federated_learning_config.proximal_mu
+        request_body['training_type'] = training_type
+        request_body['round'] = self.round
+
+        if training_type == TrainingType.GOSSIP_MNIST:
+            # Send all client urls and ids to each client for decentralized learning
+            clients = [
+                {"client_id": client.client_id, "client_url": client.client_url}
+                for client in participants
+            ]
+            request_body['clients'] = clients
+
+        descriptor_request_body = None
+        if len(model_request_params) > 0 and any(training_client.downloads_models for training_client in participants):
+            descriptor_request_body = dict(request_body, model=self.model_blobs.put(model_request_params))
+        request_body.update(model_request_params)
+        json_request_body = None
+        if any(not training_client.accepts_binary for training_client in participants):
+            json_request_body = to_json_params(request_body)
+        return request_body, json_request_body, descriptor_request_body
+
+    # Every client gets its own copy of the body fields, the tensors are shared
+    def __get_client_request_body(self, training_type, training_client, request_bodies, client_ranks=None):
+        request_body, json_request_body, descriptor_request_body = request_bodies
+        if descriptor_request_body is not None and training_client.downloads_models:
+            client_request_body = descriptor_request_body
+        elif training_client.accepts_binary:
+            client_request_body = request_body
+        else:
+            client_request_body = json_request_body
+        client_request_body = dict(client_request_body, client_id=training_client.client_id)
+        if training_type == TrainingType.DETERMINISTIC_MNIST or training_type == TrainingType.GOSSIP_MNIST:
+            client_request_body['client_rank'] = client_ranks[training_client.client_id]
+            client_request_body['round_size'] = len(client_ranks)
+        return client_request_body
+
+    # Compresses the model params sent to the clients if it's enabled, and keeps them as the clients
+    # will decode them, so the deltas sent back by the clients are added to exactly the same base
+    def __prepare_round_model_params(self, training_type, request_params):
+        arrays = request_params_to_array_list(training_type, request_params)
+        if self.download_compression_config.is_enabled():
+            request_params, _ = compress(arrays, self.download_compression_config)
+            print('Model params compressed from', get_uncompressed_nbytes(request_params), 'to',
+                  get_compressed_nbytes(request_params), 'bytes for round', self.round)
+            arrays = decompress(request_params)
+        # Asynchronous training also needs them, the clients send updates of any recent version of the model
+        if self.upload_compression_config.delta or training_type == TrainingType.ASYNC_MNIST:
+            self.round_base_params[self.round] = get_model_spec(training_type).to_params(arrays)
+            # Late model params can still arrive from the previous round, or from older versions in asynchronous training
+            kept_rounds = self.async_config.max_staleness if training_type == TrainingType.ASYNC_MNIST else 1
+            for round in [round for round in self.round_base_params if round < self.round - kept_rounds]:
+                self.round_base_params.pop(round)
+        return request_params
+
+    def get_round_base_params(self, round):
+        with self.lock:
+            return self.round_base_params.get(round if round is not None else self.round)
+
+    def __select_round_participants(self):
+        training_clients = list(self.client_registry.values())
+        participants_count = max(1, math.ceil(self.round_config.participation_fraction * len(training_clients)))
+        if participants_count >= len(training_clients):
+            return training_clients
+        return random.sample(training_clients, participants_count)
+
+    # Updates the central model with the model params received so far, if the round is still open
+    def __expire_round_deadline(self, training_type, round):
+        with self.lock:
+            if self.round == round and self.status == ServerStatus.CLIENTS_TRAINING:
+                print('Deadline of round', round, 'expired')
+                self.round_deadline_expired = True
+                self.update_server_model_params(training_type)
 
     async def do_training_client_request(self, training_type, training_client, request_body):
         request_url = training_client.client_url + '/training'
         print('Requesting training to client', request_url)
-        async with aiohttp.ClientSession() as session:
-            # Ensures individual client_ids are sent to each client
-            request_body['client_id'] = training_client.client_id
-            training_client.status = ClientTrainingStatus.TRAINING_REQUESTED
-            async with session.post(request_url, json=request_body) as response:
-                if response.status != 200:
-                    print('Error requesting training to client', training_client.client_url)
-                    training_client.status = ClientTrainingStatus.TRAINING_REQUEST_ERROR
-                    self.update_server_model_params(training_type)
-                else:
-                    print('Client', training_client.client_url, 'started training')
+        with self.metrics.time('training_request_encode_seconds', description='Time to encode a training request'):
+            if training_client.accepts_binary:
+                request_kwargs = {'data': encode(request_body), 'headers': {'Content-Type': BINARY_CONTENT_TYPE}}
+            else:
+                request_kwargs = {'json': request_body}
+        try:
+            response = await self.dispatcher.request('POST', request_url, **request_kwargs)
+            response_status = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print('Error connecting to client', training_client.client_url, ':', repr(e))
+            response_status = None
+        # Clients accept the training request and run it in the background (202)
+        if response_status != 200 and response_status != 202:
+            print('Error requesting training to client', training_client.client_url)
+            with self.lock:
+                # The client could have been registered again while the request was failing
+                if training_client.status == ClientTrainingStatus.TRAINING_REQUESTED:
+                    self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_REQUEST_ERROR)
+                self.update_server_model_params(training_type)
+        else:
+            print('Client', training_client.client_url, 'started training')
 
-    def update_client_model_params(self, training_type, training_client, client_model_params):
-        print('New model params received from client', training_client.client_url)
-        training_client.model_params = client_model_params
-        training_client.status = ClientTrainingStatus.TRAINING_FINISHED
-        self.update_server_model_params(training_type)
+    # The weight is the number of training samples behind the model params, summed over the clients of an edge aggregator
+    def update_client_model_params(self, training_type, training_client, client_model_params, client_round=None, weight=1.):
+        with self.lock:
+            print('New model params received from client', training_client.client_url)
+            if client_round is None:
+                client_round = self.round
+            if training_type == TrainingType.ASYNC_MNIST:
+                self.__add_async_client_model_params(training_client, client_model_params, client_round, weight)
+                return
+            if training_client.status != ClientTrainingStatus.TRAINING_REQUESTED or client_round != self.round:
+                self.__add_late_client_model_params(training_type, training_client, client_model_params, client_round, weight)
+                return
+            aggregation_start = time.perf_counter()
+            # Edge aggregators that didn't receive anything from their clients report with weight 0
+            if weight > 0:
+                self.model_params_accumulator.add(get_model_spec(training_type).to_flat_buffer(client_model_params), weight)
+            self.round_metrics.aggregation_duration += time.perf_counter() - aggregation_start
+            self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_FINISHED)
+            self.update_server_model_params(training_type)
+
+    # The client couldn't train for its round (e.g. it was still busy with a previous one), so the round doesn't wait for it
+    def report_training_error(self, training_type, training_client, client_round):
+        with self.lock:
+            print('Client', training_client.client_url, 'could not train for round', client_round)
+            if training_client.status != ClientTrainingStatus.TRAINING_REQUESTED or client_round != self.round:
+                return
+            self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_REQUEST_ERROR)
+            self.update_server_model_params(training_type)
+
+    # Buffered asynchronous aggregation (FedBuff): the update of the client against the version of the model it trained on
+    # is added to the buffer, down-weighted by its staleness. Every buffer_size updates a new version of the model is created,
+    # and the client gets a new training request right away, without waiting for the rest of clients
+    def __add_async_client_model_params(self, training_client, client_model_params, client_round, weight):
+        if self.training_type != TrainingType.ASYNC_MNIST or self.status != ServerStatus.CLIENTS_TRAINING:
+            print('Asynchronous training is not running, discarding model params from client', training_client.client_url)
+            return
+        staleness = self.round - client_round
+        base_arrays = self.round_base_params.get(client_round)
+        if staleness > self.async_config.max_staleness or base_arrays is None:
+            print('Model params of version', client_round, 'from client', training_client.client_url, 'are too stale, discarding them')
+        elif weight > 0:
+            aggregation_start = time.perf_counter()
+            staleness_weight = weight / (1 + staleness) ** self.async_config.staleness_exponent
+            model_spec = get_model_spec(TrainingType.ASYNC_MNIST)
+            self.model_params_accumulator.add(model_spec.to_flat_buffer(client_model_params) - model_spec.to_flat_buffer(base_arrays),
+                                              staleness_weight)
+            self.round_metrics.aggregation_duration += time.perf_counter() - aggregation_start
+            print('Update of version', client_round, 'from client', training_client.client_url, 'added with staleness', staleness)
+        self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_FINISHED)
+
+        if self.model_params_accumulator.updates_count >= self.async_config.buffer_size:
+            self.__merge_async_updates()
+        if self.status == ServerStatus.CLIENTS_TRAINING:
+            client_request_body = self.__get_client_request_body(TrainingType.ASYNC_MNIST, training_client,
+                                                                 self.async_request_bodies)
+            self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_REQUESTED)
+            self.dispatcher.submit(self.do_training_client_request(TrainingType.ASYNC_MNIST, training_client, client_request_body))
+        sys.stdout.flush()
+
+    # Creates a new version of the model with the average update of the buffer
+    def __merge_async_updates(self):
+        aggregation_start = time.perf_counter()
+        average_update = self.model_params_accumulator.average()
+        model_spec = get_model_spec(TrainingType.ASYNC_MNIST)
+        # New version: current + server learning rate * average update, computed in the buffer of the accumulator
+        average_update *= self.async_config.server_learning_rate
+        average_update += model_spec.to_flat_buffer(self.model_params[model_spec.name])
+        self.model_params[model_spec.name] = model_spec.get_views(average_update)
+        self.model_params_accumulator = ModelParamsAccumulator()
+        aggregation_duration = time.perf_counter() - aggregation_start
+        self.round_metrics.aggregation_duration += aggregation_duration
+        self.metrics.observe('aggregation_seconds', aggregation_duration, description='Time to update the central model params')
+        self.__handle_model_update(TrainingType.ASYNC_MNIST)
+        self.__finish_round_metrics()
+        print('Version', self.round, 'of the model created from asynchronous updates')
+
+        self.async_versions_left -= 1
+        if self.async_versions_left <= 0:
+            self.__finish_async_training()
+            return
+        self.round += 1
+        participants = self.__get_round_participants()
+        self.round_metrics = RoundMetrics(self.round, TrainingType.ASYNC_MNIST, len(participants))
+        self.rounds_history.append(self.round_metrics)
+        self.metrics.increment('rounds_total', description='Training rounds started', training_type=TrainingType.ASYNC_MNIST)
+        self.async_request_bodies = self.__build_training_request_bodies(TrainingType.ASYNC_MNIST, None, participants)
+
+    def __finish_async_training(self):
+        print('Asynchronous training finished at version', self.round)
+        self.status = ServerStatus.IDLE
+        self.async_request_bodies = None
+        for training_client in self.__get_round_participants():
+            self.client_registry.set_status(training_client, ClientTrainingStatus.IDLE)
+
+    def record_client_upload(self, training_client, client_round, payload_bytes, decode_duration):
+        with self.lock:
+            self.metrics.increment('upload_bytes_total', payload_bytes, description='Bytes of model params received from clients')
+            self.metrics.observe('upload_decode_seconds', decode_duration, description='Time to decode model params received from a client')
+            if self.round_metrics is not None and (client_round is None or client_round == self.round):
+                self.round_metrics.add_upload(training_client.client_url, payload_bytes, decode_duration)
+                self.metrics.observe('client_upload_time_seconds', self.round_metrics.upload_times[training_client.client_url],
+                                     description='Time from the start of the round until a client sends its model params')
+
+    def __finish_round_metrics(self):
+        self.round_metrics.finished_at = time.time()
+        self.metrics.observe('round_seconds', self.round_metrics.get_duration(), description='Duration of training rounds',
+                             training_type=self.round_metrics.training_type)
+
+    # Model params of a round that is already closed are added to the next update of the central model,
+    # down-weighted by their staleness, or discarded
+    def __add_late_client_model_params(self, training_type, training_client, client_model_params, client_round, weight=1.):
+        late_update_weight = weight * self.round_config.late_update_weight ** max(1, self.round - client_round)
+        if late_update_weight > 0 and training_type == self.training_type:
+            print('Model params of round', client_round, 'from client', training_client.client_url,
+                  'received late, adding them with weight', late_update_weight)
+            self.model_params_accumulator.add(get_model_spec(training_type).to_flat_buffer(client_model_params), late_update_weight)
+        else:
+            print('Model params of round', client_round, 'from client', training_client.client_url, 'received late, discarding them')
+        sys.stdout.flush()
 
     # Forces the round to finish. This is used for Gossip training
     # since no parameters will be sent back to the server
     # so the server needs to know when the round is finished
     def finish_round(self, training_type, training_client):
-        training_client.status = ClientTrainingStatus.TRAINING_FINISHED
-
-        if self.can_update_central_model_params() and training_type == TrainingType.GOSSIP_MNIST:
-            self.status = ServerStatus.IDLE
-            for training_client in self.training_clients.values():
-                training_client.status = ClientTrainingStatus.IDLE
-        sys.stdout.flush()
+        with self.lock:
+            self.client_registry.set_status(training_client, ClientTrainingStatus.TRAINING_FINISHED)
+            self.update_server_model_params(training_type)
+            sys.stdout.flush()
 
     def update_server_model_params(self, training_type):
-        if self.can_update_central_model_params():
-            print('Updating global model params')
-            self.status = ServerStatus.UPDATING_MODEL_PARAMS
-            if training_type == TrainingType.MNIST or training_type == TrainingType.DETERMINISTIC_MNIST:
-                received_weights = []
-                received_biases = []
-                for training_client in self.training_clients.values():
-                    if training_client.status == ClientTrainingStatus.TRAINING_FINISHED:
-                        received_weights.append(training_client.model_params[0])
-                        received_biases.append(training_client.model_params[1])
-                        training_client.status = ClientTrainingStatus.IDLE
-                new_weights = torch.stack(received_weights).mean(0)
-                new_bias = torch.stack(received_biases).mean(0)
-                self.mnist_model_params = new_weights, new_bias
-                print('Model weights for', training_type, 'updated in central model')
-            elif training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
-                received_weights = []
-                for training_client in self.training_clients.values():
-                    if training_client.status == ClientTrainingStatus.TRAINING_FINISHED:
-                        training_client.status = ClientTrainingStatus.IDLE
-                        received_weights.append(training_client.model_params)
-                new_weights = np.stack(received_weights).mean(0)
-                self.chest_x_ray_model_params = new_weights
-                print('Model weights for', TrainingType.CHEST_X_RAY_PNEUMONIA, 'updated in central model')
-            self.status = ServerStatus.IDLE
-        sys.stdout.flush()
+        with self.lock:
+            if training_type == TrainingType.GOSSIP_MNIST:
+                # Gossip training doesn't have a central model, the round just finishes
+                if self.status == ServerStatus.CLIENTS_TRAINING and self.can_update_central_model_params():
+                    self.__finish_gossip_round()
+                return
+            if training_type == TrainingType.ASYNC_MNIST:
+                # Asynchronous training stops earlier if no client can train anymore
+                if self.status == ServerStatus.CLIENTS_TRAINING and self.training_type == TrainingType.ASYNC_MNIST and \
+                        self.client_registry.count_round_participants(ClientTrainingStatus.TRAINING_REQUESTED) == 0:
+                    self.__finish_async_training()
+                return
+            if self.status == ServerStatus.CLIENTS_TRAINING and self.can_update_central_model_params():
+                print('Updating global model params')
+                self.status = ServerStatus.UPDATING_MODEL_PARAMS
+                for training_client in self.__get_round_participants():
+                    if training_client.status == ClientTrainingStatus.TRAINING_REQUESTED:
+                        # Model params of stragglers will be handled as late updates
+                        print('Client', training_client.client_url, 'did not report on time for round', self.round)
+                        self.client_registry.set_status(training_client, ClientTrainingStatus.IDLE)
+                    elif training_client.status == ClientTrainingStatus.TRAINING_FINISHED:
+                        self.client_registry.set_status(training_client, ClientTrainingStatus.IDLE)
+                aggregation_start = time.perf_counter()
+                aggregated_weight = self.model_params_accumulator.total_weight
+                model_updated = not self.model_params_accumulator.is_empty()
+                if not model_updated:
+                    print('No model params received from clients, keeping current central model')
+                else:
+                    model_spec = get_model_spec(training_type)
+                    # Models without a random init are created from the first average of their clients
+                    model_params = self.model_params.get(model_spec.name)
+                    if model_params is None:
+                        flat_params = self.model_params_accumulator.average()
+                    else:
+                        flat_params = self.__get_aggregation_strategy(training_type).aggregate(
+                            model_spec.to_flat_buffer(model_params), self.model_params_accumulator)
+                    # The buffer of the accumulator becomes the new model params, a new accumulator is created below
+                    self.model_params[model_spec.name] = model_spec.get_views(flat_params)
+                    print('Model weights for', training_type, 'updated in central model')
+                self.model_params_accumulator = ModelParamsAccumulator()
+                aggregation_duration = time.perf_counter() - aggregation_start
+                if model_updated:
+                    self.__handle_model_update(training_type)
+                else:
+                    self.__save_registry_checkpoint()
+                self.round_metrics.aggregation_duration += aggregation_duration
+                self.metrics.observe('aggregation_seconds', aggregation_duration, description='Time to update the central model params')
+                self.__finish_round_metrics()
+                self.status = ServerStatus.IDLE
+                if self.model_params_listener is not None:
+                    self.model_params_listener(training_type, self.get_model_params(training_type), aggregated_weight)
+            sys.stdout.flush()
+
+    def __finish_gossip_round(self):
+        self.__finish_round_metrics()
+        self.status = ServerStatus.IDLE
+        for training_client in self.__get_round_participants():
+            self.client_registry.set_status(training_client, ClientTrainingStatus.IDLE)
+        self.__save_registry_checkpoint()
 
+    def __get_aggregation_strategy(self, training_type):
+        model_name = get_model_name(training_type)
+        if model_name not in self.aggregation_strategies:
+            self.aggregation_strategies[model_name] = create_aggregation_strategy(self.aggregation_config)
+        return self.aggregation_strategies[model_name]
+
+    # Gossip training doesn't have a central model, the clients keep their own model params
+    def get_model_params(self, training_type):
+        with self.lock:
+            if training_type == TrainingType.GOSSIP_MNIST:
+                return None
+            return self.model_params.get(get_model_name(training_type))
+
+    def set_model_params(self, training_type, model_params):
+        with self.lock:
+            if training_type == TrainingType.GOSSIP_MNIST:
+                raise ValueError('Unsupported training type', training_type)
+            model_spec = get_model_spec(training_type)
+            self.model_params[model_spec.name] = model_spec.to_params(model_params)
+
+    # The central model can be updated when every participant of the round has reported,
+    # when the quorum has been reached, or when the deadline of the round has expired
     def can_update_central_model_params(self):
-        for training_client in self.training_clients.values():
-            if training_client.status != ClientTrainingStatus.TRAINING_FINISHED \
-                    and training_client.status != ClientTrainingStatus.TRAINING_REQUEST_ERROR:
-                return False
-        return True
-
-    def register_client(self, client_url):
-        print('Registering new training client [', client_url, ']')
-        if self.training_clients.get(client_url) is None:
-            next_client_id = len(self.training_clients) + 1
-            self.training_clients[client_url] = TrainingClient(client_url, next_client_id)
-        else:
-            print('Client [', client_url, '] was already registered in the system')
-            self.training_clients.get(client_url).status = ClientTrainingStatus.IDLE
-        sys.stdout.flush()
+        with self.lock:
+            finished_count = self.client_registry.count_round_participants(ClientTrainingStatus.TRAINING_FINISHED)
+            pending_count = self.client_registry.count_round_participants() - finished_count \
+                - self.client_registry.count_round_participants(ClientTrainingStatus.TRAINING_REQUEST_ERROR)
+            return pending_count == 0 or finished_count >= self.round_quorum or self.round_deadline_expired
+
+    # Participants that have been unregistered during the round are ignored
+    def __get_round_participants(self):
+        return self.client_registry.get_round_participants()
+
+    def get_rounds_history(self):
+        with self.lock:
+            return list(self.rounds_history)
+
+    def get_training_client(self, client_url):
+        with self.lock:
+            return self.client_registry.get(client_url)
+
+    # Copy of the registered clients, so they can be iterated while other requests register or unregister clients
+    def get_training_clients(self):
+        with self.lock:
+            return dict(self.client_registry.clients)
+
+    def register_client(self, client_url, accepts_binary=False, downloads_models=False):
+        with self.lock:
+            print('Registering new training client [', client_url, ']')
+            if client_url in self.client_registry:
+                print('Client [', client_url, '] was already registered in the system')
+            self.client_registry.register(client_url, accepts_binary, downloads_models)
+            self.__save_registry_checkpoint()
+            sys.stdout.flush()
 
     def unregister_client(self, client_url):
-        print('Unregistering client [', client_url, ']')
-        try:
-            self.training_clients.pop(client_url)
-            print('Client [', client_url, '] unregistered successfully')
-        except KeyError:
-            print('Client [', client_url, '] is not registered yet')
-        sys.stdout.flush()
+        with self.lock:
+            print('Unregistering client [', client_url, ']')
+            if self.client_registry.unregister(client_url) is not None:
+                print('Client [', client_url, '] unregistered successfully')
+                self.__save_registry_checkpoint()
+                # The round doesn't wait for the client anymore
+                self.update_server_model_params(self.training_type)
+            else:
+                print('Client [', client_url, '] is not registered yet')
+            sys.stdout.flush()
+
+    # Returns False if the client is not registered, it has to register again
+    def heartbeat(self, client_url):
+        with self.lock:
+            self.__evict_expired_clients()
+            return self.client_registry.heartbeat(client_url)
+
+    def __evict_expired_clients(self):
+        evicted_clients = self.client_registry.evict_expired_clients()
+        if len(evicted_clients) == 0:
+            return
+        for training_client in evicted_clients:
+            print('Client [', training_client.client_url, '] evicted, no heartbeats received in', self.client_registry.heartbeat_ttl,
+                  'seconds')
+        self.metrics.increment('evicted_clients_total', len(evicted_clients), description='Clients evicted for not sending heartbeats')
+        self.__save_registry_checkpoint()
+        self.update_server_model_params(self.training_type)
 
     def can_do_training(self):
-        for training_client in self.training_clients.values():
-            if training_client.status != ClientTrainingStatus.IDLE \
-                    and training_client.status != ClientTrainingStatus.TRAINING_REQUEST_ERROR:
-                return False
+        with self.lock:
+            return self.client_registry.count(ClientTrainingStatus.IDLE) \
+                + self.client_registry.count(ClientTrainingStatus.TRAINING_REQUEST_ERROR) == len(self.client_registry)
 
-        return True
 
+# Position of every participant of a round sorted by client id, from 0 to the number of participants - 1.
+# Client ids have gaps once clients are unregistered, clients use their rank to get their own MNIST shard
+def _get_client_ranks(participants):
+    return {training_client.client_id: rank
+            for rank, training_client in enumerate(sorted(participants, key=lambda training_client: training_client.client_id))}
@@ -13,7 +13,7 @@
             })
         })
             .then((response) => {
-                if (response.status === 200) {
+                if (response.status === 202) {
                     console.log('Training started');
                 }
             })
@@ -47,6 +47,11 @@
         $ctrl.gossipMnistTrainingButton.addEventListener('click', () => {
             launchTraining(this, 'GOSSIP_MNIST');
         }, false);
+
+        $ctrl.asyncMnistTrainingButton = document.getElementById('asyncMnistTrainingButton')
+        $ctrl.asyncMnistTrainingButton.addEventListener('click', () => {
+            launchTraining(this, 'ASYNC_MNIST');
+        }, false);
     }
 
     init();
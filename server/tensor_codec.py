@@ -0,0 +1,131 @@
+import json
+import struct
+
+import numpy as np
+
+BINARY_CONTENT_TYPE = 'application/x-fl-tensors'
+JSON_CONTENT_TYPE = 'application/json'
+
+# Binary layout:
+#   magic (4 bytes) | header length (uint32 LE) | JSON header | padding | raw little-endian tensor buffers
+# The header keeps the scalar fields of the request plus the dtype, shape and offset of every tensor.
+# Every tensor buffer starts on an ALIGNMENT boundary so it can be wrapped without copying.
+MAGIC = b'FLT1'
+ALIGNMENT = 64
+PREFIX = struct.Struct('<4sI')
+
+
+def encode(fields):
+    header = {'fields': {}, 'tensors': []}
+    buffers = []
+    offset = 0
+    for key, value in fields.items():
+        if isinstance(value, np.ndarray):
+            offset = _add_tensor(header, buffers, offset, key, None, value)
+        elif _is_tensor_list(value):
+            for index, item in enumerate(value):
+                offset = _add_tensor(header, buffers, offset, key, index, item)
+        else:
+            header['fields'][key] = value
+
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_end = PREFIX.size + len(header_bytes)
+    chunks = [PREFIX.pack(MAGIC, len(header_bytes)), header_bytes, bytes(_align(header_end) - header_end)]
+    chunks.extend(buffers)
+    return b''.join(chunks)
+
+
+def decode(buffer):
+    header, data_offset = read_header(buffer)
+    if header is None:
+        raise ValueError('Incomplete binary payload, the header is truncated')
+    if len(buffer) < data_offset + max([tensor['offset'] + tensor['nbytes'] for tensor in header['tensors']], default=0):
+        raise ValueError('Incomplete binary payload, the tensors are truncated')
+
+    fields = header['fields']
+    for tensor in header['tensors']:
+        dtype = np.dtype(tensor['dtype'])
+        count = tensor['nbytes'] // dtype.itemsize
+        if count == 0:
+            array = np.empty(tensor['shape'], dtype=dtype)
+        else:
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_offset + tensor['offset'])
+            array = array.reshape(tensor['shape'])
+        if tensor['index'] is None:
+            fields[tensor['key']] = array
+        else:
+            fields.setdefault(tensor['key'], []).append(array)
+    return fields
+
+
+# Returns the header of a binary payload and the offset where its tensor buffers start,
+# or None and the number of bytes needed to read the header if the buffer doesn't have all of it yet
+def read_header(buffer):
+    view = memoryview(buffer)
+    if len(view) < PREFIX.size:
+        return None, PREFIX.size
+    magic, header_length = PREFIX.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError('Invalid binary payload, unexpected magic', magic)
+    data_offset = _align(PREFIX.size + header_length)
+    if len(view) < PREFIX.size + header_length:
+        return None, data_offset
+    header = json.loads(bytes(view[PREFIX.size:PREFIX.size + header_length]).decode('utf-8'))
+    return header, data_offset
+
+
+# Reads a request body straight into a preallocated writable buffer,
+# so decoded tensors can be used (and updated in place) without extra copies
+def read_into_buffer(stream, content_length):
+    if content_length is None:
+        return bytearray(stream.read())
+    buffer = bytearray(content_length)
+    read_into(stream, memoryview(buffer))
+    return buffer
+
+
+# Fills a writable view with the next bytes of a stream
+def read_into(stream, view):
+    bytes_read = 0
+    while bytes_read < len(view):
+        chunk_size = stream.readinto(view[bytes_read:])
+        if not chunk_size:
+            raise ValueError('Incomplete binary payload, expected', len(view), 'bytes and got', bytes_read)
+        bytes_read += chunk_size
+
+
+def to_json_params(fields):
+    json_params = {}
+    for key, value in fields.items():
+        if isinstance(value, np.ndarray):
+            json_params[key] = value.tolist()
+        elif _is_tensor_list(value):
+            json_params[key] = [item.tolist() for item in value]
+        else:
+            json_params[key] = value
+    return json_params
+
+
+def _add_tensor(header, buffers, offset, key, index, value):
+    array = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder('<'))
+    aligned_offset = _align(offset)
+    if aligned_offset > offset:
+        buffers.append(bytes(aligned_offset - offset))
+    header['tensors'].append({
+        'key': key,
+        'index': index,
+        'dtype': array.dtype.str,
+        'shape': list(value.shape),
+        'offset': aligned_offset,
+        'nbytes': array.nbytes
+    })
+    buffers.append(array.reshape(-1).view(np.uint8))
+    return aligned_offset + array.nbytes
+
+
+def _is_tensor_list(value):
+    return isinstance(value, (list, tuple)) and len(value) > 0 and all(isinstance(item, np.ndarray) for item in value)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
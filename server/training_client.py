@@ -2,11 +2,15 @@ from .client_training_status import ClientTrainingStatus
 
 
 class TrainingClient:
-    def __init__(self, client_url, client_id):
+    def __init__(self, client_url, client_id, accepts_binary=False, downloads_models=False):
         self.client_url = client_url
+        self.accepts_binary = accepts_binary
+        # The client gets the descriptor of the model in the training requests and downloads it from /models
+        self.downloads_models = downloads_models
         self.status = ClientTrainingStatus.IDLE
-        self.model_params = None
         self.client_id = client_id
+        # Monotonic time of the last heartbeat or registration of the client
+        self.last_heartbeat = None
 
 
     def __str__(self):
@@ -0,0 +1,15 @@
+class UploadConfig:
+    def __init__(self, expiration=600, max_size=2 ** 30, max_per_client=2):
+        # Seconds that an upload in chunks is kept without receiving any chunk, or after it's complete
+        self.expiration = expiration
+        # Uploads bigger than this number of bytes are rejected, as well as uploads bigger than the model params
+        # of their training type can be encoded in
+        self.max_size = max_size
+        # Uploads in progress of every client, the oldest one is discarded when a client starts one more
+        self.max_per_client = max_per_client
+
+    def __str__(self):
+        return "Upload config:\n--Expiration: {}\n--Max size: {}\n--Max per client: {}\n".format(
+            self.expiration,
+            self.max_size,
+            self.max_per_client)
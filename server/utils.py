@@ -1,48 +1,43 @@
-import torch
 import numpy as np
-from fastai.torch_core import to_np
 
-from .training_type import TrainingType
+from .model_params_compression import decompress, get_compressed_nbytes, get_uncompressed_nbytes
+from .model_specs import get_model_spec
+from .tensor_codec import to_json_params
 
 
 def model_params_to_request_params(training_type, model_params):
+    return to_json_params(model_params_to_arrays(training_type, model_params))
+
+
+def model_params_to_arrays(training_type, model_params):
     if model_params is None:
         return {}
-    if (
-            training_type == TrainingType.MNIST
-            or training_type == TrainingType.DETERMINISTIC_MNIST
-            or training_type == TrainingType.GOSSIP_MNIST
-    ):
-        numpy_params = to_np(model_params)
-        return {'weights': numpy_params[0].tolist(), 'bias': numpy_params[1].tolist()}
-    elif training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
-        weights_array = []
-        for i, weights in enumerate(model_params):
-            print('model params SHAPE:', weights.shape)
-            weights_array.append(np.array(weights).tolist())
-        return {'weights': weights_array}
-    else:
-        raise ValueError('Unsupported training type', training_type)
-
-
-def request_params_to_model_params(training_type, request_data):
-    model_params = None
-    if training_type == TrainingType.MNIST or training_type == TrainingType.DETERMINISTIC_MNIST:
-        weights = torch.tensor(np.array(request_data['weights']), dtype=torch.float, requires_grad=True)
-        bias = torch.tensor(np.array(request_data['bias']), dtype=torch.float, requires_grad=True)
-        model_params = weights, bias
-    elif training_type == TrainingType.CHEST_X_RAY_PNEUMONIA:
-        if 'weights' in request_data:
-            weights_array = []
-            weights_received = request_data['weights']
-            print('Weights received length:', len(weights_received))
-            for weights in weights_received:
-                numpy_weights_array = np.array(weights)
-                print('model weights SHAPE:', numpy_weights_array.shape)
-                weights_array.append(np.array(weights))
-            model_params = weights_array
-        else:
-            print('No weights found in the request')
-            return None
+    return get_model_spec(training_type).to_request_params([np.asarray(param) for param in model_params])
+
+
+# Returns the arrays of the request params as a flat list, in the order of the model params
+def request_params_to_array_list(training_type, request_params):
+    return get_model_spec(training_type).to_arrays(request_params)
+
+
+def array_list_to_request_params(training_type, arrays):
+    return get_model_spec(training_type).to_request_params(arrays)
+
+
+# Accepts both JSON request data (nested lists) and decoded binary request data (numpy arrays).
+# Returns the model params as views of a flat buffer. The tensors of a binary payload are already laid out
+# like the flat buffer, so they are used without copying
+def request_params_to_model_params(training_type, request_data, base_model_params=None):
+    model_spec = get_model_spec(training_type)
+
+    # Compressed model params can be sent as deltas against the base model params of their round
+    if 'compression' in request_data:
+        print('Compressed model params received,', get_compressed_nbytes(request_data), 'bytes instead of',
+              get_uncompressed_nbytes(request_data))
+        request_data = model_spec.to_request_params(decompress(request_data, base_model_params))
+    if not model_spec.has_request_params(request_data):
+        print('No model params found in the request')
+        return None
+    model_params = model_spec.to_params(model_spec.to_arrays(request_data))
     print('Model params received length:', len(model_params))
     return model_params
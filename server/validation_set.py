@@ -0,0 +1,65 @@
+import glob
+import os
+import sys
+
+import numpy as np
+
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.npy'
+TMP_SUFFIX = '.tmp'
+CHEST_X_RAY_CLASSES = ['PNEUMONIA', 'NORMAL']
+CHEST_X_RAY_IMAGE_SIZE = (224, 224)
+
+
+# Validation images and labels of a model, decoded once with a reader and saved as .npy files in the cache folder,
+# which are memory-mapped on later runs
+class ValidationSet:
+    def __init__(self, cache_path, reader, evaluation_config):
+        if not os.path.isfile(os.path.join(cache_path, IMAGES_FILE)) or not os.path.isfile(os.path.join(cache_path, LABELS_FILE)):
+            print('Building validation set cache at', cache_path)
+            sys.stdout.flush()
+            images, labels = reader(evaluation_config)
+            self.__save(cache_path, images, labels)
+        self.images = np.load(os.path.join(cache_path, IMAGES_FILE), mmap_mode='r')
+        self.labels = np.load(os.path.join(cache_path, LABELS_FILE))
+        print('Validation set loaded from', cache_path, 'with', len(self.images), 'images')
+
+    # Written to temporary files first, so a half written cache is never loaded
+    def __save(self, cache_path, images, labels):
+        os.makedirs(cache_path, exist_ok=True)
+        for file_name, array in [(IMAGES_FILE, images), (LABELS_FILE, labels)]:
+            with open(os.path.join(cache_path, file_name + TMP_SUFFIX), 'wb') as array_file:
+                np.save(array_file, array)
+            os.replace(os.path.join(cache_path, file_name + TMP_SUFFIX), os.path.join(cache_path, file_name))
+
+
+# Images of 3 and 7 of the validation split of MNIST_SAMPLE, labeled 1 and 0 like the clients do
+def read_mnist_validation_set(evaluation_config):
+    from PIL import Image
+    dataset_path = evaluation_config.mnist_path
+    if dataset_path is None:
+        from fastai.data.external import untar_data, URLs
+        dataset_path = untar_data(URLs.MNIST_SAMPLE)
+    images = []
+    labels = []
+    for digit, label in [('3', 1), ('7', 0)]:
+        image_paths = sorted(glob.glob(os.path.join(str(dataset_path), 'valid', digit, '*')))
+        images.extend(np.asarray(Image.open(image_path)) for image_path in image_paths)
+        labels.extend([label] * len(image_paths))
+    return np.stack(images).astype(np.uint8), np.asarray(labels, dtype=np.int64)
+
+
+# Images of the test split of the Chest X-Ray dataset, resized as the clients do
+def read_chest_x_ray_validation_set(evaluation_config):
+    from PIL import Image
+    if evaluation_config.chest_x_ray_path is None:
+        raise ValueError('Chest X-Ray dataset path is not configured')
+    images = []
+    labels = []
+    for label, a_class in enumerate(CHEST_X_RAY_CLASSES):
+        image_paths = sorted(glob.glob(os.path.join(evaluation_config.chest_x_ray_path, 'test', a_class, '*')))
+        for image_path in image_paths:
+            image = Image.open(image_path).convert('RGB').resize(CHEST_X_RAY_IMAGE_SIZE, Image.NEAREST)
+            images.append(np.asarray(image, dtype=np.uint8))
+        labels.extend([label] * len(image_paths))
+    return np.stack(images), np.asarray(labels, dtype=np.int64)
@@ -0,0 +1,8 @@
+from . import create_app
+from .process_lock import acquire_process_lock
+
+# WSGI entry point of the central node, for servers like gunicorn:
+#   gunicorn server.wsgi:app --workers 1 --threads 32
+# Other workers fail at startup, the state of the central node is kept in the memory of the process
+acquire_process_lock()
+app = create_app()
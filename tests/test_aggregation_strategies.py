@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from server.aggregation_config import AggregationConfig
+from server.aggregation_strategies import create_aggregation_strategy
+from server.fed_adam_strategy import FedAdamStrategy
+from server.fed_avg_m_strategy import FedAvgMStrategy
+from server.fed_avg_strategy import FedAvgStrategy
+from server.model_params_accumulator import ModelParamsAccumulator
+
+
+def create_accumulator(*params):
+    accumulator = ModelParamsAccumulator()
+    for flat_params in params:
+        accumulator.add(np.array(flat_params, dtype=np.float32))
+    return accumulator
+
+
+def test_create_aggregation_strategy():
+    assert isinstance(create_aggregation_strategy(AggregationConfig()), FedAvgStrategy)
+    assert isinstance(create_aggregation_strategy(AggregationConfig('fedavgm')), FedAvgMStrategy)
+    assert isinstance(create_aggregation_strategy(AggregationConfig('fedadam')), FedAdamStrategy)
+    with pytest.raises(ValueError):
+        AggregationConfig('fedsgd')
+
+
+def test_fed_avg():
+    flat_params = np.array([0., 0.], dtype=np.float32)
+
+    new_params = FedAvgStrategy().aggregate(flat_params, create_accumulator([1., 2.], [3., 6.]))
+
+    np.testing.assert_allclose(new_params, [2., 4.])
+
+
+def test_fed_avg_m():
+    strategy = FedAvgMStrategy(AggregationConfig('fedavgm', server_learning_rate=0.5, momentum=0.9))
+    flat_params = np.array([1., 2.], dtype=np.float32)
+
+    # Round 1: update = [2, 4] - [1, 2] = [1, 2], velocity = [1, 2], params = [1, 2] + 0.5 * [1, 2]
+    new_params = strategy.aggregate(flat_params, create_accumulator([1., 3.], [3., 5.]))
+    np.testing.assert_allclose(new_params, [1.5, 3.])
+    np.testing.assert_allclose(strategy.velocity, [1., 2.])
+
+    # Round 2: update = [1.5, 2] - [1.5, 3] = [0, -1], velocity = 0.9 * [1, 2] + [0, -1] = [0.9, 0.8],
+    # params = [1.5, 3] + 0.5 * [0.9, 0.8]
+    new_params = strategy.aggregate(new_params.copy(), create_accumulator([1.5, 2.]))
+    np.testing.assert_allclose(new_params, [1.95, 3.4], rtol=1e-6)
+    np.testing.assert_allclose(strategy.velocity, [0.9, 0.8], rtol=1e-6)
+
+
+def test_fed_avg_m_without_momentum_is_fed_avg():
+    strategy = FedAvgMStrategy(AggregationConfig('fedavgm', server_learning_rate=1., momentum=0.))
+    flat_params = np.array([5., -5.], dtype=np.float32)
+
+    for client_params in [[1., 1.], [2., 3.]]:
+        flat_params = strategy.aggregate(flat_params, create_accumulator(client_params)).copy()
+        np.testing.assert_allclose(flat_params, client_params, rtol=1e-6)
+
+
+def test_fed_adam():
+    config = AggregationConfig('fedadam', server_learning_rate=0.1, beta_1=0.9, beta_2=0.99, tau=0.001)
+    strategy = FedAdamStrategy(config)
+    flat_params = np.array([1., 2.], dtype=np.float32)
+
+    # Round 1: update = [0.5, -1]
+    # first moment = 0.1 * [0.5, -1] = [0.05, -0.1]
+    # second moment = 0.99 * tau^2 + 0.01 * [0.25, 1] = [0.00250099, 0.01000099]
+    # params = [1, 2] + 0.1 * first moment / (sqrt(second moment) + tau)
+    new_params = strategy.aggregate(flat_params, create_accumulator([1.5, 1.]))
+    second_moment = np.array([0.99e-6 + 0.0025, 0.99e-6 + 0.01])
+    expected_params = np.array([1., 2.]) + 0.1 * np.array([0.05, -0.1]) / (np.sqrt(second_moment) + 0.001)
+    np.testing.assert_allclose(strategy.first_moment, [0.05, -0.1], rtol=1e-6)
+    np.testing.assert_allclose(strategy.second_moment, second_moment, rtol=1e-6)
+    np.testing.assert_allclose(new_params, expected_params, rtol=1e-5)
+
+    # Round 2: no update, the moments decay and keep moving the params
+    flat_params = new_params.copy()
+    new_params = strategy.aggregate(flat_params, create_accumulator(flat_params))
+    first_moment = 0.9 * np.array([0.05, -0.1])
+    second_moment = 0.99 * second_moment
+    expected_params = flat_params + 0.1 * first_moment / (np.sqrt(second_moment) + 0.001)
+    np.testing.assert_allclose(strategy.first_moment, first_moment, rtol=1e-6)
+    np.testing.assert_allclose(new_params, expected_params, rtol=1e-5)
+
+
+def test_strategies_reuse_the_buffer_of_the_accumulator():
+    for strategy in [FedAvgStrategy(), FedAvgMStrategy(AggregationConfig('fedavgm')),
+                     FedAdamStrategy(AggregationConfig('fedadam'))]:
+        accumulator = create_accumulator([1., 2.], [3., 4.])
+
+        new_params = strategy.aggregate(np.zeros(2, dtype=np.float32), accumulator)
+
+        assert new_params is accumulator.params_sum
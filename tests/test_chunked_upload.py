@@ -0,0 +1,245 @@
+import base64
+import hashlib
+import io
+import json
+
+import numpy as np
+import pytest
+
+from server import create_app
+from server.chunked_upload import ChunkedUpload, get_max_upload_size, parse_content_range, parse_digest
+from server.chunked_upload_store import ChunkedUploadStore
+from server.compression_config import CompressionConfig
+from server.model_params_compression import compress
+from server.model_specs import CHEST_X_RAY_SPEC, MNIST_SPEC
+from server.tensor_codec import BINARY_CONTENT_TYPE, JSON_CONTENT_TYPE, encode, to_json_params
+from server.training_type import TrainingType
+from server.upload_config import UploadConfig
+
+CLIENT_URL = 'http://client:5001'
+
+
+def create_arrays(model_spec, seed=0):
+    random_generator = np.random.default_rng(seed)
+    return [random_generator.standard_normal(shape).astype(np.float32) for shape in model_spec.param_shapes]
+
+
+def create_fields(model_spec, arrays):
+    return dict(model_spec.to_request_params(arrays), client_url=CLIENT_URL, training_type=TrainingType.MNIST, round=1,
+                samples=10)
+
+
+def get_digest(chunk):
+    return hashlib.sha256(chunk).digest()
+
+
+def send_chunks(upload, payload, chunk_size):
+    for start in range(0, len(payload), chunk_size):
+        chunk = payload[start:start + chunk_size]
+        assert upload.write_chunk(io.BytesIO(chunk), start, start + len(chunk), get_digest(chunk))
+
+
+def test_parse_content_range():
+    assert parse_content_range('bytes 0-99/1000') == (0, 100, 1000)
+    assert parse_content_range('bytes 900-999/1000') == (900, 1000, 1000)
+
+
+@pytest.mark.parametrize('content_range', [None, '', 'bytes 10-5/1000', 'bytes 0-99', 'items 0-99/1000', 'bytes -1-99/1000'])
+def test_parse_invalid_content_range(content_range):
+    with pytest.raises(ValueError):
+        parse_content_range(content_range)
+
+
+def test_parse_digest():
+    assert parse_digest('sha-256=' + base64.b64encode(get_digest(b'chunk')).decode()) == get_digest(b'chunk')
+    with pytest.raises(ValueError):
+        parse_digest('md5=abc')
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1000, 10 ** 6])
+def test_binary_upload_is_decoded_into_params_buffer(chunk_size):
+    arrays = create_arrays(MNIST_SPEC)
+    payload = encode(create_fields(MNIST_SPEC, arrays))
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+
+    send_chunks(upload, payload, chunk_size)
+
+    assert upload.is_valid()
+    assert upload.params_buffer is not None
+    # Only the header is buffered, the tensors are in the params buffer
+    assert len(upload.buffer) < 1024
+    request_data = upload.get_request_data()
+    assert request_data['client_url'] == CLIENT_URL
+    assert request_data['samples'] == 10
+    params = MNIST_SPEC.get_views(upload.params_buffer)
+    for param, array, request_param in zip(params, arrays, MNIST_SPEC.to_arrays(request_data)):
+        np.testing.assert_array_equal(param, array)
+        assert np.shares_memory(request_param, upload.params_buffer)
+
+
+def test_binary_upload_with_list_of_params():
+    arrays = create_arrays(CHEST_X_RAY_SPEC)
+    payload = encode(create_fields(CHEST_X_RAY_SPEC, arrays))
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), BINARY_CONTENT_TYPE, CLIENT_URL,
+                           CHEST_X_RAY_SPEC)
+
+    send_chunks(upload, payload, 64 * 1024 + 3)
+
+    assert upload.is_valid()
+    assert upload.params_buffer is not None
+    for param, array in zip(CHEST_X_RAY_SPEC.to_arrays(upload.get_request_data()), arrays):
+        np.testing.assert_array_equal(param, array)
+
+
+def test_corrupted_chunk_is_resumed_from_offset():
+    arrays = create_arrays(MNIST_SPEC)
+    payload = encode(create_fields(MNIST_SPEC, arrays))
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+    send_chunks(upload, payload[:1500], 500)
+
+    chunk = payload[1500:2500]
+    corrupted_chunk = bytes(len(chunk))
+    assert not upload.write_chunk(io.BytesIO(corrupted_chunk), 1500, 2500, get_digest(chunk))
+    assert upload.offset == 1500
+
+    assert upload.write_chunk(io.BytesIO(chunk), 1500, 2500, get_digest(chunk))
+    assert upload.write_chunk(io.BytesIO(payload[2500:]), 2500, len(payload), get_digest(payload[2500:]))
+    assert upload.is_valid()
+    for param, array in zip(MNIST_SPEC.to_arrays(upload.get_request_data()), arrays):
+        np.testing.assert_array_equal(param, array)
+
+
+def test_incomplete_chunk_keeps_offset():
+    payload = encode(create_fields(MNIST_SPEC, create_arrays(MNIST_SPEC)))
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+
+    with pytest.raises(ValueError):
+        upload.write_chunk(io.BytesIO(payload[:10]), 0, 100, get_digest(payload[:100]))
+    assert upload.offset == 0
+
+
+def test_compressed_upload_is_buffered():
+    arrays = create_arrays(MNIST_SPEC)
+    fields, _ = compress(arrays, CompressionConfig(quantization='float16'))
+    payload = encode(dict(fields, client_url=CLIENT_URL))
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+
+    send_chunks(upload, payload, 333)
+
+    assert upload.params_buffer is None
+    assert len(upload.buffer) == len(payload)
+    request_data = upload.get_request_data()
+    assert request_data['compression']['quantization'] == 'float16'
+    np.testing.assert_array_equal(request_data['values'][0], arrays[0].reshape(-1).astype(np.float16))
+
+
+def test_json_upload_is_buffered():
+    arrays = create_arrays(MNIST_SPEC)
+    payload = json.dumps(to_json_params(create_fields(MNIST_SPEC, arrays))).encode('utf-8')
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), JSON_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+
+    send_chunks(upload, payload, 4096)
+
+    assert upload.is_valid()
+    np.testing.assert_allclose(np.array(upload.get_request_data()['weights'], dtype=np.float32), arrays[0])
+
+
+def test_payload_with_invalid_magic_fails_to_decode():
+    payload = b'NOPE' + bytes(200)
+    upload = ChunkedUpload(hashlib.sha256(payload).hexdigest(), len(payload), BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+
+    send_chunks(upload, payload, 50)
+
+    assert upload.is_valid()
+    with pytest.raises(ValueError):
+        upload.get_request_data()
+
+
+def test_upload_size_is_limited_by_model_spec():
+    uploads = ChunkedUploadStore(UploadConfig())
+    max_size = get_max_upload_size(MNIST_SPEC, BINARY_CONTENT_TYPE)
+    assert max_size < get_max_upload_size(CHEST_X_RAY_SPEC, BINARY_CONTENT_TYPE)
+    assert max_size < get_max_upload_size(MNIST_SPEC, JSON_CONTENT_TYPE)
+
+    assert uploads.create('a', max_size, BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC).size == max_size
+    for size in [0, max_size + 1]:
+        with pytest.raises(ValueError):
+            uploads.create('b', size, BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+    with pytest.raises(ValueError):
+        uploads.create('c', 100, 'text/plain', CLIENT_URL, MNIST_SPEC)
+    with pytest.raises(ValueError):
+        ChunkedUploadStore(UploadConfig(max_size=50)).create('d', 100, BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+
+
+def test_oldest_uploads_of_client_are_discarded():
+    uploads = ChunkedUploadStore(UploadConfig(max_per_client=2))
+    for upload_id in ['a', 'b', 'c']:
+        uploads.create(upload_id, 100, BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+    uploads.create('d', 100, BINARY_CONTENT_TYPE, 'http://client:5002', MNIST_SPEC)
+
+    assert uploads.get('a') is None
+    assert uploads.get('b') is not None
+    assert uploads.get('c') is not None
+    assert uploads.get('d') is not None
+    # Resuming an upload doesn't discard any other
+    uploads.create('b', 100, BINARY_CONTENT_TYPE, CLIENT_URL, MNIST_SPEC)
+    assert uploads.get('c') is not None
+
+
+@pytest.fixture
+def app_client():
+    app = create_app({'TESTING': True, 'CHECKPOINT_PATH': None, 'EVALUATION_PATH': None})
+    test_client = app.test_client()
+    assert test_client.post('/client', data={'client_url': CLIENT_URL, 'accept': BINARY_CONTENT_TYPE}).status_code == 201
+    return test_client
+
+
+def create_upload(app_client, payload, training_type=TrainingType.MNIST):
+    upload_id = hashlib.sha256(payload).hexdigest()
+    response = app_client.post('/model_params/uploads', json={'client_url': CLIENT_URL, 'training_type': training_type,
+                                                               'upload_id': upload_id, 'size': len(payload),
+                                                               'content_type': BINARY_CONTENT_TYPE})
+    return upload_id, response
+
+
+def put_chunk(app_client, upload_id, payload, start, end, size=None):
+    chunk = payload[start:end]
+    return app_client.put('/model_params/uploads/' + upload_id, data=chunk,
+                          headers={'Content-Type': 'application/octet-stream',
+                                   'Content-Range': 'bytes {}-{}/{}'.format(start, end - 1, size or len(payload)),
+                                   'Digest': 'sha-256=' + base64.b64encode(get_digest(chunk)).decode()})
+
+
+def test_upload_route_rejects_chunks_out_of_order(app_client):
+    payload = encode(create_fields(MNIST_SPEC, create_arrays(MNIST_SPEC)))
+    upload_id, response = create_upload(app_client, payload)
+    assert response.status_code == 200
+    assert response.json == {'offset': 0, 'status': None}
+
+    response = put_chunk(app_client, upload_id, payload, 0, 1000)
+    assert response.status_code == 202
+    assert response.json['offset'] == 1000
+    # A chunk after the offset, a chunk that overlaps the bytes received, and a chunk beyond the size
+    for start, end, size in [(2000, 3000, None), (500, 1500, None), (1000, len(payload) + 10, len(payload) + 10)]:
+        response = put_chunk(app_client, upload_id, payload, start, end, size)
+        assert response.status_code == 409
+        assert response.json['offset'] == 1000
+
+    # The client resumes from the offset of the central node
+    _, response = create_upload(app_client, payload)
+    assert response.json == {'offset': 1000, 'status': None}
+    assert put_chunk(app_client, upload_id, payload, 1000, len(payload)).status_code == 200
+    # The status is kept, the model params aren't aggregated twice
+    _, response = create_upload(app_client, payload)
+    assert response.json == {'offset': len(payload), 'status': 200}
+
+
+def test_upload_route_rejects_invalid_uploads(app_client):
+    payload = encode(create_fields(MNIST_SPEC, create_arrays(MNIST_SPEC)))
+    assert create_upload(app_client, payload, 'UNKNOWN')[1].status_code == 400
+    assert create_upload(app_client, bytes(get_max_upload_size(MNIST_SPEC, BINARY_CONTENT_TYPE) + 1))[1].status_code == 400
+    assert app_client.put('/model_params/uploads/unknown', data=b'chunk').status_code == 404
+    upload_id, _ = create_upload(app_client, payload)
+    response = app_client.put('/model_params/uploads/' + upload_id, data=payload[:10],
+                              headers={'Content-Range': 'bytes 10-0/100', 'Digest': 'sha-256=AAAA'})
+    assert response.status_code == 400
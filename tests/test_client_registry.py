@@ -0,0 +1,121 @@
+import pytest
+
+import server.client_registry
+from server.client_registry import ClientRegistry
+from server.client_training_status import ClientTrainingStatus
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(server.client_registry.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def register_clients(registry, count):
+    return [registry.register('http://client:' + str(5000 + i)) for i in range(1, count + 1)]
+
+
+def test_ids_are_never_reused():
+    registry = ClientRegistry()
+    first_client, second_client = register_clients(registry, 2)
+
+    registry.unregister(second_client.client_url)
+    third_client = registry.register('http://client:5003')
+
+    assert [first_client.client_id, second_client.client_id, third_client.client_id] == [1, 2, 3]
+    assert registry.register(first_client.client_url).client_id == 1
+    assert len(registry) == 2
+    assert second_client.client_url not in registry
+    assert registry.unregister(second_client.client_url) is None
+
+
+def test_status_counters():
+    registry = ClientRegistry()
+    training_clients = register_clients(registry, 4)
+
+    registry.set_status(training_clients[0], ClientTrainingStatus.TRAINING_REQUESTED)
+    registry.set_status(training_clients[1], ClientTrainingStatus.TRAINING_REQUESTED)
+    registry.set_status(training_clients[1], ClientTrainingStatus.TRAINING_FINISHED)
+
+    assert registry.count(ClientTrainingStatus.IDLE) == 2
+    assert registry.count(ClientTrainingStatus.TRAINING_REQUESTED) == 1
+    assert registry.count(ClientTrainingStatus.TRAINING_FINISHED) == 1
+    registry.unregister(training_clients[1].client_url)
+    assert registry.count(ClientTrainingStatus.TRAINING_FINISHED) == 0
+    # Registering again resets the status of the client
+    registry.register(training_clients[0].client_url)
+    assert registry.count(ClientTrainingStatus.IDLE) == 3
+    assert registry.count(ClientTrainingStatus.TRAINING_REQUESTED) == 0
+
+
+def test_round_counters_only_count_participants():
+    registry = ClientRegistry()
+    training_clients = register_clients(registry, 4)
+    participants = training_clients[:3]
+
+    registry.start_round(participants)
+    for training_client in training_clients:
+        registry.set_status(training_client, ClientTrainingStatus.TRAINING_REQUESTED)
+    registry.set_status(participants[0], ClientTrainingStatus.TRAINING_FINISHED)
+    registry.set_status(participants[1], ClientTrainingStatus.TRAINING_REQUEST_ERROR)
+
+    assert registry.count_round_participants() == 3
+    assert registry.count_round_participants(ClientTrainingStatus.TRAINING_REQUESTED) == 1
+    assert registry.count_round_participants(ClientTrainingStatus.TRAINING_FINISHED) == 1
+    assert registry.count_round_participants(ClientTrainingStatus.TRAINING_REQUEST_ERROR) == 1
+    assert registry.count(ClientTrainingStatus.TRAINING_REQUESTED) == 2
+    # Participants unregistered during the round aren't counted anymore
+    registry.unregister(participants[2].client_url)
+    assert registry.count_round_participants() == 2
+    assert registry.count_round_participants(ClientTrainingStatus.TRAINING_REQUESTED) == 0
+    assert registry.get_round_participants() == participants[:2]
+
+
+def test_round_counters_start_with_the_status_of_participants():
+    registry = ClientRegistry()
+    training_clients = register_clients(registry, 2)
+    registry.set_status(training_clients[0], ClientTrainingStatus.TRAINING_REQUEST_ERROR)
+
+    registry.start_round(training_clients)
+
+    assert registry.count_round_participants(ClientTrainingStatus.IDLE) == 1
+    assert registry.count_round_participants(ClientTrainingStatus.TRAINING_REQUEST_ERROR) == 1
+
+
+def test_clients_without_heartbeats_are_evicted(clock):
+    registry = ClientRegistry(heartbeat_ttl=30)
+    training_clients = register_clients(registry, 3)
+
+    clock.now += 20
+    assert registry.heartbeat(training_clients[0].client_url)
+    clock.now += 15
+
+    evicted_clients = registry.evict_expired_clients()
+
+    assert evicted_clients == training_clients[1:]
+    assert len(registry) == 1
+    assert registry.count(ClientTrainingStatus.IDLE) == 1
+    assert not registry.heartbeat(training_clients[1].client_url)
+    clock.now += 14
+    assert registry.evict_expired_clients() == []
+    clock.now += 2
+    assert registry.evict_expired_clients() == training_clients[:1]
+
+
+def test_clients_are_not_evicted_without_ttl(clock):
+    registry = ClientRegistry()
+    register_clients(registry, 2)
+
+    clock.now += 10 ** 6
+
+    assert registry.evict_expired_clients() == []
+    assert len(registry) == 2
@@ -0,0 +1,55 @@
+import pytest
+
+from client.gossip_engine import GossipEngine
+
+
+def create_clients(client_ids):
+    return [{'client_id': client_id, 'client_url': 'http://client:' + str(5000 + client_id)} for client_id in client_ids]
+
+
+def get_graph(gossip_engine, round, clients):
+    return {client['client_id']: {peer['client_id'] for peer in gossip_engine.select_peers(client['client_id'], round, clients)}
+            for client in clients}
+
+
+@pytest.mark.parametrize('topology', ['ring', 'k-regular'])
+@pytest.mark.parametrize('fan_out', [1, 2, 3, 4, 5])
+@pytest.mark.parametrize('clients_count', range(2, 12))
+def test_peers_are_symmetric_and_regular(topology, fan_out, clients_count):
+    gossip_engine = GossipEngine(fan_out, topology)
+    # Client ids with gaps, like after clients are unregistered
+    clients = create_clients([client_id * 3 + 1 for client_id in range(clients_count)])
+
+    for round in range(1, 4):
+        graph = get_graph(gossip_engine, round, clients)
+
+        for client_id, peer_ids in graph.items():
+            assert client_id not in peer_ids
+            assert all(client_id in graph[peer_id] for peer_id in peer_ids)
+        expected_degree = min(fan_out, clients_count - 1)
+        if expected_degree % 2 == 1 and clients_count % 2 == 1:
+            expected_degree -= 1
+        assert {len(peer_ids) for peer_ids in graph.values()} == {expected_degree}
+
+
+def test_k_regular_peers_change_every_round():
+    gossip_engine = GossipEngine(2, 'k-regular')
+    clients = create_clients(range(1, 21))
+
+    assert get_graph(gossip_engine, 1, clients) != get_graph(gossip_engine, 2, clients)
+    assert get_graph(gossip_engine, 1, clients) == get_graph(gossip_engine, 1, list(reversed(clients)))
+
+
+def test_random_peers():
+    gossip_engine = GossipEngine(3, 'random')
+    clients = create_clients(range(1, 11))
+
+    peers = gossip_engine.select_peers(1, 1, clients)
+
+    assert len(peers) == 3
+    assert all(peer['client_id'] != 1 for peer in peers)
+
+
+def test_unsupported_topology():
+    with pytest.raises(ValueError):
+        GossipEngine(2, 'star')
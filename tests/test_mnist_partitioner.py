@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from client.mnist_dataset_cache import DIGITS, SPLITS
+from client.mnist_partitioner import MnistPartitioner
+from server.server import Server
+from server.training_type import TrainingType
+
+
+# Sizes of every split and digit of MNIST_SAMPLE, without the images
+class FakeDatasetCache:
+    def __init__(self, sizes):
+        self.sizes = sizes
+
+    def size(self, split, digit):
+        return self.sizes[split + '/' + digit]
+
+
+def create_dataset_cache():
+    return FakeDatasetCache({'train/3': 260, 'train/7': 250, 'valid/3': 52, 'valid/7': 50})
+
+
+def get_shard_indices(partitioner, shard):
+    return {split + '/' + digit: set(partitioner.get_indices(split, digit, shard).tolist())
+            for split in SPLITS for digit in DIGITS}
+
+
+@pytest.mark.parametrize('strategy', ['sequential', 'iid', 'dirichlet'])
+def test_shards_are_disjoint_and_cover_the_dataset(strategy):
+    dataset_cache = create_dataset_cache()
+    partitioner = MnistPartitioner(dataset_cache, strategy, shard_size=25, alpha=0.5, seed=1)
+
+    assert partitioner.shards_count == 10
+    for split in SPLITS:
+        for digit in DIGITS:
+            indices = np.concatenate([partitioner.get_indices(split, digit, shard)
+                                      for shard in range(partitioner.shards_count)])
+            assert sorted(indices.tolist()) == list(range(dataset_cache.size(split, digit)))
+
+
+def test_partition_only_depends_on_the_seed():
+    first_partitioner = MnistPartitioner(create_dataset_cache(), 'iid', shard_size=25, seed=3)
+    second_partitioner = MnistPartitioner(create_dataset_cache(), 'iid', shard_size=25, seed=3)
+
+    for shard in range(first_partitioner.shards_count):
+        assert get_shard_indices(first_partitioner, shard) == get_shard_indices(second_partitioner, shard)
+
+
+def test_every_round_uses_the_next_shards():
+    partitioner = MnistPartitioner(create_dataset_cache(), shard_size=25)
+
+    assert [partitioner.get_shard(rank, 1, 3) for rank in range(3)] == [0, 1, 2]
+    assert [partitioner.get_shard(rank, 2, 3) for rank in range(3)] == [3, 4, 5]
+    assert [partitioner.get_shard(rank, 4, 3) for rank in range(3)] == [9, 0, 1]
+
+
+def test_shards_of_a_round_are_disjoint_after_a_client_is_unregistered():
+    server = Server()
+    for port in range(5001, 5006):
+        server.register_client('http://client:' + str(port))
+    server.unregister_client('http://client:5002')
+    partitioner = MnistPartitioner(create_dataset_cache(), shard_size=25)
+
+    round_metrics, training_requests = server._Server__start_round(TrainingType.DETERMINISTIC_MNIST)
+
+    assert round_metrics is not None
+    request_bodies = [request_body for _, request_body in training_requests]
+    assert sorted(request_body['client_id'] for request_body in request_bodies) == [1, 3, 4, 5]
+    assert sorted(request_body['client_rank'] for request_body in request_bodies) == [0, 1, 2, 3]
+    assert all(request_body['round_size'] == 4 for request_body in request_bodies)
+    shards = [partitioner.get_shard(request_body['client_rank'], request_body['round'], request_body['round_size'])
+              for request_body in request_bodies]
+    assert len(set(shards)) == len(shards)
+    shard_indices = [get_shard_indices(partitioner, shard) for shard in shards]
+    for key in shard_indices[0]:
+        all_indices = [indices[key] for indices in shard_indices]
+        assert len(set.union(*all_indices)) == sum(len(indices) for indices in all_indices)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from server.model_params_accumulator import ModelParamsAccumulator
+
+
+def test_weighted_mean():
+    accumulator = ModelParamsAccumulator()
+    first_params = np.array([1., 2., 3.], dtype=np.float32)
+    second_params = np.array([4., 5., 6.], dtype=np.float32)
+    third_params = np.array([-2., 0., 10.], dtype=np.float32)
+
+    accumulator.add(first_params, 10.)
+    accumulator.add(second_params, 30.)
+    accumulator.add(third_params)
+
+    assert accumulator.updates_count == 3
+    assert accumulator.total_weight == 41.
+    expected_average = (10. * first_params + 30. * second_params + third_params) / 41.
+    np.testing.assert_allclose(accumulator.average(), expected_average, rtol=1e-6)
+
+
+def test_uploads_are_not_modified():
+    accumulator = ModelParamsAccumulator()
+    params = np.array([1., 2.], dtype=np.float32)
+
+    accumulator.add(params, 3.)
+    accumulator.add(params, 2.)
+
+    np.testing.assert_array_equal(params, [1., 2.])
+    assert not np.shares_memory(accumulator.average(), params)
+
+
+def test_weighted_params_buffer_is_reused():
+    accumulator = ModelParamsAccumulator()
+    accumulator.add(np.ones(4, dtype=np.float32), 2.)
+    weighted_params = accumulator.weighted_params
+
+    accumulator.add(np.ones(4, dtype=np.float32), 3.)
+
+    assert accumulator.weighted_params is weighted_params
+    np.testing.assert_array_equal(accumulator.average(), np.ones(4))
+
+
+def test_is_empty():
+    accumulator = ModelParamsAccumulator()
+    assert accumulator.is_empty()
+
+    accumulator.add(np.zeros(2, dtype=np.float32))
+
+    assert not accumulator.is_empty()
+
+
+def test_params_of_a_different_model_are_rejected():
+    accumulator = ModelParamsAccumulator()
+    accumulator.add(np.zeros(3, dtype=np.float32))
+
+    with pytest.raises(ValueError):
+        accumulator.add(np.zeros(4, dtype=np.float32))
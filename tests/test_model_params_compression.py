@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from client.compression_config import CompressionConfig
+from client.model_params_compression import compress
+from server.model_params_compression import decompress, get_compressed_nbytes, get_uncompressed_nbytes
+from server.tensor_codec import decode, encode
+
+
+def create_arrays(seed=0):
+    random_generator = np.random.default_rng(seed)
+    return [random_generator.standard_normal((20, 5)).astype(np.float32),
+            random_generator.standard_normal((7,)).astype(np.float32)]
+
+
+# Model params are compressed by the clients and decompressed by the central node after a binary round trip
+def send(fields):
+    return decode(encode(fields))
+
+
+def test_without_compression_params_are_sent_as_they_are():
+    arrays = create_arrays()
+
+    fields, _ = compress(arrays, CompressionConfig())
+
+    for decompressed_array, array in zip(decompress(send(fields)), arrays):
+        np.testing.assert_array_equal(decompressed_array, array)
+
+
+def test_delta():
+    base_arrays = create_arrays(0)
+    arrays = create_arrays(1)
+
+    fields, _ = compress(arrays, CompressionConfig(delta=True), base_arrays)
+
+    np.testing.assert_allclose(fields['values'][0], (arrays[0] - base_arrays[0]).reshape(-1))
+    for decompressed_array, array in zip(decompress(send(fields), base_arrays), arrays):
+        np.testing.assert_allclose(decompressed_array, array, rtol=1e-6, atol=1e-6)
+
+
+def test_delta_without_base_arrays_sends_params():
+    arrays = create_arrays()
+
+    fields, _ = compress(arrays, CompressionConfig(delta=True, top_k=0.1))
+
+    assert not fields['compression']['delta']
+    assert fields['compression']['top_k'] is None
+    for decompressed_array, array in zip(decompress(send(fields)), arrays):
+        np.testing.assert_array_equal(decompressed_array, array)
+
+
+def test_delta_needs_base_arrays_to_decompress():
+    fields, _ = compress(create_arrays(1), CompressionConfig(delta=True), create_arrays(0))
+
+    with pytest.raises(ValueError):
+        decompress(send(fields))
+
+
+def test_top_k_sends_largest_values():
+    base_arrays = [np.zeros_like(array) for array in create_arrays()]
+    arrays = create_arrays()
+
+    fields, _ = compress(arrays, CompressionConfig(delta=True, top_k=0.1), base_arrays)
+
+    assert [len(values) for values in fields['values']] == [10, 1]
+    assert get_compressed_nbytes(fields) == 11 * 4 + 11 * 4
+    assert get_uncompressed_nbytes(fields) == 107 * 4
+    decompressed_arrays = decompress(send(fields), base_arrays)
+    for decompressed_array, array, k in zip(decompressed_arrays, arrays, [10, 1]):
+        flat_array = array.reshape(-1)
+        largest_indices = np.argsort(np.abs(flat_array))[-k:]
+        expected_array = np.zeros_like(flat_array)
+        expected_array[largest_indices] = flat_array[largest_indices]
+        np.testing.assert_array_equal(decompressed_array.reshape(-1), expected_array)
+
+
+def test_top_k_needs_delta():
+    with pytest.raises(ValueError):
+        CompressionConfig(top_k=0.1)
+
+
+def test_float16():
+    arrays = create_arrays()
+
+    fields, _ = compress(arrays, CompressionConfig(quantization='float16'))
+
+    assert fields['values'][0].dtype == np.float16
+    for decompressed_array, array in zip(decompress(send(fields)), arrays):
+        assert decompressed_array.dtype == np.float32
+        np.testing.assert_allclose(decompressed_array, array, rtol=1e-3, atol=1e-3)
+
+
+def test_int8():
+    arrays = create_arrays()
+
+    fields, _ = compress(arrays, CompressionConfig(quantization='int8'))
+
+    assert fields['values'][0].dtype == np.int8
+    for decompressed_array, array, scale in zip(decompress(send(fields)), arrays, fields['scales']):
+        assert scale == pytest.approx(np.abs(array).max() / 127)
+        # Rounding error is at most half a step of the scale
+        assert np.abs(decompressed_array - array).max() <= scale / 2 + 1e-6
+
+
+def test_int8_of_zeros():
+    arrays = [np.zeros(4, dtype=np.float32)]
+
+    fields, _ = compress(arrays, CompressionConfig(quantization='int8'))
+
+    assert fields['scales'] == [1.]
+    np.testing.assert_array_equal(decompress(send(fields))[0], arrays[0])
+
+
+def test_unsupported_quantization():
+    with pytest.raises(ValueError):
+        CompressionConfig(quantization='int4')
+
+
+def test_error_feedback_keeps_what_was_not_sent():
+    compression_config = CompressionConfig(delta=True, top_k=0.2, quantization='int8')
+    base_arrays = [np.zeros_like(array) for array in create_arrays()]
+    residuals = [np.zeros_like(array) for array in create_arrays()]
+    sent_sum = [np.zeros_like(array) for array in create_arrays()]
+    deltas_sum = [np.zeros_like(array) for array in create_arrays()]
+
+    for seed in range(5):
+        arrays = create_arrays(seed)
+        fields, residuals = compress(arrays, compression_config, base_arrays, residuals)
+        for i, decompressed_array in enumerate(decompress(send(fields), base_arrays)):
+            sent_sum[i] += decompressed_array
+            deltas_sum[i] += arrays[i]
+
+    # Every value left out or rounded is sent in a later round, or is still in the residuals
+    for sent_array, residual, deltas_array in zip(sent_sum, residuals, deltas_sum):
+        np.testing.assert_allclose(sent_array + residual, deltas_array, rtol=1e-5, atol=1e-5)
+
+
+def test_residuals_are_kept_without_base_arrays():
+    residuals = [np.ones_like(array) for array in create_arrays()]
+
+    _, new_residuals = compress(create_arrays(), CompressionConfig(delta=True, top_k=0.1), None, residuals)
+
+    assert new_residuals is residuals
+
+
+def test_compression_config_round_trip():
+    compression_config = CompressionConfig(delta=True, top_k=0.05, quantization='float16')
+
+    assert CompressionConfig.from_dict(compression_config.to_dict()).to_dict() == compression_config.to_dict()
+    assert compression_config.is_enabled()
+    assert not CompressionConfig().is_enabled()
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+import client.model_specs
+from server.federated_learning_config import FederatedLearningConfig
+from server.model_spec import ModelSpec
+from server.model_specs import CHEST_X_RAY_SPEC, MNIST_SPEC, get_model_name, get_model_spec
+from server.tensor_codec import decode, encode
+from server.training_type import TrainingType
+
+SPEC = ModelSpec('test', [(2, 3), (4,), (5,), (1, 2)], ['weights', 'layers', 'layers', 'bias'], FederatedLearningConfig(1., 1, 1))
+
+
+def create_arrays(model_spec):
+    return [np.arange(int(np.prod(shape)), dtype=np.float32).reshape(shape) + i
+            for i, shape in enumerate(model_spec.param_shapes)]
+
+
+def test_layout():
+    assert SPEC.param_offsets == [0, 6, 10, 15]
+    assert SPEC.size == 17
+    assert MNIST_SPEC.size == 28 * 28 + 1
+    assert get_model_spec(TrainingType.DETERMINISTIC_MNIST) is MNIST_SPEC
+    assert get_model_name(TrainingType.CHEST_X_RAY_PNEUMONIA) == 'chest_x_ray'
+    with pytest.raises(ValueError):
+        get_model_spec('UNKNOWN')
+    with pytest.raises(ValueError):
+        ModelSpec('test', [(1,)], [], None)
+
+
+def test_views_share_the_flat_buffer():
+    buffer = SPEC.create_buffer()
+
+    views = SPEC.get_views(buffer)
+
+    assert [view.shape for view in views] == SPEC.param_shapes
+    views[1][...] = 7.
+    np.testing.assert_array_equal(buffer[6:10], 7.)
+    assert all(np.shares_memory(view, buffer) for view in views)
+
+
+def test_to_flat_buffer_copies_separate_arrays():
+    arrays = create_arrays(SPEC)
+
+    buffer = SPEC.to_flat_buffer(arrays)
+
+    assert buffer.shape == (SPEC.size,)
+    assert buffer.dtype == np.float32
+    assert not any(np.shares_memory(buffer, array) for array in arrays)
+    np.testing.assert_array_equal(buffer, np.concatenate([array.reshape(-1) for array in arrays]))
+
+
+def test_to_flat_buffer_converts_lists_and_other_dtypes():
+    arrays = [array.astype(np.float64).tolist() for array in create_arrays(SPEC)]
+
+    buffer = SPEC.to_flat_buffer(arrays)
+
+    assert buffer.dtype == np.float32
+    np.testing.assert_array_equal(SPEC.get_views(buffer)[3], [[3., 4.]])
+
+
+def test_to_flat_buffer_of_views_is_zero_copy():
+    buffer = SPEC.to_flat_buffer(create_arrays(SPEC))
+
+    assert np.shares_memory(SPEC.to_flat_buffer(SPEC.get_views(buffer)), buffer)
+    assert all(np.shares_memory(param, buffer) for param in SPEC.to_params(SPEC.get_views(buffer)))
+
+
+def test_to_flat_buffer_of_views_of_a_bigger_buffer_is_zero_copy():
+    memory = np.zeros(SPEC.size + 10, dtype=np.float32)
+    views = SPEC.get_views(memory[5:5 + SPEC.size])
+
+    buffer = SPEC.to_flat_buffer(views)
+
+    assert np.shares_memory(buffer, memory)
+    assert buffer.shape == (SPEC.size,)
+
+
+def test_to_flat_buffer_of_views_that_are_not_together_is_copied():
+    buffer = SPEC.to_flat_buffer(create_arrays(SPEC))
+    views = SPEC.get_views(buffer)
+    views[2] = views[2].copy()
+
+    new_buffer = SPEC.to_flat_buffer(views)
+
+    assert not np.shares_memory(new_buffer, buffer)
+    np.testing.assert_array_equal(new_buffer, buffer)
+
+
+def test_to_flat_buffer_of_binary_payload_is_zero_copy():
+    arrays = create_arrays(MNIST_SPEC)
+    payload = bytearray(encode(dict(MNIST_SPEC.to_request_params(arrays), client_url='http://client:5001')))
+
+    buffer = MNIST_SPEC.to_flat_buffer(MNIST_SPEC.to_arrays(decode(payload)))
+
+    assert np.shares_memory(buffer, np.frombuffer(payload, dtype=np.uint8))
+    np.testing.assert_array_equal(MNIST_SPEC.get_views(buffer)[0], arrays[0])
+
+
+def test_to_flat_buffer_rejects_unexpected_shapes():
+    arrays = create_arrays(SPEC)
+
+    with pytest.raises(ValueError):
+        SPEC.to_flat_buffer(arrays[:3])
+    with pytest.raises(ValueError):
+        SPEC.to_flat_buffer(arrays[:3] + [arrays[3].reshape(2, 1)])
+
+
+def test_request_params():
+    arrays = create_arrays(SPEC)
+
+    request_params = SPEC.to_request_params(arrays)
+
+    assert list(request_params) == ['weights', 'layers', 'bias']
+    assert len(request_params['layers']) == 2
+    assert SPEC.has_request_params(request_params)
+    assert not SPEC.has_request_params({'weights': arrays[0]})
+    assert all(array is request_array for array, request_array in zip(arrays, SPEC.to_arrays(request_params)))
+
+
+def test_init_params():
+    params = MNIST_SPEC.init_params()
+
+    assert [param.shape for param in params] == MNIST_SPEC.param_shapes
+    assert np.shares_memory(MNIST_SPEC.to_flat_buffer(params), params[0])
+    assert CHEST_X_RAY_SPEC.init_params() is None
+
+
+def test_client_specs_match_the_central_node():
+    for training_type, model_spec in client.model_specs.MODEL_SPECS.items():
+        assert model_spec.param_shapes == get_model_spec(training_type).param_shapes
+        assert model_spec.param_keys == get_model_spec(training_type).param_keys
@@ -0,0 +1,125 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+import client.tensor_codec
+import server.tensor_codec
+
+# The client and the central node have their own copy of the codec
+CODECS = [client.tensor_codec, server.tensor_codec]
+
+
+def create_fields():
+    return {
+        'weights': np.arange(28 * 28, dtype=np.float32).reshape(28 * 28, 1),
+        'bias': np.array([0.5], dtype=np.float32),
+        'layers': [np.ones((3, 3), dtype=np.float32), np.zeros((2,), dtype=np.float64), np.arange(5, dtype=np.int8)],
+        'empty': np.empty((0, 4), dtype=np.float32),
+        'client_url': 'http://client:5001',
+        'round': 3,
+        'compression': {'delta': True, 'top_k': 0.1},
+    }
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_round_trip(codec):
+    fields = create_fields()
+
+    decoded_fields = codec.decode(codec.encode(fields))
+
+    assert decoded_fields.keys() == fields.keys()
+    for key in ['weights', 'bias', 'empty']:
+        assert decoded_fields[key].dtype == fields[key].dtype
+        np.testing.assert_array_equal(decoded_fields[key], fields[key])
+    assert len(decoded_fields['layers']) == 3
+    for decoded_array, array in zip(decoded_fields['layers'], fields['layers']):
+        assert decoded_array.dtype == array.dtype
+        np.testing.assert_array_equal(decoded_array, array)
+    assert decoded_fields['client_url'] == 'http://client:5001'
+    assert decoded_fields['round'] == 3
+    assert decoded_fields['compression'] == {'delta': True, 'top_k': 0.1}
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_tensors_are_aligned_and_decoded_without_copying(codec):
+    payload = bytearray(codec.encode(create_fields()))
+    header, data_offset = codec.read_header(payload)
+
+    assert data_offset % codec.ALIGNMENT == 0
+    assert all(tensor['offset'] % codec.ALIGNMENT == 0 for tensor in header['tensors'])
+    decoded_fields = codec.decode(payload)
+    assert np.shares_memory(decoded_fields['weights'], np.frombuffer(payload, dtype=np.uint8))
+    # Tensors of a writable buffer can be updated in place
+    decoded_fields['weights'][0] = -1.
+    assert codec.decode(payload)['weights'][0] == -1.
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_big_endian_tensors_are_sent_as_little_endian(codec):
+    array = np.arange(4, dtype='>f4')
+
+    decoded_array = codec.decode(codec.encode({'weights': array}))['weights']
+
+    assert decoded_array.dtype == np.dtype('<f4')
+    np.testing.assert_array_equal(decoded_array, array)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_bad_magic(codec):
+    payload = bytearray(codec.encode(create_fields()))
+    payload[:4] = b'NOPE'
+
+    with pytest.raises(ValueError):
+        codec.decode(payload)
+    with pytest.raises(ValueError):
+        codec.read_header(payload)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+@pytest.mark.parametrize('size', [0, 3, 8, 20])
+def test_truncated_header(codec, size):
+    payload = codec.encode(create_fields())
+
+    with pytest.raises(ValueError):
+        codec.decode(payload[:size])
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_read_header_of_incomplete_payload(codec):
+    payload = codec.encode(create_fields())
+    header, data_offset = codec.read_header(payload)
+
+    assert codec.read_header(payload[:4]) == (None, codec.PREFIX.size)
+    assert codec.read_header(payload[:codec.PREFIX.size + 1]) == (None, data_offset)
+    assert codec.read_header(payload[:data_offset]) == (header, data_offset)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_truncated_tensors(codec):
+    payload = codec.encode(create_fields())
+
+    with pytest.raises(ValueError):
+        codec.decode(payload[:-1])
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_read_into_buffer(codec):
+    payload = codec.encode(create_fields())
+
+    buffer = codec.read_into_buffer(io.BytesIO(payload), len(payload))
+
+    assert isinstance(buffer, bytearray)
+    assert buffer == payload
+    with pytest.raises(ValueError):
+        codec.read_into_buffer(io.BytesIO(payload[:10]), len(payload))
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_to_json_params(codec):
+    json_params = codec.to_json_params(create_fields())
+
+    assert json.loads(json.dumps(json_params))['bias'] == [0.5]
+    assert json_params['layers'][0] == [[1., 1., 1.]] * 3
+    assert json_params['round'] == 3